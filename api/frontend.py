@@ -1,8 +1,417 @@
-# This file is a placeholder for your Python serverless function.
-# Move your logic from frontend.py here, or import it.
+"""Serverless gateway in front of the Grasper analysis backend.
 
-def handler(request):
+Accepts the multipart payload ``make_multipart_files`` builds, answers
+repeated analyses from a cache keyed by the payload's content, and forwards
+everything else to the backend on a pooled keep-alive session, streaming
+the upstream response back as it arrives. Other ``/api/*`` routes (job
+polling, blob lookups, API keys) are passed through uncached, and
+``GET /metrics`` reports request, cache and upstream latency metrics in
+Prometheus text format.
+
+Deployed as a Vercel Python function (``handler``); run it locally with
+
+    python api/frontend.py            # listens on $PORT (default 8000)
+"""
+
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+import requests  # noqa: E402
+
+from grasper_client import (  # noqa: E402
+    API_BASE_URL,
+    METRICS,
+    ResultCache,
+    get_http_session,
+    iter_json,
+    normalize_questions,
+)
+
+UPSTREAM_URL = os.getenv("GRASPER_UPSTREAM_URL", API_BASE_URL).rstrip("/")
+GATEWAY_TIMEOUT = int(os.getenv("GRASPER_GATEWAY_TIMEOUT", "300"))
+# Request bodies above this are refused; below SPOOL_BYTES they stay in memory
+GATEWAY_MAX_BODY = int(os.getenv("GRASPER_GATEWAY_MAX_BODY", str(200 * 1024 * 1024)))
+GATEWAY_SPOOL_BYTES = int(os.getenv("GRASPER_GATEWAY_SPOOL_BYTES", str(8 * 1024 * 1024)))
+GATEWAY_CHUNK_SIZE = 256 * 1024
+# Only these routes are answered from the cache
+CACHED_ROUTES = ("/api/analyze_data",)
+# Request headers that change what the backend returns, so they are part of the key
+KEYED_HEADERS = ("X-Table-Format",)
+
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "transfer-encoding", "upgrade",
+    # Bodies are re-framed on each side of the proxy
+    "content-length", "content-encoding", "host", "accept-encoding",
+}
+
+_PARAM_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+# Module state survives between invocations of a warm function instance
+_cache = ResultCache(disk_dir=os.getenv("GRASPER_RESULT_CACHE_DIR", ""))
+
+GATEWAY_REQUESTS = METRICS.counter(
+    "grasper_gateway_requests_total",
+    "Requests answered by the gateway, by route, status and cache result.",
+    ("route", "status", "cache"),
+)
+GATEWAY_UPSTREAM_LATENCY = METRICS.histogram(
+    "grasper_gateway_upstream_seconds",
+    "Time from forwarding a request to the end of the upstream response.",
+    ("route",),
+)
+GATEWAY_BODY_BYTES = METRICS.histogram(
+    "grasper_gateway_request_bytes",
+    "Request body sizes accepted by the gateway.",
+    buckets=(1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9),
+)
+
+
+class SpooledBody:
+    """Request body copied into memory, or a temp file once it is large.
+
+    Has ``len()``, ``read`` and ``seek(0)`` so requests sends it with a
+    Content-Length and urllib3 can rewind it on a retried connection.
+    """
+
+    def __init__(self, source, length: int):
+        self._file = tempfile.SpooledTemporaryFile(max_size=GATEWAY_SPOOL_BYTES)
+        remaining = length
+        while remaining > 0:
+            chunk = source.read(min(GATEWAY_CHUNK_SIZE, remaining))
+            if not chunk:
+                raise ValueError("request body ended early")
+            self._file.write(chunk)
+            remaining -= len(chunk)
+        self.length = length
+        self._file.seek(0)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def read(self, size: int = -1) -> bytes:
+        return self._file.read(size)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self._file.seek(offset, whence)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def _parse_part_headers(raw: bytes) -> Dict[str, Any]:
+    headers = {}
+    for line in raw.decode("utf-8", errors="replace").split("\r\n"):
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    params = dict(_PARAM_RE.findall(headers.get("content-disposition", "")))
     return {
-        "statusCode": 200,
-        "body": "Hello from Vercel Python!"
+        "name": params.get("name", ""),
+        "filename": params.get("filename", ""),
+        "encoding": headers.get("content-encoding", ""),
     }
+
+
+def scan_multipart(
+    body, boundary: bytes, capture: Tuple[str, ...] = ("questions.txt", "file_refs.json")
+) -> List[Dict[str, Any]]:
+    """Hash each part of a multipart body in one streaming pass.
+
+    Returns one dict per part with its field ``name``, ``filename``,
+    ``encoding``, ``sha256`` and ``size``; the parts named in ``capture``
+    also keep their bytes under ``data``. The body is rewound afterwards.
+    """
+    delimiter = b"\r\n--" + boundary
+    keep = len(delimiter) - 1
+    # Leading CRLF lets the opening boundary match the same delimiter
+    buf = b"\r\n"
+    eof = False
+
+    def fill() -> None:
+        nonlocal buf, eof
+        chunk = body.read(GATEWAY_CHUNK_SIZE)
+        eof = not chunk
+        buf += chunk
+
+    body.seek(0)
+    while True:
+        i = buf.find(delimiter)
+        if i >= 0:
+            buf = buf[i + len(delimiter):]
+            break
+        if eof:
+            raise ValueError("multipart boundary not found")
+        buf = buf[-keep:]
+        fill()
+
+    parts = []
+    while True:
+        while len(buf) < 2 and not eof:
+            fill()
+        if buf.startswith(b"--"):
+            break
+        while b"\r\n\r\n" not in buf:
+            if eof or len(buf) > 64 * 1024:
+                raise ValueError("malformed multipart part headers")
+            fill()
+        head, buf = buf.split(b"\r\n\r\n", 1)
+        part = _parse_part_headers(head)
+        digest = hashlib.sha256()
+        size = 0
+        captured = [] if part["name"] in capture else None
+        while True:
+            i = buf.find(delimiter)
+            done = i >= 0
+            if done:
+                data, buf = buf[:i], buf[i + len(delimiter):]
+            elif eof:
+                raise ValueError("multipart body is truncated")
+            elif len(buf) > keep:
+                data, buf = buf[:-keep], buf[-keep:]
+            else:
+                data = b""
+            digest.update(data)
+            size += len(data)
+            if captured is not None:
+                captured.append(data)
+            if done:
+                break
+            fill()
+        part.update(sha256=digest.hexdigest(), size=size)
+        if captured is not None:
+            part["data"] = b"".join(captured)
+        parts.append(part)
+    body.seek(0)
+    return parts
+
+
+def gateway_cache_key(parts: List[Dict[str, Any]], keyed_headers: Dict[str, str]) -> str:
+    """Key a request by normalized questions, file digests and format headers.
+
+    Files sent by reference in ``file_refs.json`` count by their declared
+    digest, so a deduplicated upload hits the same entry as a full one.
+    """
+    questions = b""
+    files: Dict[str, Tuple[str, str, str]] = {}
+    for part in parts:
+        if part["name"] == "questions.txt":
+            questions = part.get("data", b"")
+        elif part["name"] == "file_refs.json":
+            try:
+                refs = json.loads(part.get("data", b"{}"))
+            except ValueError:
+                refs = {}
+            for filename, ref in refs.items():
+                if isinstance(ref, dict) and not ref.get("uploaded", True):
+                    files.setdefault(filename, (filename, str(ref.get("sha256", "")), ""))
+        else:
+            files[part["name"]] = (part["filename"], part["sha256"], part["encoding"])
+
+    h = hashlib.sha256()
+    h.update(normalize_questions(questions.decode("utf-8", errors="ignore")).encode("utf-8"))
+    for name in sorted(files):
+        filename, digest, encoding = files[name]
+        h.update(b"\0" + filename.encode("utf-8") + b"\0" + encoding.encode("ascii") + b"\0")
+        h.update(digest.encode("ascii"))
+    for name, value in sorted(keyed_headers.items()):
+        h.update(f"\0{name.lower()}={value}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def _boundary(content_type: str) -> Optional[bytes]:
+    match = re.search(r'boundary="?([^";]+)"?', content_type or "")
+    return match.group(1).encode("latin-1") if match else None
+
+
+def _no_store(cache_control: Optional[str]) -> bool:
+    return "no-store" in (cache_control or "").lower()
+
+
+def is_cacheable_result(payload: Any) -> bool:
+    """Whether a 200 analyze body is a result worth caching.
+
+    Backends report some failures as 200 with an ``error`` field (at the top
+    level or in ``answers``); caching one would replay the failure to every
+    identical request.
+    """
+    if not isinstance(payload, dict):
+        return True
+    answers = payload.get("answers")
+    return not payload.get("error") and not (isinstance(answers, dict) and answers.get("error"))
+
+
+class handler(BaseHTTPRequestHandler):
+    """Vercel entry point; also served directly by ``ThreadingHTTPServer``."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        if self.path.split("?", 1)[0].rstrip("/") == "/metrics":
+            data = METRICS.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        self._proxy(None, None)
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > GATEWAY_MAX_BODY:
+            self._send_json(413, {"detail": "Request body too large"})
+            self._count(413, "none")
+            return
+        try:
+            body = SpooledBody(self.rfile, length)
+        except ValueError as e:
+            self._send_json(400, {"detail": str(e)})
+            self._count(400, "none")
+            return
+        GATEWAY_BODY_BYTES.observe(length)
+        try:
+            self._post(body)
+        finally:
+            body.close()
+
+    def _post(self, body: SpooledBody) -> None:
+        route = self.path.split("?", 1)[0].rstrip("/")
+        boundary = _boundary(self.headers.get("Content-Type", ""))
+        cache_key = None
+        if route in CACHED_ROUTES and boundary:
+            try:
+                parts = scan_multipart(body, boundary)
+            except ValueError as e:
+                self._send_json(400, {"detail": f"Invalid multipart body: {e}"})
+                self._count(400, "none")
+                return
+            keyed = {h: self.headers[h] for h in KEYED_HEADERS if self.headers.get(h)}
+            cache_key = gateway_cache_key(parts, keyed)
+            if "no-cache" not in self.headers.get("Cache-Control", ""):
+                cached = _cache.get(cache_key)
+                if cached is not None:
+                    self._send_result(cached, {"X-Cache": "HIT", "X-Cache-Key": cache_key})
+                    self._count(200, "hit")
+                    return
+        self._proxy(body, cache_key)
+
+    def _proxy(self, body: Optional[SpooledBody], cache_key: Optional[str]) -> None:
+        headers = {
+            k: v for k, v in self.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS
+        }
+        start = time.perf_counter()
+        try:
+            upstream = get_http_session().request(
+                self.command,
+                UPSTREAM_URL + self.path,
+                data=body,
+                headers=headers,
+                timeout=GATEWAY_TIMEOUT,
+                stream=True,
+            )
+        except requests.exceptions.Timeout:
+            self._send_json(504, {"detail": "Upstream timed out"})
+            self._count(504, "miss" if cache_key else "none")
+            return
+        except requests.exceptions.RequestException as e:
+            self._send_json(502, {"detail": f"Upstream unavailable: {type(e).__name__}"})
+            self._count(502, "miss" if cache_key else "none")
+            return
+
+        with upstream:
+            self.send_response(upstream.status_code)
+            for k, v in upstream.headers.items():
+                if k.lower() not in HOP_BY_HOP_HEADERS:
+                    self.send_header(k, v)
+            if cache_key:
+                self.send_header("X-Cache", "MISS")
+                self.send_header("X-Cache-Key", cache_key)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            # Tee the body into memory for the cache until it outgrows it
+            keep = (
+                cache_key is not None
+                and upstream.status_code == 200
+                and not _no_store(self.headers.get("Cache-Control"))
+                and not _no_store(upstream.headers.get("Cache-Control"))
+            )
+            kept, kept_bytes = [], 0
+            for chunk in upstream.iter_content(chunk_size=64 * 1024):
+                if not chunk:
+                    continue
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                if keep:
+                    kept.append(chunk)
+                    kept_bytes += len(chunk)
+                    keep = kept_bytes <= _cache.max_bytes
+            self.wfile.write(b"0\r\n\r\n")
+        GATEWAY_UPSTREAM_LATENCY.observe(time.perf_counter() - start, route=self._route())
+        self._count(upstream.status_code, "miss" if cache_key else "none")
+
+        if keep:
+            try:
+                payload = json.loads(b"".join(kept))
+            except ValueError:
+                return
+            if is_cacheable_result(payload):
+                _cache.put(cache_key, payload)
+
+    def _route(self) -> str:
+        # Label by route prefix only, so job and blob ids do not explode the series
+        route = self.path.split("?", 1)[0].rstrip("/")
+        return route if route in CACHED_ROUTES else "/".join(route.split("/")[:3]) or "/"
+
+    def _count(self, status: int, cache: str) -> None:
+        GATEWAY_REQUESTS.inc(route=self._route(), status=str(status), cache=cache)
+
+    def _send_result(self, result: Any, extra_headers: Dict[str, str]) -> None:
+        """Send a cached result with chunked encoding.
+
+        Results read back from the disk tier hold SpilledText; iter_json
+        streams those from their temp files instead of joining them.
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        for k, v in extra_headers.items():
+            self.send_header(k, v)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for text in iter_json(result):
+            data = text.encode("utf-8")
+            if data:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _send_json(
+        self, status: int, payload: Any, extra_headers: Optional[Dict[str, str]] = None
+    ) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (extra_headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+if __name__ == "__main__":
+    port = int(os.getenv("PORT", "8000"))
+    print(f"Grasper gateway on :{port} -> {UPSTREAM_URL}")
+    ThreadingHTTPServer(("0.0.0.0", port), handler).serve_forever()
@@ -0,0 +1,127 @@
+"""Latency under a burst of analyses, with and without admission control.
+
+Starts the local stub backend with ``--capacity`` (beyond that many running
+analyses, every analysis slows down) and has ``--sessions`` sessions fire
+``--burst`` analyses each at the same moment, the way a batch or a room of
+users clicking Start does. ``--probe-after`` seconds later one more session
+sends a single analysis. The burst runs twice: once with every request sent
+straight to the backend, as before admission control, and once through an
+AdmissionController built from the options below. Reports peak backend
+concurrency, end-to-end and backend-side latency (queue wait excluded),
+the late session's latency, and how many requests were shed or failed.
+
+    python benchmarks/admission_bench.py --sessions 8 --burst 6 --capacity 4 --max-in-flight 4
+"""
+
+import argparse
+import os
+import statistics
+import threading
+import time
+from typing import Dict, List
+
+from common import percentile
+from stub_backend import StubBackend, add_stub_arguments, stub_config
+
+
+def fire(client, session_id: str, index: int, timeout: int, out: List[Dict]) -> None:
+    """One analysis; records total time and the time spent queued."""
+    import requests
+
+    files = client.make_multipart_files([], f"Summarize sales, request {index}", False)
+    sample = {"session": session_id, "shed": False}
+    start = time.perf_counter()
+
+    def on_progress(status=None, **_) -> None:
+        if status and status != "queued" and "admitted" not in sample:
+            sample["admitted"] = time.perf_counter() - start
+
+    try:
+        client.analyze(files, timeout, on_progress=on_progress, session_id=session_id)
+    except client.AdmissionRejected:
+        sample["shed"] = True
+    except (client.AnalysisError, requests.exceptions.RequestException) as e:
+        sample["error"] = str(e)
+    sample["total"] = time.perf_counter() - start
+    out.append(sample)
+
+
+def run_burst(client, args: argparse.Namespace) -> Dict:
+    backend = StubBackend(stub_config(args)).start()
+    client.API_BASE_URL = backend.url
+    samples: List[Dict] = []
+    threads = [
+        threading.Thread(target=fire, args=(client, f"burst-{s}", s * args.burst + i,
+                                            args.timeout, samples))
+        for s in range(args.sessions) for i in range(args.burst)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.probe_after)
+    probe: List[Dict] = []
+    fire(client, "late", -1, args.timeout, probe)
+    for thread in threads:
+        thread.join()
+    peak = backend.stats.snapshot()["peak_in_flight"]
+    backend.stop()
+    return {"samples": samples, "probe": probe[0], "peak": peak}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=8, help="sessions in the burst")
+    parser.add_argument("--burst", type=int, default=6, help="analyses per session")
+    parser.add_argument("--probe-after", type=float, default=0.5,
+                        help="seconds before the late session sends its analysis")
+    parser.add_argument("--timeout", type=int, default=300)
+    parser.add_argument("--max-in-flight", type=int, default=4)
+    parser.add_argument("--max-queued", type=int, default=64)
+    parser.add_argument("--session-max-queued", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=1.0, help="per-client requests/s")
+    parser.add_argument("--client-burst", type=int, default=10)
+    parser.add_argument("--queue-timeout", type=float, default=60)
+    add_stub_arguments(parser)
+    parser.set_defaults(latency=1.0, capacity=4, rows=50, images=0)
+    args = parser.parse_args()
+
+    # Uploads are a few bytes here; keep blob checks out of the timings
+    os.environ["GRASPER_UPLOAD_DEDUPE"] = "0"
+    import grasper_client as client
+
+    modes = {
+        "unlimited": client.AdmissionController(
+            max_in_flight=0, max_queued=10 ** 6, session_max_queued=10 ** 6, rate=0,
+            queue_timeout=float("inf")),
+        "admission": client.AdmissionController(
+            max_in_flight=args.max_in_flight, max_queued=args.max_queued,
+            session_max_queued=args.session_max_queued, rate=args.rate,
+            burst=args.client_burst, queue_timeout=args.queue_timeout),
+    }
+    print(f"{args.sessions} sessions x {args.burst} analyses at once, then 1 more after "
+          f"{args.probe_after:g}s; backend {args.latency:g}s per analysis, "
+          f"capacity {args.capacity or 'unlimited'}")
+    print(f"{'mode':>10} {'ok':>4} {'shed':>5} {'failed':>7} {'peak':>5} {'e2e p50':>8} {'p95':>7} "
+          f"{'backend p50':>12} {'p95':>7} {'late session':>13}")
+    errors = []
+    for mode, controller in modes.items():
+        client.ADMISSION = controller
+        run = run_burst(client, args)
+        done = [s for s in run["samples"] if not s["shed"] and "error" not in s]
+        failed = [s["error"] for s in run["samples"] if "error" in s]
+        errors.extend(failed)
+        totals = [s["total"] for s in done]
+        backend = [s["total"] - s.get("admitted", 0.0) for s in done]
+        probe = run["probe"]
+        late = "shed" if probe["shed"] else "failed" if "error" in probe else f"{probe['total']:.2f}s"
+        print(
+            f"{mode:>10} {len(done):>4} {len(run['samples']) - len(done) - len(failed):>5} "
+            f"{len(failed):>7} {run['peak']:>5} "
+            f"{statistics.median(totals):>8.2f} {percentile(totals, 95):>7.2f} "
+            f"{statistics.median(backend):>12.2f} {percentile(backend, 95):>7.2f} {late:>13}"
+        )
+    if errors:
+        print(f"{len(errors)} failed requests, first: {errors[0]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Shared helpers for the benchmark scripts."""
+
+import logging
+import math
+import os
+import sys
+from functools import partial
+from typing import List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+def silence_streamlit() -> None:
+    """Mute the bare-mode warning every st.* call logs outside `streamlit run`."""
+    logging.disable(logging.WARNING)
+
+
+def load_frontend():
+    """Import frontend.py in Streamlit bare mode, silencing its warnings."""
+    silence_streamlit()
+    import frontend
+
+    return frontend
+
+
+def load_client():
+    """Import grasper_client from the repo root."""
+    import grasper_client
+
+    return grasper_client
+
+
+def make_csv(rows: int, seed: int) -> bytes:
+    """A sales-like CSV upload; ``seed`` varies the values between sessions."""
+    lines = ["id,city,date,amount,quantity"]
+    for i in range(rows):
+        lines.append(
+            f"{i},city-{(i * 7 + seed) % 23},2024-{i % 12 + 1:02d}-{i % 28 + 1:02d},"
+            f"{(i * 37 + seed) % 1000 / 10:.2f},{i % 9 + 1}"
+        )
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def run_app(at, fragment: Optional[str] = None):
+    """Rerun an AppTest the way the browser would after an interaction.
+
+    With ``fragment``, only the ``@st.fragment(key=fragment)`` section reruns,
+    as when one of its widgets changes. AppTest keeps only the elements of
+    the latest run; here elements of sections that did not run (also after a
+    callback's ``st.rerun([...])``) are carried over from the previous run like
+    the browser does, or the next run would reset their widgets. The
+    compiled script is kept between runs, as a server does, instead of
+    recompiled each time. Sets ``at.last_run_bytes`` to the element protos
+    this run sent.
+    """
+    import streamlit.testing.v1.app_test as app_test
+    import streamlit.testing.v1.local_script_runner as lsr
+
+    queue = []
+    if fragment is not None:
+        queue = list(at._fragment_storage._ids_by_target_key.get(fragment, ()))
+        if not queue:
+            raise KeyError(f"no fragment keyed {fragment!r}")
+    previous = getattr(at, "_messages", [])
+    parents = at._fragment_storage._parent_by_id
+    original_run, original_rerun_data = lsr.LocalScriptRunner.run, lsr.RerunData
+    original_cache = lsr.ScriptCache
+    if not hasattr(at, "_script_cache"):
+        at._script_cache = original_cache()
+
+    def reran(fragment_id: str, ran: set) -> bool:
+        while fragment_id:
+            if fragment_id in ran:
+                return True
+            fragment_id = parents.get(fragment_id)
+        return False
+
+    def run(runner, *args, **kwargs):
+        original_run(runner, *args, **kwargs)
+        started = [
+            data for event, data in zip(runner.events, runner.event_data)
+            if event == lsr.ScriptRunnerEvent.SCRIPT_STARTED
+        ]
+        ran = set(started[-1].get("fragment_ids_this_run") or ()) if started else set()
+        sent = [m for m in runner.forward_msgs() if m.HasField("delta")]
+        messages = sent
+        if ran:
+            messages = [
+                m for m in previous if not reran(m.delta.fragment_id, ran)
+            ] + sent
+        at._messages = messages
+        at.last_run_bytes = sum(m.ByteSize() for m in sent)
+        return lsr.parse_tree_from_messages(messages)
+
+    lsr.LocalScriptRunner.run = run
+    lsr.ScriptCache = app_test.ScriptCache = lambda: at._script_cache
+    if queue:
+        lsr.RerunData = partial(original_rerun_data, fragment_id_queue=queue)
+    try:
+        return at.run()
+    finally:
+        lsr.LocalScriptRunner.run = original_run
+        lsr.RerunData = original_rerun_data
+        lsr.ScriptCache = app_test.ScriptCache = original_cache
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of ``samples``."""
+    ordered = sorted(samples)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def _status_kb(field: str) -> float:
+    try:
+        with open("/proc/self/status", encoding="ascii") as fh:
+            for line in fh:
+                if line.startswith(field + ":"):
+                    return float(line.split()[1])
+    except OSError:
+        pass
+    return 0.0
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process (Linux; 0 elsewhere)."""
+    return _status_kb("VmRSS") / 1024
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far."""
+    peak = _status_kb("VmHWM")
+    if not peak:
+        import resource
+
+        # ru_maxrss is KB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == "darwin":
+            peak /= 1024
+    return peak / 1024
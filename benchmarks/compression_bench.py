@@ -0,0 +1,148 @@
+"""Bytes-on-wire and latency of analyze requests with compression on/off.
+
+Starts a local stub of ``/api/analyze_data`` that throttles both directions
+to a fixed bandwidth, then posts a synthetic CSV through the client's own
+multipart/compression code with every available upload codec, and fetches a
+JSON response with and without ``Accept-Encoding`` negotiation.
+
+    python benchmarks/compression_bench.py --csv-mb 20 --mbps 50
+"""
+
+import argparse
+import base64
+import gzip
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+from common import load_client
+
+client = load_client()
+
+
+def make_csv(megabytes: float) -> bytes:
+    rng = random.Random(0)
+    cities = ["Chennai", "Mumbai", "Delhi", "Kolkata", "Pune", "Hyderabad"]
+    rows = ["id,city,date,amount,quantity"]
+    size = 0
+    i = 0
+    while size < megabytes * 1e6:
+        row = (
+            f"{i},{rng.choice(cities)},2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d},"
+            f"{rng.uniform(0, 10000):.2f},{rng.randint(1, 50)}"
+        )
+        rows.append(row)
+        size += len(row) + 1
+        i += 1
+    return ("\n".join(rows) + "\n").encode("utf-8")
+
+
+def make_response(text_kb: int, image_kb: int) -> bytes:
+    rng = random.Random(1)
+    answer = {
+        "summary": " ".join(rng.choice(["sales", "rose", "fell", "in", "Q3", "by", "12%"])
+                            for _ in range(text_kb * 180)),
+        "rows": [{"city": f"c{i}", "total": i * 3.5} for i in range(text_kb * 20)],
+        "sales_chart": "data:image/png;base64,"
+        + base64.b64encode(rng.randbytes(image_kb * 1024)).decode(),
+    }
+    return json.dumps({"answers": {"answer": json.dumps(answer)}}).encode("utf-8")
+
+
+def make_stub(response_body: bytes, mbps: float):
+    bytes_per_sec = mbps * 1e6 / 8
+    gz_body = gzip.compress(response_body, compresslevel=6)
+
+    def throttle(n: int) -> None:
+        time.sleep(n / bytes_per_sec)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            remaining = int(self.headers.get("Content-Length") or 0)
+            while remaining:
+                chunk = self.rfile.read(min(remaining, 64 * 1024))
+                remaining -= len(chunk)
+                throttle(len(chunk))
+            use_gzip = "gzip" in self.headers.get("Accept-Encoding", "")
+            body = gz_body if use_gzip else response_body
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            if use_gzip:
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            for i in range(0, len(body), 64 * 1024):
+                chunk = body[i: i + 64 * 1024]
+                throttle(len(chunk))
+                self.wfile.write(chunk)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_case(url, csv_bytes, codec, accept_encoding):
+    files = {
+        "questions.txt": ("questions.txt", b"Summarize sales by city", "text/plain"),
+        "sales.csv": ("sales.csv", BytesIO(csv_bytes), "text/csv"),
+    }
+    start = time.perf_counter()
+    if codec:
+        files = client.compress_multipart_files(files, codec)
+    body = client.MultipartStream(files)
+    response = client.get_http_session().post(
+        url,
+        data=body,
+        headers={"Content-Type": body.content_type, "Accept-Encoding": accept_encoding},
+        timeout=600,
+        stream=True,
+    )
+    payload = response.content
+    json.loads(payload)
+    elapsed = time.perf_counter() - start
+    return len(body), response.raw.tell(), elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--csv-mb", type=float, default=10.0)
+    parser.add_argument("--text-kb", type=int, default=500,
+                        help="size of the compressible part of the response")
+    parser.add_argument("--image-kb", type=int, default=500,
+                        help="size of the (incompressible) base64 chart")
+    parser.add_argument("--mbps", type=float, default=50.0,
+                        help="simulated link bandwidth in megabits per second")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    csv_bytes = make_csv(args.csv_mb)
+    server = make_stub(make_response(args.text_kb, args.image_kb), args.mbps)
+    url = f"http://127.0.0.1:{server.server_port}/api/analyze_data"
+
+    negotiated = client.get_http_session().headers["Accept-Encoding"]
+    cases = [(None, "identity"), (None, negotiated)]
+    cases += [(codec, negotiated) for codec in client.available_compression_codecs()]
+
+    print(f"CSV {len(csv_bytes) / 1e6:.1f} MB, link {args.mbps:g} Mbit/s, "
+          f"best of {args.repeat}")
+    print(f"{'upload':>8} {'response':>10} {'sent MB':>9} {'recv MB':>9} {'seconds':>8}")
+    for codec, accept in cases:
+        runs = [run_case(url, csv_bytes, codec, accept) for _ in range(args.repeat)]
+        sent, received, elapsed = min(runs, key=lambda r: r[2])
+        print(
+            f"{codec or 'raw':>8} {'identity' if accept == 'identity' else 'negotiated':>10} "
+            f"{sent / 1e6:>9.2f} {received / 1e6:>9.2f} {elapsed:>8.2f}"
+        )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
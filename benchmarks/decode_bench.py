@@ -0,0 +1,78 @@
+"""Peak memory and time of decoding a large analyze response.
+
+Builds a stub-shaped response (nested JSON answer with a table and
+incompressible chart images), then decodes it from 64 KB chunks two ways:
+the old path (join the chunks, ``json.loads`` the body, ``json.loads`` the
+answer again) and the client's streaming decoder, which spills long strings
+to disk and parses the answer as it arrives. Time is the best of a few
+plain runs; peak Python heap comes from a separate run under tracemalloc,
+which excludes the chunk list itself.
+
+    python benchmarks/decode_bench.py --rows 20000 --images 8 --image-kb 4000
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+
+from common import load_client
+from stub_backend import StubConfig, make_analysis
+
+client = load_client()
+
+
+def measure(fn, chunks, repeat: int = 3):
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(chunks)
+        elapsed.append(time.perf_counter() - start)
+    tracemalloc.start()
+    parsed = fn(chunks)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return parsed, min(elapsed), peak
+
+
+def old_decode(chunks):
+    body = b"".join(chunks)
+    result = json.loads(body)
+    return json.loads(result["answers"]["answer"])
+
+
+def streaming_decode(chunks):
+    result = client.decode_json_chunks(chunks)
+    _, _, parsed = client.parse_answers(result)
+    return parsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--images", type=int, default=8)
+    parser.add_argument("--image-kb", type=int, default=4000)
+    args = parser.parse_args()
+
+    config = StubConfig(rows=args.rows, images=args.images, image_kb=args.image_kb)
+    body = json.dumps(make_analysis(config, "q")).encode("utf-8")
+    chunks = [body[i:i + 64 * 1024] for i in range(0, len(body), 64 * 1024)]
+    largest = max(
+        len(v) for v in json.loads(json.loads(body)["answers"]["answer"]).values()
+        if isinstance(v, str)
+    )
+    print(f"response {len(body) / 1e6:.1f} MB, largest field {largest / 1e6:.1f} MB")
+
+    expected, old_s, old_peak = measure(old_decode, chunks)
+    parsed, new_s, new_peak = measure(streaming_decode, chunks)
+    same = {
+        k: str(v) if isinstance(v, client.SpilledText) else v for k, v in parsed.items()
+    } == expected
+    print(f"{'path':>10} {'seconds':>8} {'peak MB':>8}")
+    print(f"{'old':>10} {old_s:>8.2f} {old_peak / 1e6:>8.1f}")
+    print(f"{'streaming':>10} {new_s:>8.2f} {new_peak / 1e6:>8.1f}")
+    print(f"identical result: {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Query latency of the history search index at scale.
+
+Fills a throwaway history database with synthetic analyses spread over many
+sessions, then times session listing and full-text searches (which are
+always scoped to one session).
+
+    python benchmarks/history_search_bench.py --entries 50000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from common import load_frontend
+
+WORDS = (
+    "sales revenue profit city region month quarter trend growth decline top "
+    "customers products churn forecast average median correlation outliers "
+    "distribution histogram chart weather temperature rainfall population"
+).split()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=20000)
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    fe = load_frontend()
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = fe.HistoryStore(os.path.join(tmp, "history.sqlite3"), budget=1 << 40)
+        sessions = [f"session-{i}" for i in range(args.sessions)]
+
+        start = time.perf_counter()
+        for i in range(args.entries):
+            words = rng.sample(WORDS, 6)
+            result = {"answers": {"answer": {f"{w}_{rng.choice(WORDS)}": i for w in words[:3]}}}
+            store.add(
+                rng.choice(sessions),
+                f"What is the {words[0]} {words[1]} by {words[2]}?",
+                result,
+                [f"{words[3]}_{i % 97}.csv"],
+            )
+        print(f"inserted {args.entries:,} entries in {time.perf_counter() - start:.1f}s "
+              f"(fts5={'yes' if store.fts else 'no'})")
+
+        def timed(fn) -> float:
+            t = time.perf_counter()
+            fn()
+            return (time.perf_counter() - t) * 1000
+
+        cases = {
+            "list session": lambda: store.list_entries(rng.choice(sessions)),
+            "search (1 word)": lambda: store.search(rng.choice(WORDS), rng.choice(sessions)),
+            "search (2 words)": lambda: store.search(
+                " ".join(rng.sample(WORDS, 2)), rng.choice(sessions)),
+            "search prefix": lambda: store.search(rng.choice(WORDS)[:3], rng.choice(sessions)),
+        }
+        print(f"{'query':<22} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+        for name, fn in cases.items():
+            times = sorted(timed(fn) for _ in range(args.queries))
+            p95 = times[int(len(times) * 0.95) - 1]
+            print(f"{name:<22} {statistics.median(times):>8.2f} {p95:>8.2f} {times[-1]:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Rerun latency, memory and bytes moved under many simulated sessions.
+
+Starts the local stub backend and drives ``--sessions`` AppTest sessions of
+frontend.py spread over ``--concurrency`` worker processes. Each session clicks through the
+same upload -> preview -> questions -> analyze -> re-render -> history path
+a user would, rerunning only the page section each interaction belongs to.
+The report has p50/p95/p99 rerun time per phase, peak RSS, and bytes moved
+three ways: uploaded to the backend, downloaded from it, and serialized to
+the browser as element protos.
+
+    python benchmarks/load_bench.py --sessions 20 --concurrency 4 --rows 5000 --images 4
+"""
+
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Dict, List, Optional
+
+from common import (
+    REPO_ROOT, make_csv, percentile, peak_rss_mb, rss_mb, run_app, silence_streamlit,
+)
+from stub_backend import StubBackend, add_stub_arguments, stub_config
+
+PHASES = ("load", "upload", "preview", "questions", "analyze", "rerun", "history")
+
+
+class Recorder:
+    """Per-phase timings, browser bytes and exceptions of one worker."""
+
+    def __init__(self):
+        self.timings: Dict[str, List[float]] = {phase: [] for phase in PHASES}
+        self.browser_bytes = 0
+        self.errors: List[str] = []
+
+    def run(self, at, phase: str, fragment: Optional[str] = None) -> None:
+        start = time.perf_counter()
+        run_app(at, fragment)
+        self.timings[phase].append(time.perf_counter() - start)
+        self.browser_bytes += at.last_run_bytes
+        self.errors.extend(f"{phase}: {e.value}" for e in at.exception)
+
+
+def run_session(index: int, args: argparse.Namespace, recorder: Recorder, analyses: int) -> None:
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(REPO_ROOT, "frontend.py"), default_timeout=120)
+    recorder.run(at, "load")
+
+    uploader = at.file_uploader[0]
+    uploader.set_value((f"sales_{index}.csv", make_csv(args.csv_rows, index), "text/csv"))
+    recorder.run(at, "upload", "uploads")
+
+    for expander in at.expander:
+        if expander.key and expander.key.startswith("preview_"):
+            at.session_state[expander.key] = True
+    recorder.run(at, "preview", "uploads")
+
+    for checkbox in at.checkbox:
+        if checkbox.label == "Run analyses as background jobs":
+            checkbox.uncheck()
+    for _ in range(analyses):
+        at.text_area(key="questions_area").input(
+            f"Session {index}: summarize amount by city ({time.time_ns()})")
+        recorder.run(at, "questions", "questions")
+        next(b for b in at.button if b.label == "Start Analysis").click()
+        recorder.run(at, "analyze", "questions")
+        recorder.run(at, "rerun")
+
+    history = [e for e in at.expander if e.key and e.key.startswith("history_")]
+    if history:
+        at.session_state[history[0].key] = True
+    recorder.run(at, "history", "history")
+
+
+def run_worker(args: argparse.Namespace, env: Dict[str, str], sessions: List[int]) -> Dict:
+    """Run ``sessions`` one after another in this (fresh) process.
+
+    AppTest is not thread-safe, so concurrency comes from worker processes;
+    each holds its own Streamlit caches, like one server replica.
+    """
+    os.environ.update(env)
+    # frontend.py reads and writes questions.txt and .streamlit/ in the cwd
+    os.chdir(env["GRASPER_LOAD_WORKDIR"])
+    silence_streamlit()
+
+    # Warm-up: imports and module-level setup are not per-user costs, and
+    # skipping the analysis keeps it out of the backend byte counts
+    run_session(-1, args, Recorder(), analyses=0)
+    baseline_rss = rss_mb()
+    recorder = Recorder()
+    for index in sessions:
+        run_session(index, args, recorder, args.analyses)
+    return {
+        "timings": recorder.timings,
+        "browser_bytes": recorder.browser_bytes,
+        "errors": recorder.errors,
+        "baseline_rss": baseline_rss,
+        "peak_rss": peak_rss_mb(),
+        "sessions": len(sessions),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--analyses", type=int, default=2,
+                        help="analyses per session (each adds a history entry)")
+    parser.add_argument("--csv-rows", type=int, default=20_000,
+                        help="rows in each session's uploaded CSV")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    backend = StubBackend(stub_config(args)).start()
+    workdir = tempfile.mkdtemp(prefix="grasper-load-")
+    env = {
+        "API_ROOT": backend.url,
+        "GRASPER_HISTORY_DB": os.path.join(workdir, "history.sqlite3"),
+        "GRASPER_LOAD_WORKDIR": workdir,
+    }
+    shards = [list(range(args.sessions))[i::args.concurrency] for i in range(args.concurrency)]
+
+    start = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=args.concurrency, mp_context=context) as pool:
+        workers = list(pool.map(partial(run_worker, args, env), [s for s in shards if s]))
+    wall = time.perf_counter() - start
+    stats = backend.stats.snapshot()
+    backend.stop()
+
+    timings = {phase: [t for w in workers for t in w["timings"][phase]] for phase in PHASES}
+    errors = [e for w in workers for e in w["errors"]]
+    print(f"{args.sessions} sessions, concurrency {args.concurrency}, "
+          f"{args.analyses} analyses each, backend latency {args.latency:g}s, "
+          f"{args.rows} result rows, {args.images} x {args.image_kb} KB images")
+    print(f"{'phase':>9} {'runs':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'mean ms':>8}")
+    for phase in PHASES:
+        samples = timings[phase]
+        if not samples:
+            continue
+        print(
+            f"{phase:>9} {len(samples):>5} {percentile(samples, 50) * 1e3:>8.1f} "
+            f"{percentile(samples, 95) * 1e3:>8.1f} {percentile(samples, 99) * 1e3:>8.1f} "
+            f"{statistics.fmean(samples) * 1e3:>8.1f}"
+        )
+    all_runs = [t for samples in timings.values() for t in samples]
+    print(f"{'all':>9} {len(all_runs):>5} {percentile(all_runs, 50) * 1e3:>8.1f} "
+          f"{percentile(all_runs, 95) * 1e3:>8.1f} {percentile(all_runs, 99) * 1e3:>8.1f} "
+          f"{statistics.fmean(all_runs) * 1e3:>8.1f}")
+    print(f"wall {wall:.1f}s, {len(all_runs) / wall:.1f} reruns/s")
+    per_session = [
+        (w["peak_rss"] - w["baseline_rss"]) / w["sessions"] for w in workers
+    ]
+    print(
+        f"RSS per worker after warm-up {statistics.fmean(w['baseline_rss'] for w in workers):.0f} MB, "
+        f"peak {max(w['peak_rss'] for w in workers):.0f} MB; "
+        f"~{statistics.fmean(per_session):.1f} MB growth per session"
+    )
+    browser_bytes = sum(w["browser_bytes"] for w in workers)
+    print(
+        f"backend: {stats['requests']} requests, {stats['bytes_in'] / 1e6:.1f} MB up, "
+        f"{stats['bytes_out'] / 1e6:.1f} MB down; "
+        f"browser: {browser_bytes / 1e6:.1f} MB of element protos"
+    )
+    if errors:
+        print(f"{len(errors)} exceptions, first: {errors[0]}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Per-interaction rerun time: the whole page vs only the section touched.
+
+Builds a busy page in one AppTest session against the local stub backend:
+``--files`` uploaded CSVs with their previews open, a finished analysis with
+a ``--rows`` table and charts on screen, and ``--history`` past analyses.
+Each interaction is then repeated ``--repeat`` times in two modes, taking
+turns: rerunning the whole script (as every interaction did before the page
+was split into fragments) and rerunning only the fragment the widget lives
+in. Reports median / p95 time and element bytes sent per interaction.
+
+    python benchmarks/rerun_bench.py --files 3 --history 5 --rows 5000 --repeat 10
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Tuple
+
+from common import REPO_ROOT, make_csv, percentile, run_app, silence_streamlit
+from stub_backend import StubBackend, add_stub_arguments, stub_config
+
+
+def build_page(at, args: argparse.Namespace) -> List[str]:
+    """Upload, open previews, and run ``--history`` analyses synchronously.
+
+    Returns the keys of the open preview expanders.
+    """
+    at.file_uploader[0].set_value([
+        (f"sales_{i}.csv", make_csv(args.csv_rows, i), "text/csv") for i in range(args.files)
+    ])
+    run_app(at, "uploads")
+    previews = [e.key for e in at.expander if e.key and e.key.startswith("preview_")]
+    keep_open(at, previews)
+    run_app(at, "uploads")
+    at.checkbox(key="run_as_job").uncheck()
+    at.checkbox(key="bypass_cache").check()
+    run_app(at, "sidebar")
+    for i in range(max(args.history, 1)):
+        at.text_area(key="questions_area").input(f"Summarize amount by city, take {i}")
+        run_app(at, "questions")
+        next(b for b in at.button if b.label == "Start Analysis").click()
+        run_app(at, "questions")
+    keep_open(at, previews)
+    run_app(at)
+    return previews
+
+
+def keep_open(at, keys: List[str]) -> None:
+    """AppTest does not send expander state back; the browser would."""
+    for key in keys:
+        at.session_state[key] = True
+
+
+def interactions(at) -> List[Tuple[str, str, Callable[[int], None]]]:
+    """(name, fragment key, apply the i-th change) for each interaction."""
+    page_key = next(n.key for n in at.number_input if n.key and n.key.endswith("_page"))
+    pages = int(at.number_input(key=page_key).max)
+    profile_key = next(t.key for t in at.toggle if t.key and t.key.startswith("profile_"))
+    return [
+        ("type a question", "questions",
+         lambda i: at.text_area(key="questions_area").input(f"Top cities by amount ({i})")),
+        ("toggle an option", "questions",
+         lambda i: at.checkbox(key="convert_csv").set_value(i % 2 == 0)),
+        ("move a slider", "sidebar",
+         lambda i: at.slider(key="request_timeout").set_value(30 + 10 * (i % 20))),
+        ("toggle a profile", "uploads",
+         lambda i: at.toggle(key=profile_key).set_value(i % 2 == 0)),
+        ("page a result table", "results",
+         lambda i: at.number_input(key=page_key).set_value(1 + i % pages)),
+        ("search history", "history",
+         lambda i: at.text_input(key="history_query").input(("take", "city", "")[i % 3])),
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=3, help="uploaded CSVs, previews open")
+    parser.add_argument("--csv-rows", type=int, default=20_000)
+    parser.add_argument("--history", type=int, default=5, help="analyses run before timing")
+    parser.add_argument("--repeat", type=int, default=10, help="samples per interaction and mode")
+    add_stub_arguments(parser)
+    parser.set_defaults(rows=5000, latency=0.0)
+    args = parser.parse_args()
+
+    backend = StubBackend(stub_config(args)).start()
+    workdir = tempfile.mkdtemp(prefix="grasper-rerun-")
+    os.environ["API_ROOT"] = backend.url
+    os.environ["GRASPER_HISTORY_DB"] = os.path.join(workdir, "history.sqlite3")
+    # frontend.py reads and writes questions.txt and .streamlit/ in the cwd
+    os.chdir(workdir)
+    silence_streamlit()
+
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(REPO_ROOT, "frontend.py"), default_timeout=120)
+    run_app(at)
+    previews = build_page(at, args)
+
+    results: Dict[Tuple[str, str], Dict[str, List[float]]] = {}
+    errors: List[str] = []
+    steps = interactions(at)
+    for name, fragment, change in steps:
+        for mode in ("page", "fragment"):
+            results[(name, mode)] = {"ms": [], "kb": []}
+        for i in range(args.repeat * 2):
+            mode = ("page", "fragment")[i % 2]
+            change(i)
+            keep_open(at, previews)
+            start = time.perf_counter()
+            run_app(at, fragment if mode == "fragment" else None)
+            results[(name, mode)]["ms"].append((time.perf_counter() - start) * 1e3)
+            results[(name, mode)]["kb"].append(at.last_run_bytes / 1e3)
+            errors.extend(f"{name}: {e.value}" for e in at.exception)
+    backend.stop()
+
+    print(f"{args.files} files x {args.csv_rows} rows with previews open, "
+          f"{args.rows}-row result table, {args.images} charts, "
+          f"{max(args.history, 1)} history entries; {args.repeat} samples each")
+    print(f"{'interaction':>20} {'section':>9} {'page p50':>9} {'p95':>7} {'KB':>7} "
+          f"{'section p50':>12} {'p95':>7} {'KB':>7} {'speedup':>8}")
+    for name, fragment, _ in steps:
+        page, frag = results[(name, "page")], results[(name, "fragment")]
+        page_p50, frag_p50 = statistics.median(page["ms"]), statistics.median(frag["ms"])
+        print(
+            f"{name:>20} {fragment:>9} {page_p50:>9.1f} {percentile(page['ms'], 95):>7.1f} "
+            f"{statistics.median(page['kb']):>7.1f} {frag_p50:>12.1f} "
+            f"{percentile(frag['ms'], 95):>7.1f} {statistics.median(frag['kb']):>7.1f} "
+            f"{page_p50 / frag_p50:>7.1f}x"
+        )
+    if errors:
+        print(f"{len(errors)} exceptions, first: {errors[0]}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Cold start: time from process spawn to the first rendered page.
+
+Each sample is a fresh interpreter that imports the app's dependencies and
+runs frontend.py once through AppTest, the way a scale-to-zero replica
+serves its first session. Reported per sample: interpreter + import time,
+time to first render (from spawn), the first render itself, and time until
+background warm-up has loaded the lazily imported modules. ``--eager``
+imports pandas, numpy, PIL and requests up front instead, as the frontend
+used to, for comparison.
+
+    python benchmarks/startup_bench.py --runs 5
+    python benchmarks/startup_bench.py --runs 5 --eager
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import REPO_ROOT, peak_rss_mb, silence_streamlit
+
+EAGER_MODULES = ("numpy", "pandas", "requests", "PIL.Image")
+HEAVY_MODULES = ("pandas", "numpy", "PIL", "requests", "pyarrow")
+
+
+def child(spawned: float, eager: bool) -> None:
+    """Runs in the measured process: import, render once, wait for warm-up."""
+    start = time.perf_counter()
+    if eager:
+        import importlib
+
+        for name in EAGER_MODULES:
+            importlib.import_module(name)
+    from streamlit.testing.v1 import AppTest
+
+    import grasper_client
+
+    silence_streamlit()
+    imported = time.time()
+    import_s = time.perf_counter() - start
+
+    at = AppTest.from_file(os.path.join(REPO_ROOT, "frontend.py"), default_timeout=120)
+    render_start = time.perf_counter()
+    at.run()
+    render_s = time.perf_counter() - render_start
+    first_render = time.time()
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    grasper_client.start_warmup().join()
+    ready = time.time()
+
+    rerun_start = time.perf_counter()
+    at.run()
+    print(json.dumps({
+        "startup_s": imported - spawned,
+        "import_s": import_s,
+        "first_render_s": first_render - spawned,
+        "render_s": render_s,
+        "ready_s": ready - spawned,
+        "rerun_s": time.perf_counter() - rerun_start,
+        "loaded_at_first_render": loaded,
+        "peak_rss_mb": peak_rss_mb(),
+        "errors": [str(e.value) for e in at.exception],
+    }))
+
+
+def run_sample(eager: bool, env: dict) -> dict:
+    spawned = time.time()
+    command = [sys.executable, os.path.abspath(__file__), "--child", repr(spawned)]
+    if eager:
+        command.append("--eager")
+    out = subprocess.run(
+        command, env=env, cwd=env["GRASPER_STARTUP_WORKDIR"],
+        capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--eager", action="store_true",
+                        help="import pandas, numpy, PIL and requests before the app")
+    parser.add_argument("--child", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        child(args.child, args.eager)
+        return
+
+    workdir = tempfile.mkdtemp(prefix="grasper-startup-")
+    env = {
+        **os.environ,
+        # Nothing listens here; the first render must not need the backend
+        "API_ROOT": "http://127.0.0.1:9",
+        "GRASPER_HISTORY_DB": os.path.join(workdir, "history.sqlite3"),
+        "GRASPER_METRICS_PORT": "",
+        "GRASPER_STARTUP_WORKDIR": workdir,
+    }
+    # One untimed run so every sample sees warm OS file caches and .pyc files
+    run_sample(args.eager, env)
+    samples = [run_sample(args.eager, env) for _ in range(args.runs)]
+
+    print(f"{args.runs} cold starts, {'eager' if args.eager else 'lazy'} imports")
+    print(f"{'metric':>22} {'median ms':>10} {'min ms':>8} {'max ms':>8}")
+    for key, label in (
+        ("startup_s", "spawn -> imports done"),
+        ("import_s", "imports"),
+        ("render_s", "first script run"),
+        ("first_render_s", "spawn -> first render"),
+        ("ready_s", "spawn -> warmed up"),
+        ("rerun_s", "warm rerun"),
+    ):
+        values = [s[key] * 1e3 for s in samples]
+        print(f"{label:>22} {statistics.median(values):>10.1f} "
+              f"{min(values):>8.1f} {max(values):>8.1f}")
+    print(f"peak RSS {statistics.fmean(s['peak_rss_mb'] for s in samples):.0f} MB; "
+          f"imported when the first run returned (warm-up has just started): "
+          f"{', '.join(samples[-1]['loaded_at_first_render']) or 'none'}")
+    errors = [e for s in samples for e in s["errors"]]
+    if errors:
+        print(f"{len(errors)} exceptions, first: {errors[0]}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
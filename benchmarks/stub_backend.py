@@ -0,0 +1,224 @@
+"""Local stand-in for the Grasper backend, for benchmarks and load tests.
+
+Implements ``/set_api_key/`` and ``/api/analyze_data`` with a configurable
+response delay, table size, text size and number of (incompressible) chart
+images, and counts the bytes moved in each direction. With ``--capacity``
+it serves that many analyses at full speed and slows every analysis down
+when more are running, like a saturated single backend. Run it on its own to
+point a dev frontend at it:
+
+    python benchmarks/stub_backend.py --port 8765 --latency 0.5 --images 4
+    API_ROOT=http://127.0.0.1:8765 streamlit run frontend.py
+"""
+
+import argparse
+import base64
+import json
+import os
+import random
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+
+def make_png(width: int, height: int, seed: int = 0) -> bytes:
+    """An RGB PNG of random noise, so it does not compress on the wire."""
+    rng = random.Random(seed)
+    raw = b"".join(
+        b"\x00" + rng.randbytes(width * 3) for _ in range(height)
+    )
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(raw, 1))
+        + chunk(b"IEND", b"")
+    )
+
+
+@dataclass
+class StubConfig:
+    latency: float = 0.2
+    jitter: float = 0.0
+    rows: int = 200
+    text_kb: int = 4
+    images: int = 2
+    image_kb: int = 200
+    capacity: int = 0  # 0 = every analysis runs at full speed
+
+
+@dataclass
+class StubStats:
+    requests: Dict[str, int] = field(default_factory=dict)
+    bytes_in: int = 0
+    bytes_out: int = 0
+    in_flight: int = 0
+    peak_in_flight: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def begin(self) -> None:
+        with self.lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def end(self) -> None:
+        with self.lock:
+            self.in_flight -= 1
+
+    def record(self, route: str, received: int, sent: int) -> None:
+        with self.lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+            self.bytes_in += received
+            self.bytes_out += sent
+
+    def snapshot(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                "requests": sum(self.requests.values()),
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "peak_in_flight": self.peak_in_flight,
+            }
+
+
+def make_analysis(config: StubConfig, questions: str) -> Dict:
+    """A response shaped like the real backend's: metrics, a table, charts."""
+    side = max(int((config.image_kb * 1024 / 3) ** 0.5), 1)
+    answer = {
+        "total_rows": config.rows,
+        "mean_value": 123.45,
+        "question_count": len(questions.splitlines()),
+        "summary": ("lorem ipsum " * (config.text_kb * 1024 // 12 + 1))[: config.text_kb * 1024],
+        "rows": [
+            {"id": i, "city": f"city-{i % 17}", "value": i * 1.5, "flag": i % 3 == 0}
+            for i in range(config.rows)
+        ],
+    }
+    for i in range(config.images):
+        png = base64.b64encode(make_png(side, side, seed=i)).decode("ascii")
+        answer[f"chart_{i}_chart"] = "data:image/png;base64," + png
+    return {"answers": {"answer": json.dumps(answer), "generated_code": "print('stub')"}}
+
+
+def _questions_from_body(body: bytes) -> str:
+    marker = b'name="questions.txt"'
+    start = body.find(marker)
+    if start < 0:
+        return ""
+    start = body.find(b"\r\n\r\n", start) + 4
+    end = body.find(b"\r\n--", start)
+    return body[start:end].decode("utf-8", errors="ignore")
+
+
+def make_handler(config: StubConfig, stats: StubStats):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args) -> None:
+            pass
+
+        def _reply(self, status: int, payload, received: int) -> None:
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            stats.record(self.path.split("?")[0], received, len(data))
+
+        def _think(self, work: float) -> None:
+            """Spend ``work`` seconds of backend time, shared when over capacity."""
+            if not config.capacity:
+                time.sleep(work)
+                return
+            done, tick = 0.0, 0.01
+            while done < work:
+                time.sleep(tick)
+                done += tick * min(1.0, config.capacity / max(stats.in_flight, 1))
+
+        def do_POST(self) -> None:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+            route = self.path.split("?")[0].rstrip("/")
+            if route.endswith("/set_api_key"):
+                self._reply(200, {"status": "ok"}, len(body))
+            elif route.endswith("/api/analyze_data"):
+                stats.begin()
+                try:
+                    self._think(config.latency + random.uniform(0, config.jitter))
+                finally:
+                    stats.end()
+                self._reply(200, make_analysis(config, _questions_from_body(body)), len(body))
+            else:
+                self._reply(404, {"detail": "Not Found"}, len(body))
+
+        def do_GET(self) -> None:
+            self._reply(404, {"detail": "Not Found"}, 0)
+
+    return Handler
+
+
+class StubBackend:
+    """Threaded stub server; ``url`` is valid once ``start()`` returns."""
+
+    def __init__(self, config: StubConfig = None, port: int = 0):
+        self.config = config or StubConfig()
+        self.stats = StubStats()
+        self.server = ThreadingHTTPServer(
+            ("127.0.0.1", port), make_handler(self.config, self.stats))
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self) -> "StubBackend":
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = StubConfig()
+    parser.add_argument("--latency", type=float, default=defaults.latency,
+                        help="backend think time per analysis, seconds")
+    parser.add_argument("--jitter", type=float, default=defaults.jitter,
+                        help="extra random delay up to this many seconds")
+    parser.add_argument("--rows", type=int, default=defaults.rows,
+                        help="rows in the result table")
+    parser.add_argument("--text-kb", type=int, default=defaults.text_kb)
+    parser.add_argument("--images", type=int, default=defaults.images,
+                        help="chart images per response")
+    parser.add_argument("--image-kb", type=int, default=defaults.image_kb)
+    parser.add_argument("--capacity", type=int, default=defaults.capacity,
+                        help="analyses served at full speed at once (0 = unlimited)")
+
+
+def stub_config(args: argparse.Namespace) -> StubConfig:
+    return StubConfig(
+        latency=args.latency, jitter=args.jitter, rows=args.rows,
+        text_kb=args.text_kb, images=args.images, image_kb=args.image_kb,
+        capacity=args.capacity,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8765")))
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    backend = StubBackend(stub_config(args), port=args.port)
+    print(f"Stub backend on {backend.url}")
+    backend.server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,73 @@
-import base64
+from __future__ import annotations
+
+import binascii
+import hashlib
 import json
 import mimetypes
 import time
 import uuid
+import zlib
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from io import BytesIO, StringIO
-from typing import Any, Dict, List, Optional, Tuple
+from functools import partial
+from itertools import islice
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 import os
+import re
+import secrets
+import sqlite3
+import tempfile
+import threading
 
-import pandas as pd
-import requests
 import streamlit as st
-from PIL import Image
-from dotenv import load_dotenv
-load_dotenv()
+from grasper_client import (
+    ADMISSION,
+    API_BASE_URL,
+    BATCH_SEPARATOR,
+    HTTP_BACKOFF_FACTOR,
+    JOB_POLL_INTERVAL,
+    LocalFile,
+    METRICS,
+    METRICS_PORT,
+    TRACE_FILE,
+    AdmissionRejected,
+    AnalysisError,
+    ResultCache,
+    SpilledText,
+    TempFileCache,
+    Trace,
+    analyze,
+    available_compression_codecs,
+    b64decode_value,
+    classify_result,
+    file_digest,
+    get_http_session,
+    http_pool_stats,
+    iter_json,
+    json_default,
+    make_multipart_files,
+    parse_answers,
+    result_cache_key,
+    span,
+    split_question_blocks,
+    start_metrics_server,
+    start_warmup,
+)
 
+# pandas, numpy, PIL and requests are imported where they are used, so the
+# first page paints without paying for them
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
 
-# API Configuration
-API_BASE_URL = "https://bharath4444-grasper-ai.hf.space/"
-# API_BASE_URL = os.getenv("API_ROOT", "http://localhost:8000")
+
+# File previews only ever read this much of an upload
+PREVIEW_ROWS = 10
+PREVIEW_BYTES = 1024 * 1024
+PREVIEW_IMAGE_SIZE = 1024
 # Configure page
 st.set_page_config(
     page_title="Grasper - Advanced Data Analytics",
@@ -82,73 +132,127 @@ st.markdown(
 # ========== Helper Functions ==========
 
 
-def safe_decode_base64(data: str) -> bytes:
-    """Handles data URIs and raw base64 strings."""
-    if data.startswith("data:"):
-        try:
-            header, b64 = data.split(",", 1)
-            return base64.b64decode(b64)
-        except Exception:
-            pass
-    return base64.b64decode(data)
+# Charts are shown downscaled to this width; downloads keep the original
+MEDIA_DISPLAY_WIDTH = int(os.getenv("GRASPER_MEDIA_DISPLAY_WIDTH", "1200"))
 
 
-def is_base64_string(s: str) -> bool:
-    """Check if string is valid base64."""
-    try:
-        base64.b64decode(s, validate=True)
-        return True
-    except Exception:
-        return False
+def payload_fingerprint(payload: Any) -> str:
+    """Identify a base64 payload by content, cheaply.
 
+    In-memory strings are hashed whole. Spilled strings are immutable temp
+    files, so their file, offset and length identify them without a read.
+    """
+    if isinstance(payload, SpilledText):
+        return f"spilled:{payload.path}:{payload.offset}:{payload.length}"
+    return hashlib.sha256(payload.encode("utf-8", "surrogatepass")).hexdigest()
 
-def get_mime_type(data_uri: str) -> str:
-    """Extract MIME type from data URI."""
-    if data_uri.startswith("data:"):
-        try:
-            mime_part = data_uri.split(";")[0].replace("data:", "")
-            return mime_part
-        except Exception:
-            return "application/octet-stream"
-    return "application/octet-stream"
 
+@st.cache_data(show_spinner=False, max_entries=256)
+def decode_media(
+    result_id: str, key: str, fingerprint: str, _payload: Any
+) -> Tuple[bytes, float, str]:
+    """Decode a base64 payload (str or SpilledText) once per content, timing it.
 
-def render_media_content(name: str, data: str) -> None:
-    """Render different types of media content."""
-    try:
-        mime_type = get_mime_type(data) if data.startswith(
-            "data:") else "image/png"
+    ``fingerprint`` is ``payload_fingerprint(_payload)``: job partials reuse
+    one result id while their payloads change, so the id and length alone
+    could return stale bytes. Also returns the SHA-256 of the decoded bytes
+    for content-keyed caches.
+    """
+    start = time.perf_counter()
+    data = b64decode_value(_payload)
+    return data, time.perf_counter() - start, hashlib.sha256(data).hexdigest()
 
-        # Clean data for processing
-        if data.startswith("data:"):
-            clean_data = data.split(",", 1)[1]
-        else:
-            clean_data = data
 
-        if not is_base64_string(clean_data):
+@st.cache_data(show_spinner=False, max_entries=256)
+def make_display_image(digest: str, max_width: int, _data: bytes) -> Tuple[bytes, str]:
+    """Downscale an image to ``max_width`` and re-encode it for display.
+
+    Cached by content digest, so identical charts (across results or
+    sessions) are resized once. WebP is used when Pillow supports it, PNG
+    otherwise; animated images are passed through untouched.
+    """
+    from PIL import Image, features
+
+    img = Image.open(BytesIO(_data))
+    if getattr(img, "is_animated", False) or (
+        img.width <= max_width and len(_data) < 256 * 1024
+    ):
+        return _data, Image.MIME.get(img.format, "image/png")
+
+    if img.width > max_width:
+        img.draft("RGB", (max_width, max_width * img.height // img.width))
+        img = img.resize(
+            (max_width, max(1, img.height * max_width // img.width)), Image.LANCZOS
+        )
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+
+    buf = BytesIO()
+    if features.check("webp"):
+        img.save(buf, format="WEBP", quality=85, method=4)
+        return buf.getvalue(), "image/webp"
+    img.save(buf, format="PNG", optimize=True)
+    return buf.getvalue(), "image/png"
+
+
+def _render_image(
+    name: str, decoded_data: bytes, digest: str, mime_type: str, file_name: str,
+    key: str, label: str,
+) -> None:
+    """Show a display-sized copy; the original is built only on download."""
+    display_data, _ = make_display_image(digest, MEDIA_DISPLAY_WIDTH, decoded_data)
+    st.image(display_data, use_container_width=True, caption=name)
+    st.download_button(
+        label=label,
+        data=lambda: decoded_data,
+        file_name=file_name,
+        mime=mime_type,
+        key=key,
+        on_click="ignore",
+    )
+
+
+def render_media_content(
+    name: str, mime_type: str, payload: str, result_id: str = "", debug: bool = False
+) -> None:
+    """Render different types of media content.
+
+    ``payload`` is bare base64 as returned by ``sniff_media``; it is decoded
+    exactly once per result and reused on reruns.
+    """
+    try:
+        try:
+            with span("media decode", item=name, mime=mime_type) as attrs:
+                decoded_data, decode_seconds, digest = decode_media(
+                    result_id, name, payload_fingerprint(payload), payload)
+                attrs["bytes"] = len(decoded_data)
+        except (binascii.Error, ValueError):
             st.error(f"Invalid base64 data for {name}")
             return
 
-        decoded_data = base64.b64decode(clean_data)
-
         st.markdown(
             f'<div class="section-header">{name.replace("_", " ").title()}</div>',
             unsafe_allow_html=True,
         )
+        if debug:
+            st.caption(
+                f"{mime_type} · {len(decoded_data) / 1e6:.2f} MB · "
+                f"decoded in {decode_seconds * 1000:.1f} ms"
+            )
+        key_prefix = f"download_{result_id}_{name}"
 
         # Handle different media types
         if mime_type.startswith("image/"):
             try:
-                img = Image.open(BytesIO(decoded_data))
-                st.image(img, use_container_width=True, caption=name)
-
-                # Download button for images
-                st.download_button(
-                    label="Download Image",
-                    data=decoded_data,
+                # Download button for images serves the full-resolution original
+                _render_image(
+                    name,
+                    decoded_data,
+                    digest,
+                    mime_type,
                     file_name=f"{name}.{mime_type.split('/')[-1]}",
-                    mime=mime_type,
-                    key=f"download_{name}_img",
+                    key=f"{key_prefix}_img",
+                    label="Download Image",
                 )
             except Exception as e:
                 st.error(f"Could not display image: {e}")
@@ -160,7 +264,7 @@ def render_media_content(name: str, data: str) -> None:
                 data=decoded_data,
                 file_name=f"{name}.{mime_type.split('/')[-1]}",
                 mime=mime_type,
-                key=f"download_{name}_audio",
+                key=f"{key_prefix}_audio",
             )
 
         elif mime_type.startswith("video/"):
@@ -170,20 +274,20 @@ def render_media_content(name: str, data: str) -> None:
                 data=decoded_data,
                 file_name=f"{name}.{mime_type.split('/')[-1]}",
                 mime=mime_type,
-                key=f"download_{name}_video",
+                key=f"{key_prefix}_video",
             )
 
         else:
             # Try to render as image if MIME type detection failed
             try:
-                img = Image.open(BytesIO(decoded_data))
-                st.image(img, use_container_width=True, caption=name)
-                st.download_button(
-                    label="Download File",
-                    data=decoded_data,
+                _render_image(
+                    name,
+                    decoded_data,
+                    digest,
+                    "image/png",
                     file_name=f"{name}.png",
-                    mime="image/png",
-                    key=f"download_{name}_file",
+                    key=f"{key_prefix}_file",
+                    label="Download File",
                 )
             except Exception:
                 st.error(f"Unsupported media type: {mime_type}")
@@ -192,6 +296,80 @@ def render_media_content(name: str, data: str) -> None:
         st.error(f"Error rendering media {name}: {e}")
 
 
+def _read_json_preview(uploaded_file, max_items: int) -> Tuple[str, Any]:
+    """Parse at most ``max_items`` top-level entries of a JSON upload.
+
+    Small files are parsed whole. Larger ones are streamed with ijson when
+    it is installed; otherwise only the first PREVIEW_BYTES are shown as text.
+    """
+    if uploaded_file.size <= PREVIEW_BYTES:
+        return "json", json.load(uploaded_file)
+
+    try:
+        import ijson
+    except ImportError:
+        head = uploaded_file.read(PREVIEW_BYTES).decode("utf-8", errors="ignore")
+        return "text", head + "\n..."
+
+    first = uploaded_file.read(1)
+    while first and first in b" \t\r\n\xef\xbb\xbf":
+        first = uploaded_file.read(1)
+    uploaded_file.seek(0)
+    if first == b"[":
+        items = list(islice(ijson.items(uploaded_file, "item", use_float=True), max_items))
+        return "json", items
+    preview = {}
+    for key, value in islice(ijson.kvitems(uploaded_file, "", use_float=True), max_items):
+        preview[key] = value
+    return "json", preview
+
+
+@st.cache_data(show_spinner=False, max_entries=128)
+def load_file_preview(
+    file_id: str, size: int, digest: str, name: str, _uploaded_file
+) -> Tuple[str, Any]:
+    """Read just enough of an upload to preview it.
+
+    Memoized by (file_id, size, digest), so reruns reuse the parsed preview
+    instead of re-reading the file. Returns a (kind, payload) pair.
+    """
+    import pandas as pd
+    from PIL import Image
+
+    f = _uploaded_file
+    f.seek(0)
+    try:
+        if name.endswith(".csv"):
+            return "dataframe", pd.read_csv(f, nrows=PREVIEW_ROWS)
+
+        if name.endswith((".xls", ".xlsx")):
+            return "dataframe", pd.read_excel(f, nrows=PREVIEW_ROWS)
+
+        if name.endswith(".parquet"):
+            return "dataframe", _preview_parquet(f)
+
+        if name.endswith((".arrow", ".feather", ".ipc", ".arrows")):
+            return "dataframe", _preview_arrow_ipc(f)
+
+        if name.endswith(".json"):
+            return _read_json_preview(f, PREVIEW_ROWS)
+
+        if name.endswith(".txt"):
+            return "text", f.read(2000 * 4).decode("utf-8", errors="ignore")[:2000]
+
+        if name.endswith((".png", ".jpg", ".jpeg", ".gif", ".bmp")):
+            img = Image.open(f)
+            img.draft("RGB", (PREVIEW_IMAGE_SIZE, PREVIEW_IMAGE_SIZE))
+            img.thumbnail((PREVIEW_IMAGE_SIZE, PREVIEW_IMAGE_SIZE))
+            buf = BytesIO()
+            img.save(buf, format="PNG")
+            return "image", buf.getvalue()
+
+        return "none", None
+    finally:
+        f.seek(0)
+
+
 def preview_file(uploaded_file) -> None:
     """Show file preview with modern styling."""
     name = uploaded_file.name.lower()
@@ -199,30 +377,25 @@ def preview_file(uploaded_file) -> None:
     st.markdown('<div class="file-preview">', unsafe_allow_html=True)
 
     try:
-        uploaded_file.seek(0)
-        if name.endswith(".csv"):
-            df = pd.read_csv(uploaded_file)
-            st.dataframe(df.head(10), use_container_width=True)
-
-        elif name.endswith((".xls", ".xlsx")):
-            df = pd.read_excel(uploaded_file)
-            st.dataframe(df.head(10), use_container_width=True)
+        kind, payload = load_file_preview(
+            uploaded_file.file_id,
+            uploaded_file.size,
+            file_digest(uploaded_file),
+            name,
+            uploaded_file,
+        )
+        if kind == "dataframe":
+            st.dataframe(payload, use_container_width=True)
 
-        elif name.endswith(".json"):
-            uploaded_file.seek(0)
-            obj = json.load(uploaded_file)
-            st.json(obj, expanded=False)
+        elif kind == "json":
+            st.json(payload, expanded=False)
 
-        elif name.endswith(".txt"):
-            uploaded_file.seek(0)
-            txt = uploaded_file.read().decode("utf-8", errors="ignore")
+        elif kind == "text":
             st.text_area(
-                "Preview", value=txt[:2000], height=200, disabled=True)
+                "Preview", value=payload[:2000], height=200, disabled=True)
 
-        elif name.endswith((".png", ".jpg", ".jpeg", ".gif", ".bmp")):
-            uploaded_file.seek(0)
-            img = Image.open(uploaded_file)
-            st.image(img, caption=uploaded_file.name, use_container_width=True)
+        elif kind == "image":
+            st.image(payload, caption=uploaded_file.name, use_container_width=True)
 
         else:
             st.info("No preview available for this file type.")
@@ -233,90 +406,690 @@ def preview_file(uploaded_file) -> None:
     st.markdown("</div>", unsafe_allow_html=True)
 
 
-def make_multipart_files(uploaded_files, questions_text: str, use_questions_file: bool):
-    """Build files dict for requests."""
-    files = {}
+# ========== Parquet / Arrow ==========
 
-    if use_questions_file:
-        for f in uploaded_files:
-            if f.name.lower() == "questions.txt":
-                f.seek(0)
-                files["questions.txt"] = (
-                    "questions.txt", f.read(), "text/plain")
-                break
-    else:
-        files["questions.txt"] = (
-            "questions.txt",
-            questions_text.encode("utf-8"),
-            "text/plain",
-        )
+PREVIEW_MAX_COLUMNS = 50
+PARQUET_MIME = "application/vnd.apache.parquet"
 
-    for f in uploaded_files:
-        if f.name.lower() == "questions.txt":
-            continue
+
+def _preview_parquet(f) -> pd.DataFrame:
+    """First PREVIEW_ROWS rows of the first PREVIEW_MAX_COLUMNS columns.
+
+    Only the leading row group's pages for those columns are read.
+    """
+    import pyarrow.parquet as pq
+
+    pf = pq.ParquetFile(f)
+    columns = pf.schema_arrow.names[:PREVIEW_MAX_COLUMNS]
+    batch = next(pf.iter_batches(batch_size=PREVIEW_ROWS, columns=columns), None)
+    if batch is None:
+        return pf.schema_arrow.empty_table().select(columns).to_pandas()
+    return batch.to_pandas()
+
+
+def _preview_arrow_ipc(f) -> pd.DataFrame:
+    """First PREVIEW_ROWS rows of an Arrow IPC file (Feather v2) or stream."""
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    try:
+        reader = ipc.open_file(f)
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        schema = reader.schema
+    except pa.ArrowInvalid:
         f.seek(0)
-        content = f.read()
-        mime = f.type or "application/octet-stream"
-        files[f.name] = (f.name, content, mime)
-    return files
+        reader = ipc.open_stream(f)
+        batches = iter(reader)
+        schema = reader.schema
 
+    columns = schema.names[:PREVIEW_MAX_COLUMNS]
+    rows = []
+    needed = PREVIEW_ROWS
+    for batch in batches:
+        rows.append(batch.select(columns).slice(0, needed))
+        needed -= rows[-1].num_rows
+        if needed <= 0:
+            break
+    if not rows:
+        return pa.schema([schema.field(c) for c in columns]).empty_table().to_pandas()
+    return pa.Table.from_batches(rows).to_pandas()
 
-def display_results_dashboard(parsed: Dict[str, Any]):
-    """Display results in a modern dashboard layout."""
 
-    # Separate content types
-    images = []
-    media_files = []
-    metrics = {}
-    tables = {}
-    text_content = {}
-
-    for k, v in parsed.items():
-        lname = k.lower()
-
-        # Check for base64 encoded content
-        if isinstance(v, str) and len(v) > 50:
-            if v.startswith("data:"):
-                mime_type = get_mime_type(v)
-                if mime_type.startswith(("image/", "audio/", "video/")):
-                    media_files.append((k, v))
-                continue
-            elif is_base64_string(v.split(",")[-1] if "," in v else v):
-                images.append((k, v))
-                continue
+PARQUET_CACHE_ENTRIES = int(os.getenv("GRASPER_PARQUET_CACHE_ENTRIES", "32"))
+PARQUET_CACHE_TTL = int(os.getenv("GRASPER_PARQUET_CACHE_TTL", "3600"))
+
+
+@st.cache_resource(on_release=TempFileCache.clear)
+def get_parquet_conversions() -> TempFileCache:
+    """Process-wide cache of CSV digest -> converted Parquet temp file.
+
+    Least recently used and expired conversions have their file deleted.
+    """
+    return TempFileCache(PARQUET_CACHE_ENTRIES, PARQUET_CACHE_TTL)
+
+
+def _write_parquet(
+    uploaded_file, path: str, column_types: Optional[Dict[str, Any]] = None
+) -> None:
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+
+    uploaded_file.seek(0)
+    reader = pacsv.open_csv(
+        uploaded_file, convert_options=pacsv.ConvertOptions(column_types=column_types or {})
+    )
+    with pq.ParquetWriter(path, reader.schema, compression="zstd") as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+
+
+def csv_to_parquet(uploaded_file) -> Any:
+    """Convert a CSV upload to a zstd-compressed Parquet file.
+
+    Uses pyarrow's streaming CSV reader, so only one block of rows is in
+    memory at a time. Column types are inferred from the first block; if a
+    later value does not fit, the file is converted again with every column
+    kept as text. Conversions are cached by source digest and returned as a
+    LocalFile: it opens on first read and analyze() closes it once the
+    request is sent, and its ``file_id`` lets ``file_digest`` memoize it too.
 
-        # Check for chart/graph keywords
-        if any(
-            keyword in lname
-            for keyword in ["_chart", "_graph", "_plot", "_image", "_visualization"]
+    Raises pyarrow.ArrowException for CSVs pyarrow cannot parse.
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+
+    digest = file_digest(uploaded_file)
+    conversions = get_parquet_conversions()
+    path = conversions.get(digest)
+    if path is None:
+        fd, path = tempfile.mkstemp(suffix=".parquet", prefix="grasper-")
+        os.close(fd)
+        try:
+            try:
+                _write_parquet(uploaded_file, path)
+            except pa.ArrowInvalid:
+                uploaded_file.seek(0)
+                names = pacsv.open_csv(uploaded_file).schema.names
+                _write_parquet(uploaded_file, path, {name: pa.string() for name in names})
+        except Exception:
+            os.remove(path)
+            raise
+        finally:
+            uploaded_file.seek(0)
+        conversions.put(digest, path)
+
+    out = LocalFile(path)
+    out.file_id = f"parquet:{digest}"
+    return out
+
+
+def convert_csv_parts(files: Dict[str, Tuple[str, Any, str]]) -> Dict[str, Tuple[str, Any, str]]:
+    """Replace CSV parts of a ``make_multipart_files`` dict with Parquet.
+
+    A CSV that cannot be converted is sent as is, with a warning.
+    """
+    import pyarrow as pa
+
+    out = {}
+    for key, (filename, content, mime) in files.items():
+        if key != "questions.txt" and filename.lower().endswith(".csv") and not isinstance(
+            content, (bytes, bytearray)
         ):
-            if isinstance(v, str):
-                images.append((k, v))
+            try:
+                pq_name = f"{filename[:-4]}.parquet"
+                out[pq_name] = (pq_name, csv_to_parquet(content), PARQUET_MIME)
                 continue
+            except pa.ArrowException as e:
+                st.warning(f"Sending {filename} as CSV: Parquet conversion failed ({e})")
+        out[key] = (filename, content, mime)
+    return out
+
+
+def decode_arrow_table(value: Any) -> Optional[pd.DataFrame]:
+    """Decode ``{"format": "arrow", "data": <base64 IPC stream>}`` tables.
+
+    Backends honouring ``X-Table-Format: arrow`` send large tables this way
+    so they are not expanded into JSON row dicts. Returns None otherwise.
+    """
+    if not (
+        isinstance(value, dict)
+        and value.get("format") == "arrow"
+        and isinstance(value.get("data"), (str, SpilledText))
+    ):
+        return None
+    import pyarrow.ipc as ipc
+
+    with ipc.open_stream(b64decode_value(value["data"])) as reader:
+        return reader.read_pandas()
+
+
+# ========== Column Profiling ==========
+
+PROFILE_CHUNK_ROWS = int(os.getenv("GRASPER_PROFILE_CHUNK_ROWS", "100000"))
+PROFILE_SAMPLE_SIZE = 10_000
+PROFILE_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+PROFILE_EXTENSIONS = (".csv", ".xls", ".xlsx", ".parquet")
+
+
+class HyperLogLog:
+    """Approximate distinct counter over pandas' vectorized 64-bit hashes.
+
+    With the default precision of 12 it uses 4 KB per column and has a
+    standard error of about 1.6%.
+    """
+
+    def __init__(self, precision: int = 12):
+        import numpy as np
+
+        self.p = precision
+        self.m = 1 << precision
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    def update(self, values: pd.Series) -> None:
+        import numpy as np
+        import pandas as pd
 
-        # Categorize other content
-        if isinstance(v, (int, float)):
-            metrics[k] = v
-        elif isinstance(v, str) and len(v) < 500:
-            metrics[k] = v
-        elif isinstance(v, list):
+        if values.empty:
+            return
+        hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+        idx = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - self.p)) - 1)
+        # Rank = position of the leftmost 1-bit in the remaining 64 - p bits
+        bit_length = np.zeros(len(rest), dtype=np.int64)
+        nonzero = rest > 0
+        bit_length[nonzero] = np.floor(
+            np.log2(rest[nonzero].astype(np.float64))).astype(np.int64) + 1
+        rank = (64 - self.p - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, idx, rank)
+
+    def count(self) -> int:
+        import numpy as np
+
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / np.sum(
+            np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * np.log(self.m / zeros)
+        return int(round(estimate))
+
+
+class _ColumnProfile:
+    """Running statistics for one column, fed chunk by chunk."""
+
+    def __init__(self, rng: np.random.Generator):
+        import numpy as np
+
+        self.dtype: Optional[str] = None
+        self.count = 0
+        self.nulls = 0
+        self.min: Any = None
+        self.max: Any = None
+        # Values that do not compare with each other (e.g. numbers and text)
+        # have no meaningful range; min/max stay None from then on
+        self.mixed = False
+        self.distinct = HyperLogLog()
+        self.rng = rng
+        # Bottom-k sample: keep the values with the k smallest random keys,
+        # which is a uniform sample of everything seen so far
+        self.sample = np.empty(0, dtype=np.float64)
+        self.sample_keys = np.empty(0, dtype=np.float64)
+
+    def update(self, series: pd.Series) -> None:
+        import numpy as np
+        import pandas as pd
+
+        dtype = str(series.dtype)
+        self.dtype = dtype if self.dtype in (None, dtype) else "object"
+        self.count += len(series)
+        self.nulls += int(series.isna().sum())
+        values = series.dropna()
+        if values.empty:
+            return
+        self.distinct.update(values)
+
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            self._sample(values.to_numpy(dtype=np.float64))
+        if self.mixed:
+            return
+        try:
+            chunk_min, chunk_max = values.min(), values.max()
+            self.min = chunk_min if self.min is None else min(self.min, chunk_min)
+            self.max = chunk_max if self.max is None else max(self.max, chunk_max)
+        except TypeError:
+            self.mixed, self.min, self.max = True, None, None
+
+    def _sample(self, values: np.ndarray) -> None:
+        import numpy as np
+
+        keys = self.rng.random(len(values))
+        sample = np.concatenate([self.sample, values])
+        sample_keys = np.concatenate([self.sample_keys, keys])
+        if len(sample) > PROFILE_SAMPLE_SIZE:
+            keep = np.argpartition(sample_keys, PROFILE_SAMPLE_SIZE)[:PROFILE_SAMPLE_SIZE]
+            sample, sample_keys = sample[keep], sample_keys[keep]
+        self.sample, self.sample_keys = sample, sample_keys
+
+    def summary(self) -> Dict[str, Any]:
+        import numpy as np
+
+        def plain(value: Any) -> Any:
+            if value is None:
+                return None
+            if hasattr(value, "item"):
+                value = value.item()
+            return value if isinstance(value, (int, float, str, bool)) else str(value)
+
+        out = {
+            "dtype": self.dtype,
+            "count": self.count,
+            "nulls": self.nulls,
+            "min": plain(self.min),
+            "max": plain(self.max),
+            "mixed_types": self.mixed,
+            "approx_distinct": min(self.distinct.count(), self.count - self.nulls),
+        }
+        if len(self.sample):
+            out["approx_quantiles"] = {
+                str(q): float(v)
+                for q, v in zip(PROFILE_QUANTILES, np.quantile(self.sample, PROFILE_QUANTILES))
+            }
+        return out
+
+
+def _iter_table_chunks(f, name: str):
+    """Yield DataFrame chunks of a tabular upload without loading it whole."""
+    import pandas as pd
+
+    if name.endswith(".csv"):
+        yield from pd.read_csv(f, chunksize=PROFILE_CHUNK_ROWS)
+    elif name.endswith(".xlsx"):
+        from openpyxl import load_workbook
+
+        sheet = load_workbook(f, read_only=True, data_only=True).active
+        rows = sheet.iter_rows(values_only=True)
+        header = [str(c) if c is not None else f"column_{i}"
+                  for i, c in enumerate(next(rows, ()))]
+        while True:
+            batch = list(islice(rows, PROFILE_CHUNK_ROWS))
+            if not batch:
+                break
+            yield pd.DataFrame(batch, columns=header).infer_objects()
+    elif name.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(f).iter_batches(batch_size=PROFILE_CHUNK_ROWS):
+            yield batch.to_pandas()
+    else:
+        # Legacy .xls has no streaming reader
+        yield pd.read_excel(f)
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def profile_table(digest: str, name: str, _uploaded_file) -> Dict[str, Any]:
+    """Stream a tabular upload once and summarize every column.
+
+    Memory is bounded by one chunk plus a fixed-size sketch per column, so
+    the cost does not grow with file size. Cached per file digest; the
+    sampling RNG is seeded from the digest so the profile is reproducible.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(int(digest[:16], 16))
+    columns: Dict[str, _ColumnProfile] = {}
+    rows = 0
+    f = _uploaded_file
+    f.seek(0)
+    try:
+        for chunk in _iter_table_chunks(f, name):
+            rows += len(chunk)
+            for col in chunk.columns:
+                key = str(col)
+                if key not in columns:
+                    columns[key] = _ColumnProfile(rng)
+                columns[key].update(chunk[col])
+    finally:
+        f.seek(0)
+    return {
+        "file": name,
+        "sha256": digest,
+        "rows": rows,
+        "columns": {k: v.summary() for k, v in columns.items()},
+    }
+
+
+def profile_uploads(uploaded_files) -> Dict[str, Any]:
+    """Profiles of all tabular uploads, keyed by file name."""
+    profiles = {}
+    for f in uploaded_files:
+        if f.name.lower().endswith(PROFILE_EXTENSIONS):
+            profiles[f.name] = profile_table(file_digest(f), f.name.lower(), f)
+    return profiles
+
+
+def show_profile(profile: Dict[str, Any]) -> None:
+    """Render a column profile as a table."""
+    import pandas as pd
+
+    st.caption(f"{profile['rows']:,} rows · {len(profile['columns'])} columns")
+    rows = []
+    for col, stats in profile["columns"].items():
+        quantiles = stats.get("approx_quantiles", {})
+        mixed = stats.get("mixed_types")
+        rows.append({
+            "column": col,
+            "dtype": stats["dtype"],
+            "nulls": stats["nulls"],
+            "distinct (approx)": stats["approx_distinct"],
+            "min": "(mixed types)" if mixed else str(stats["min"]),
+            "max": "(mixed types)" if mixed else str(stats["max"]),
+            "median (approx)": quantiles.get("0.5"),
+        })
+    st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+
+
+# ========== Result Cache ==========
+
+
+@st.cache_resource
+def get_result_cache() -> ResultCache:
+    """Process-wide result cache shared by all sessions."""
+    return ResultCache()
+
+
+# ========== Performance Traces ==========
+
+TRACE_REGISTRY_SIZE = 64
+
+
+@st.cache_resource
+def get_trace_registry() -> "OrderedDict[str, Trace]":
+    """Process-wide analysis traces, keyed by result id (newest last)."""
+    return OrderedDict()
+
+
+def remember_trace(result_id: str, trace: Trace) -> None:
+    registry = get_trace_registry()
+    registry[result_id] = trace
+    registry.move_to_end(result_id)
+    while len(registry) > TRACE_REGISTRY_SIZE:
+        registry.popitem(last=False)
+
+
+def render_trace_panel(traces: List[Trace]) -> None:
+    """Debug table of spans: phase, duration, offset and payload sizes."""
+    import pandas as pd
+
+    spans = [s for t in traces for s in t.spans]
+    if not spans:
+        return
+    parents = {s["span_id"]: s["parent_id"] for s in spans}
+
+    def depth(span_entry: Dict[str, Any]) -> int:
+        level, parent = 0, span_entry["parent_id"]
+        while parent in parents:
+            level, parent = level + 1, parents[parent]
+        return level
+
+    origin = min(s["start"] for s in spans)
+    rows = []
+    for s in sorted(spans, key=lambda s: s["start"]):
+        attrs = dict(s["attrs"])
+        size = attrs.pop("bytes", None)
+        rows.append({
+            "phase": "\u2003" * depth(s) + s["name"],
+            "ms": round(s["duration"] * 1000, 1),
+            "start ms": round((s["start"] - origin) * 1000, 1),
+            "bytes": size,
+            "details": ", ".join(f"{k}={v}" for k, v in attrs.items()),
+        })
+    with st.expander("Performance trace", expanded=True):
+        st.dataframe(
+            pd.DataFrame(rows).astype({"bytes": "Int64"}),
+            use_container_width=True,
+            hide_index=True,
+        )
+        note = f"trace {traces[0].trace_id[:12]}"
+        if TRACE_FILE:
+            note += f" · spans appended to {TRACE_FILE}"
+        st.caption(note)
+
+
+# Tables longer than this are paged instead of sent to the browser whole
+TABLE_PAGE_ROWS = int(os.getenv("GRASPER_TABLE_PAGE_ROWS", "1000"))
+# CSV exports are written this many rows at a time
+EXPORT_CHUNK_ROWS = int(os.getenv("GRASPER_EXPORT_CHUNK_ROWS", "100000"))
+EXPORT_FORMATS = {
+    "csv": ("Download CSV", "text/csv"),
+    "xlsx": (
+        "Download Excel",
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ),
+    "json": ("Download JSON", "application/json"),
+}
+NUMERIC_FILTER_RE = re.compile(r"^\s*(<=|>=|!=|==|=|<|>)\s*(-?[\d.]+(?:e-?\d+)?)\s*$", re.I)
+
+
+def rows_to_frame(rows: Any) -> pd.DataFrame:
+    """Build a frame from a result table in one columnar pass.
+
+    Lists of row dicts go through Arrow when it is installed, which infers
+    each column once instead of walking every row dict in Python; anything
+    Arrow cannot type (mixed-type columns, scalars) falls back to pandas.
+    """
+    import pandas as pd
+
+    if isinstance(rows, list) and rows and isinstance(rows[0], dict):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            pa = None
+        if pa is not None:
             try:
-                df = pd.DataFrame(v)
-                tables[k] = df
-            except Exception:
-                text_content[k] = v
-        elif isinstance(v, dict):
-            # Try to convert to DataFrame
+                return pa.Table.from_pylist(rows).to_pandas()
+            except (pa.ArrowException, TypeError, ValueError):
+                pass
+    return pd.DataFrame(rows)
+
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def result_frame(result_id: str, name: str, _table: Any) -> pd.DataFrame:
+    """The frame of one result table, built once per (result, table).
+
+    Shared by reruns and sessions without copying, so callers treat it as
+    read-only; sorting and filtering produce new frames (see table_view).
+    """
+    arrow_df = decode_arrow_table(_table)
+    if arrow_df is not None:
+        return arrow_df
+    return rows_to_frame(_table)
+
+
+def _filter_mask(series: pd.Series, text: str) -> pd.Series:
+    import pandas as pd
+
+    match = NUMERIC_FILTER_RE.match(text)
+    if match and pd.api.types.is_numeric_dtype(series):
+        op, value = match.group(1), float(match.group(2))
+        op = "==" if op == "=" else op
+        return {
+            "<": series.lt, "<=": series.le, ">": series.gt, ">=": series.ge,
+            "==": series.eq, "!=": series.ne,
+        }[op](value)
+    return series.astype(str).str.contains(text, case=False, regex=False, na=False)
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def table_view(
+    key: str,
+    sort_by: Any,
+    descending: bool,
+    filter_column: Any,
+    filter_text: str,
+    _df: pd.DataFrame,
+) -> Tuple[pd.DataFrame, Optional[str]]:
+    """Sort and filter a table on the server, once per distinct view.
+
+    ``filter_text`` matches case-insensitively as a substring, or compares
+    numeric columns when written like ``>100`` or ``<=5``. Returns the view
+    and a message when the sort could not be applied.
+    """
+    import pandas as pd
+
+    view = _df
+    if filter_text:
+        with span("table filter", rows=len(view)):
+            columns = [filter_column] if filter_column is not None else list(view.columns)
+            mask = pd.Series(False, index=view.index)
+            for column in columns:
+                mask |= _filter_mask(view[column], filter_text)
+            view = view[mask]
+    if sort_by is not None:
+        try:
+            with span("table sort", rows=len(view)):
+                view = view.sort_values(
+                    sort_by, ascending=not descending, kind="stable", na_position="last")
+        except TypeError:
+            return view, f"Cannot sort by {sort_by}: it mixes incomparable values."
+    return view, None
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def export_table(result_id: str, name: str, fmt: str, _df: pd.DataFrame) -> bytes:
+    """Serialize a result table, memoized per (result, table, format).
+
+    Only called from deferred download buttons, so nothing is serialized
+    until a user actually asks for the file. CSV is written in
+    EXPORT_CHUNK_ROWS slices, so no full-size intermediate string is built.
+    The time it takes is added to the result's trace.
+    """
+    trace = get_trace_registry().get(result_id) or Trace("export")
+    with trace.span("export", table=name, format=fmt, rows=len(_df)) as attrs:
+        if fmt == "csv":
+            buf = BytesIO()
+            for start in range(0, max(len(_df), 1), EXPORT_CHUNK_ROWS):
+                _df.iloc[start:start + EXPORT_CHUNK_ROWS].to_csv(
+                    buf, header=start == 0, index=False)
+            data = buf.getvalue()
+        elif fmt == "xlsx":
+            excel_buffer = BytesIO()
+            _df.to_excel(excel_buffer, index=False)
+            data = excel_buffer.getvalue()
+        else:
+            data = _df.to_json(orient="records", indent=2).encode("utf-8")
+        attrs["bytes"] = len(data)
+    return data
+
+
+def render_table(df: pd.DataFrame, key: str) -> None:
+    """Show a table; past TABLE_PAGE_ROWS, sorted and filtered server-side
+    and sent to the browser one page at a time."""
+    if len(df) <= TABLE_PAGE_ROWS:
+        st.dataframe(df, use_container_width=True)
+        return
+
+    columns = list(df.columns)
+    col_sort, col_order, col_column, col_filter = st.columns([2, 1, 2, 3])
+    sort_by = col_sort.selectbox(
+        "Sort by", [None] + columns, key=f"{key}_sort",
+        format_func=lambda c: "(unsorted)" if c is None else str(c),
+    )
+    descending = col_order.selectbox(
+        "Order", (False, True), key=f"{key}_desc",
+        format_func=lambda d: "Descending" if d else "Ascending",
+    )
+    filter_column = col_column.selectbox(
+        "Filter on", [None] + columns, key=f"{key}_fcol",
+        format_func=lambda c: "(any column)" if c is None else str(c),
+    )
+    filter_text = col_filter.text_input(
+        "Filter", key=f"{key}_filter", placeholder="text, or >100 / <=5 for numbers",
+    ).strip()
+    view, error = table_view(key, sort_by, descending, filter_column, filter_text, df)
+    if error:
+        st.warning(error)
+
+    pages = max(-(-len(view) // TABLE_PAGE_ROWS), 1)
+    # A narrower filter can leave the stored page past the end
+    if st.session_state.get(f"{key}_page", 1) > pages:
+        st.session_state[f"{key}_page"] = 1
+    page = st.number_input(
+        f"Page (1-{pages:,})", min_value=1, max_value=pages, value=1, key=f"{key}_page"
+    )
+    start = (page - 1) * TABLE_PAGE_ROWS
+    stop = min(start + TABLE_PAGE_ROWS, len(view))
+    shown = f"{len(view):,} of {len(df):,} rows" if len(view) != len(df) else f"{len(df):,} rows"
+    st.caption(f"Rows {min(start + 1, stop):,}-{stop:,} · {shown}")
+    st.dataframe(view.iloc[start:stop], use_container_width=True)
+
+
+def render_export_buttons(df: pd.DataFrame, result_id: str, name: str) -> None:
+    """Deferred download buttons: data is built only when clicked."""
+    for col, (fmt, (label, mime)) in zip(st.columns(len(EXPORT_FORMATS)), EXPORT_FORMATS.items()):
+        with col:
+            st.download_button(
+                label,
+                data=partial(export_table, result_id, name, fmt, df),
+                file_name=f"{name}.{fmt}",
+                mime=mime,
+                key=f"{fmt}_{result_id}_{name}",
+                on_click="ignore",
+            )
+
+
+def result_digest(parsed: Any) -> str:
+    """Content digest of a parsed result, stable across reruns.
+
+    Spilled strings are identified by their file rather than read back.
+    """
+    def default(value: Any) -> Any:
+        if isinstance(value, SpilledText):
+            return f"spilled:{value.path}:{value.offset}:{value.length}"
+        return f"{type(value).__name__}:{value!r}"
+
+    h = hashlib.sha256()
+    for chunk in json.JSONEncoder(sort_keys=True, default=default).iterencode(parsed):
+        h.update(chunk.encode("utf-8", "surrogatepass"))
+    return h.hexdigest()[:16]
+
+
+def display_results_dashboard(
+    parsed: Dict[str, Any], result_id: str = "", debug: bool = False
+):
+    """Display results in a modern dashboard layout.
+
+    ``result_id`` identifies the response being shown; it scopes widget keys,
+    memoized exports and decoded media so they survive reruns. ``debug``
+    adds per-item decode timings.
+    """
+    # A random fallback would miss every cache keyed on the id, every rerun
+    result_id = result_id or result_digest(parsed)
+
+    # Separate content types
+    with span("classify") as attrs:
+        sections = classify_result(parsed)
+        images = sections["images"]
+        media_files = sections["media"]
+        metrics = sections["metrics"]
+        text_content = sections["text"]
+        tables = {}
+
+        for k, v in sections["tables"].items():
+            if isinstance(v, dict) and v.get("format") == "arrow":
+                try:
+                    tables[k] = result_frame(result_id, k, v)
+                except Exception:
+                    text_content[k] = v
+                continue
             try:
-                df = pd.DataFrame(v)
-                tables[k] = df
+                tables[k] = result_frame(result_id, k, v)
             except Exception:
-                if len(str(v)) < 1000:
+                if isinstance(v, dict) and len(str(v)) < 1000:
                     metrics[k] = str(v)
                 else:
                     text_content[k] = v
-        else:
-            text_content[k] = v
+        attrs.update(metrics=len(metrics), tables=len(tables),
+                     media=len(media_files) + len(images), text=len(text_content))
 
     # Display metrics in cards
     if metrics:
@@ -351,43 +1124,20 @@ def display_results_dashboard(parsed: Dict[str, Any]):
         )
 
         for name, df in tables.items():
-            with st.expander(f"{name.replace('_', ' ').title()}", expanded=True):
-                st.dataframe(df, use_container_width=True)
+            # Track open state so collapsed tables are not sent to the browser
+            table_box = st.expander(
+                f"{name.replace('_', ' ').title()}",
+                expanded=True,
+                key=f"table_{result_id}_{name}",
+                on_change="rerun",
+            )
+            with table_box:
+                if table_box.open:
+                    with span("table render", table=name, rows=len(df), columns=len(df.columns)):
+                        render_table(df, key=f"table_{result_id}_{name}")
 
                 # Export options
-                col1, col2, col3 = st.columns(3)
-
-                with col1:
-                    csv = df.to_csv(index=False).encode("utf-8")
-                    st.download_button(
-                        "Download CSV",
-                        data=csv,
-                        file_name=f"{name}.csv",
-                        mime="text/csv",
-                        key=f"csv_{name}",
-                    )
-
-                with col2:
-                    excel_buffer = BytesIO()
-                    df.to_excel(excel_buffer, index=False)
-                    st.download_button(
-                        "Download Excel",
-                        data=excel_buffer.getvalue(),
-                        file_name=f"{name}.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                        key=f"excel_{name}",
-                    )
-
-                with col3:
-                    json_data = df.to_json(
-                        orient="records", indent=2).encode("utf-8")
-                    st.download_button(
-                        "Download JSON",
-                        data=json_data,
-                        file_name=f"{name}.json",
-                        mime="application/json",
-                        key=f"json_{name}",
-                    )
+                render_export_buttons(df, result_id, name)
 
     # Display media content
     if media_files or images:
@@ -396,17 +1146,17 @@ def display_results_dashboard(parsed: Dict[str, Any]):
         )
 
         # Display media files (audio, video, images with data URIs)
-        for name, data in media_files:
+        for name, mime_type, payload in media_files:
             st.markdown('<div class="media-container">',
                         unsafe_allow_html=True)
-            render_media_content(name, data)
+            render_media_content(name, mime_type, payload, result_id, debug)
             st.markdown("</div>", unsafe_allow_html=True)
 
         # Display base64 images
-        for name, data in images:
+        for name, mime_type, payload in images:
             st.markdown('<div class="media-container">',
                         unsafe_allow_html=True)
-            render_media_content(name, data)
+            render_media_content(name, mime_type, payload, result_id, debug)
             st.markdown("</div>", unsafe_allow_html=True)
 
     # Display text content
@@ -424,22 +1174,1048 @@ def display_results_dashboard(parsed: Dict[str, Any]):
                     st.text(str(content))
 
 
+# ========== Analysis History Store ==========
+
+HISTORY_DB_PATH = os.getenv(
+    "GRASPER_HISTORY_DB", os.path.join(os.getcwd(), ".grasper", "history.sqlite3"))
+# Compressed bytes of results kept per history owner; oldest entries go first
+HISTORY_BYTES_PER_SESSION = int(
+    os.getenv("GRASPER_HISTORY_BYTES", str(32 * 1024 * 1024)))
+
+
+class HistoryStore:
+    """SQLite-backed analysis history, one row per finished analysis.
+
+    Results are stored zlib-compressed; only the lightweight metadata from
+    ``list_entries`` is meant to live in session state, and a result is
+    decompressed by ``load_result`` only when it is actually shown. Each
+    session keeps at most ``budget`` compressed bytes of results.
+
+    Rows are keyed by a history owner key (``history_owner()``), never by
+    the backend session id, and every read is scoped to one owner.
+    """
+
+    def __init__(self, path: str = HISTORY_DB_PATH, budget: int = HISTORY_BYTES_PER_SESSION):
+        self.path = path
+        self.budget = budget
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS analyses (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    questions TEXT NOT NULL,
+                    files TEXT NOT NULL,
+                    result BLOB NOT NULL,
+                    raw_bytes INTEGER NOT NULL,
+                    stored_bytes INTEGER NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS analyses_session "
+                "ON analyses (session_id, created)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(analyses)")}
+            if "result_keys" not in columns:
+                conn.execute(
+                    "ALTER TABLE analyses ADD COLUMN result_keys TEXT NOT NULL DEFAULT ''")
+            self.fts = self._create_search_index(conn)
+
+    @staticmethod
+    def _create_search_index(conn: sqlite3.Connection) -> bool:
+        """Create the FTS5 index over questions, file names and result keys.
+
+        Kept in sync by triggers. Returns False when this SQLite build has no
+        FTS5, in which case ``search`` falls back to LIKE scans.
+        """
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'analyses_fts'").fetchone()
+        try:
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS analyses_fts USING fts5("
+                "questions, files, result_keys, content='analyses', content_rowid='id')"
+            )
+        except sqlite3.OperationalError:
+            return False
+        conn.executescript(
+            """
+            CREATE TRIGGER IF NOT EXISTS analyses_ai AFTER INSERT ON analyses BEGIN
+                INSERT INTO analyses_fts (rowid, questions, files, result_keys)
+                VALUES (new.id, new.questions, new.files, new.result_keys);
+            END;
+            CREATE TRIGGER IF NOT EXISTS analyses_ad AFTER DELETE ON analyses BEGIN
+                INSERT INTO analyses_fts (analyses_fts, rowid, questions, files, result_keys)
+                VALUES ('delete', old.id, old.questions, old.files, old.result_keys);
+            END;
+            """
+        )
+        if not exists:
+            conn.execute("INSERT INTO analyses_fts (analyses_fts) VALUES ('rebuild')")
+        return True
+
+    def _connect(self) -> sqlite3.Connection:
+        # One short-lived connection per call keeps this safe across threads
+        return closing_connection(sqlite3.connect(self.path, timeout=30))
+
+    def add(
+        self, session_id: str, questions_text: str, result: Any, file_names: List[str]
+    ) -> int:
+        # Compressed as it is encoded, so spilled strings are never joined
+        compressor = zlib.compressobj(6)
+        blobs, raw_bytes = [], 0
+        for chunk in iter_json(result):
+            data = chunk.encode("utf-8")
+            raw_bytes += len(data)
+            blobs.append(compressor.compress(data))
+        blobs.append(compressor.flush())
+        blob = b"".join(blobs)
+        with self._connect() as conn:
+            cur = conn.execute(
+                "INSERT INTO analyses (session_id, created, questions, files, "
+                "result, raw_bytes, stored_bytes, result_keys) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (session_id, time.time(), questions_text, json.dumps(file_names),
+                 blob, raw_bytes, len(blob), " ".join(result_keys(result))),
+            )
+            entry_id = cur.lastrowid
+            self._enforce_budget(conn, session_id)
+        return entry_id
+
+    def _enforce_budget(self, conn: sqlite3.Connection, session_id: str) -> None:
+        """Drop a session's oldest results beyond its byte budget (newest is kept)."""
+        rows = conn.execute(
+            "SELECT id, stored_bytes FROM analyses WHERE session_id = ? "
+            "ORDER BY created DESC, id DESC",
+            (session_id,),
+        ).fetchall()
+        total = 0
+        stale = []
+        for i, (entry_id, size) in enumerate(rows):
+            total += size
+            if i and total > self.budget:
+                stale.append((entry_id,))
+        if stale:
+            conn.executemany("DELETE FROM analyses WHERE id = ?", stale)
+
+    _META_COLUMNS = "a.id, a.session_id, a.created, a.questions, a.files, a.raw_bytes, a.stored_bytes"
+
+    @staticmethod
+    def _to_meta(rows) -> List[Dict[str, Any]]:
+        return [
+            {
+                "id": entry_id,
+                "session_id": session_id,
+                "timestamp": created,
+                "questions": questions_text,
+                "files": json.loads(files),
+                "raw_bytes": raw_bytes,
+                "stored_bytes": stored_bytes,
+            }
+            for entry_id, session_id, created, questions_text, files, raw_bytes, stored_bytes in rows
+        ]
+
+    def list_entries(self, session_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """Metadata (no results) for a session, newest first."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT {self._META_COLUMNS} FROM analyses a WHERE a.session_id = ? "
+                "ORDER BY a.created DESC, a.id DESC LIMIT ?",
+                (session_id, limit),
+            ).fetchall()
+        return self._to_meta(rows)
+
+    def search(self, query: str, session_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """Best matches for ``query`` over one owner's questions, file names and result keys.
+
+        Every word is matched as a prefix and all words must match.
+        """
+        words = re.findall(r"\w+", query.lower())
+        if not words:
+            return []
+        session_filter = "AND a.session_id = ?"
+        params: List[Any] = [session_id]
+
+        with self._connect() as conn:
+            if self.fts:
+                match = " AND ".join(f'"{w}"*' for w in words)
+                rows = conn.execute(
+                    f"SELECT {self._META_COLUMNS} FROM analyses_fts "
+                    "JOIN analyses a ON a.id = analyses_fts.rowid "
+                    f"WHERE analyses_fts MATCH ? {session_filter} "
+                    "ORDER BY bm25(analyses_fts), a.created DESC LIMIT ?",
+                    [match, *params, limit],
+                ).fetchall()
+            else:
+                like = " AND ".join(
+                    "(a.questions || ' ' || a.files || ' ' || a.result_keys) LIKE ?"
+                    for _ in words
+                )
+                rows = conn.execute(
+                    f"SELECT {self._META_COLUMNS} FROM analyses a WHERE {like} "
+                    f"{session_filter} ORDER BY a.created DESC LIMIT ?",
+                    [*(f"%{w}%" for w in words), *params, limit],
+                ).fetchall()
+        return self._to_meta(rows)
+
+    def load_result(self, entry_id: int, session_id: str) -> Any:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT result FROM analyses WHERE id = ? AND session_id = ?",
+                (entry_id, session_id),
+            ).fetchone()
+        return None if row is None else json.loads(zlib.decompress(row[0]))
+
+
+def result_keys(result: Any, limit: int = 200) -> List[str]:
+    """Keys of a result and of its (possibly JSON-encoded) answer, for search."""
+    keys: List[str] = []
+    stack = [result]
+    while stack and len(keys) < limit:
+        value = stack.pop()
+        if isinstance(value, SpilledText):
+            value = value.parsed
+        if isinstance(value, str) and value.lstrip().startswith("{"):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                continue
+        if isinstance(value, dict):
+            for k, v in value.items():
+                keys.append(str(k))
+                if k in ("answers", "answer"):
+                    stack.append(v)
+    return keys[:limit]
+
+
+@contextmanager
+def closing_connection(conn: sqlite3.Connection):
+    """Commit (or roll back) and always close a sqlite3 connection."""
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+@st.cache_resource
+def get_history_store() -> HistoryStore:
+    """Process-wide history store shared by all sessions."""
+    return HistoryStore()
+
+
+HISTORY_TOKEN_RE = re.compile(r"[A-Za-z0-9_-]{43}")
+
+
+def history_owner(token: str) -> str:
+    """History store key for a URL history token.
+
+    It is the token's SHA-256, so the database never holds a token that
+    would unlock the history.
+    """
+    return hashlib.sha256(token.encode("ascii")).hexdigest()
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def load_history_result(entry_id: int, owner: str) -> Any:
+    """Decompress one of ``owner``'s stored results; memoized so reopening is free."""
+    return get_history_store().load_result(entry_id, owner)
+
+
+def record_analysis(questions_text: str, result: Any, file_names: List[str]) -> None:
+    """Store a finished analysis in the history store.
+
+    Only metadata is kept in session state; the result itself lives in the
+    store and is loaded when its history entry is opened.
+    """
+    store = get_history_store()
+    store.add(st.session_state.history_owner, questions_text, result, file_names)
+    st.session_state.analysis_history = store.list_entries(st.session_state.history_owner)
+
+
+def render_analysis_result(
+    result: Any, show_raw: bool = False, result_id: str = "", debug: bool = False
+) -> None:
+    """Render a response from /api/analyze_data.
+
+    ``result_id`` (the result cache key) scopes widget keys and exports.
+    The render is always timed (its spans feed the phase metrics); debug
+    mode also shows the analysis and render spans below the result.
+    """
+    trace = get_trace_registry().get(result_id)
+    render_trace = Trace("render", trace.trace_id if trace else None)
+    with render_trace.span("render"):
+        _render_answers(result, show_raw, result_id, debug)
+    if debug:
+        render_trace_panel([t for t in (trace, render_trace) if t is not None])
+
+
+def _render_answers(result: Any, show_raw: bool, result_id: str, debug: bool) -> None:
+    if show_raw:
+        with st.expander("Raw API Response", expanded=False):
+            st.json(result)
+
+    # Process and display structured results
+    with span("answer parse"):
+        answers, answer_content, parsed_data = parse_answers(result)
+    if not answers:
+        return
+
+    # Show generated code if available
+    if isinstance(answers, dict) and "generated_code" in answers:
+        code = answers["generated_code"]
+        if code:
+            with st.expander("Generated Python Code", expanded=False):
+                # Ensure code is a string before displaying/downloading
+                code_str = code if isinstance(
+                    code, str) else json.dumps(code, indent=2)
+                st.code(code_str, language="python")
+                st.download_button(
+                    "Download Code",
+                    data=code_str.encode("utf-8"),
+                    file_name="analysis_code.py",
+                    mime="text/x-python",
+                )
+
+    # Display main results
+    arrow_df = None
+    if isinstance(parsed_data, dict):
+        try:
+            arrow_df = decode_arrow_table(parsed_data)
+        except Exception:
+            arrow_df = None
+
+    if arrow_df is not None:
+        st.dataframe(arrow_df, use_container_width=True)
+    elif parsed_data:
+        if isinstance(parsed_data, list):
+            try:
+                df = result_frame(result_id, "analysis_results", parsed_data)
+                with span("table render", table="analysis_results", rows=len(df)):
+                    render_table(df, key=f"results_{result_id}")
+
+                st.download_button(
+                    "Download Results as CSV",
+                    data=partial(export_table, result_id, "analysis_results", "csv", df),
+                    file_name="analysis_results.csv",
+                    mime="text/csv",
+                    on_click="ignore",
+                )
+            except:
+                st.json(parsed_data)
+        else:
+            display_results_dashboard(parsed_data, result_id, debug)
+    else:
+        st.markdown("### Analysis Results")
+        st.write(answer_content)
+
+
+# ========== Background Analysis Jobs ==========
+
+JOB_WORKERS = int(os.getenv("GRASPER_JOB_WORKERS", "8"))
+JOB_TTL_SECONDS = int(os.getenv("GRASPER_JOB_TTL", "3600"))
+# Behind a trusted reverse proxy (or Vercel), the header it appends the
+# client address to, e.g. X-Forwarded-For. Unset, the socket peer is the
+# client, so behind a proxy every user would share the proxy's rate limit.
+ADMISSION_CLIENT_HEADER = os.getenv("GRASPER_ADMISSION_CLIENT_HEADER", "")
+
+
+def admission_client_id() -> str:
+    """Identity the admission controller rate-limits under.
+
+    The client address the server sees, not anything in the URL or session:
+    opening fresh sessions must not buy a fresh token bucket (queues stay
+    per session, for fairness). With GRASPER_ADMISSION_CLIENT_HEADER set, the
+    last address the proxy appended to that header is used. Falls back to
+    the session id where no address is known (local runs).
+    """
+    address = None
+    if ADMISSION_CLIENT_HEADER:
+        forwarded = st.context.headers.get(ADMISSION_CLIENT_HEADER) or ""
+        address = forwarded.rsplit(",", 1)[-1].strip()
+    address = address or st.context.ip_address
+    if address:
+        return f"client:{address}"
+    return f"session:{st.session_state.session_id}"
+
+
+@dataclass
+class AnalysisJob:
+    """State of one analysis running off the Streamlit script thread.
+
+    Workers only ever assign whole attributes, so the page can read a job
+    without locking; ``partial`` is replaced rather than mutated in place.
+    """
+
+    job_id: str
+    questions: str
+    file_names: List[str]
+    session_id: str = "default"
+    client_id: str = "default"
+    status: str = "queued"  # queued | uploading | waiting | downloading | done | failed
+    progress: int = 0
+    message: str = "Queued..."
+    partial: Optional[Dict[str, Any]] = None
+    result: Any = None
+    error: Optional[str] = None
+    remote_job_id: Optional[str] = None
+    cache_key: Optional[str] = None
+    trace: Optional[Trace] = None
+    created: float = field(default_factory=time.time)
+    finished: Optional[float] = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+
+@st.cache_resource
+def get_job_executor() -> ThreadPoolExecutor:
+    """Process-wide worker pool that runs analyze requests for all sessions."""
+    return ThreadPoolExecutor(
+        max_workers=JOB_WORKERS, thread_name_prefix="grasper-job")
+
+
+@st.cache_resource
+def get_job_registry() -> Dict[str, AnalysisJob]:
+    """Process-wide job table, keyed by job id."""
+    return {}
+
+
+def _snapshot_parts(files: Dict[str, Any]) -> Dict[str, Any]:
+    """Give a job its own copy of every in-memory upload part.
+
+    The script thread keeps seeking and reading the session's UploadedFile
+    objects (previews, profiles, questions.txt), so a worker must not stream
+    them. Each copy is a BytesIO over the upload's bytes, taken here on the
+    script thread; ``getvalue()`` does not move the original's position.
+    Files on disk (converted Parquet) are per request and stay as they are.
+    """
+    out = {}
+    for key, (filename, content, mime) in files.items():
+        if isinstance(content, BytesIO):
+            data = content.getvalue()
+            view = BytesIO(data)
+            view.name, view.type, view.size = filename, mime, len(data)
+            file_id = getattr(content, "file_id", None)
+            if file_id:
+                view.file_id = file_id
+            content = view
+        out[key] = (filename, content, mime)
+    return out
+
+
+def _run_analysis_job(
+    job: AnalysisJob,
+    files: Dict[str, Any],
+    timeout: int,
+    cache_key: Optional[str] = None,
+    compression: Optional[str] = None,
+) -> None:
+    """Worker body: run the analysis and mirror its progress onto ``job``."""
+    import requests
+
+    def on_progress(**update) -> None:
+        for name, value in update.items():
+            setattr(job, name, value)
+
+    trace = job.trace or Trace("analysis")
+    try:
+        with trace.span("request"):
+            job.result = analyze(files, timeout, compression, on_progress=on_progress,
+                                 session_id=job.session_id, client_id=job.client_id)
+        job.status = "done"
+    except AnalysisError as e:
+        job.error = str(e)
+        job.status = "failed"
+    except requests.exceptions.Timeout:
+        job.error = "Request timeout. Try increasing timeout in settings."
+        job.status = "failed"
+    except requests.exceptions.ConnectionError:
+        job.error = "Connection failed. Check if API server is running."
+        job.status = "failed"
+    except Exception as e:
+        job.error = f"Unexpected error: {str(e)}"
+        job.status = "failed"
+    finally:
+        if job.status == "done":
+            if cache_key:
+                get_result_cache().put(cache_key, job.result)
+            job.progress, job.message = 100, "Analysis completed successfully!"
+        job.finished = time.time()
+
+
+def submit_analysis_job(
+    files: Dict[str, Any],
+    questions_text: str,
+    file_names: List[str],
+    timeout: int,
+    cache_key: Optional[str] = None,
+    compression: Optional[str] = None,
+    trace: Optional[Trace] = None,
+    session_id: str = "default",
+    client_id: str = "default",
+) -> str:
+    """Queue an analysis on the shared worker pool and return its job id."""
+    registry = get_job_registry()
+    now = time.time()
+    for stale_id in [
+        jid for jid, j in list(registry.items())
+        if j.finished and now - j.finished > JOB_TTL_SECONDS
+    ]:
+        registry.pop(stale_id, None)
+
+    job = AnalysisJob(
+        job_id=str(uuid.uuid4()),
+        questions=questions_text,
+        file_names=file_names,
+        session_id=session_id,
+        client_id=client_id,
+        cache_key=cache_key,
+        trace=trace,
+    )
+    registry[job.job_id] = job
+    get_job_executor().submit(
+        _run_analysis_job, job, _snapshot_parts(files), timeout, cache_key, compression)
+    return job.job_id
+
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def render_job_status() -> None:
+    """Poll the active job; only this fragment reruns while it is in flight."""
+    job_id = st.session_state.get("active_job_id")
+    job = get_job_registry().get(job_id) if job_id else None
+    if job is None:
+        st.session_state.pop("active_job_id", None)
+        return
+
+    if job.is_finished:
+        get_job_registry().pop(job_id, None)
+        st.session_state.pop("active_job_id", None)
+        st.session_state.finished_job = job
+        st.rerun()
+
+    st.progress(job.progress)
+    st.markdown(
+        f'<div class="status-info">{job.message}</div>', unsafe_allow_html=True
+    )
+    elapsed = time.time() - job.created
+    st.caption(f"Job {job.job_id[:8]} · {job.status} · {elapsed:.0f}s elapsed")
+    if job.partial:
+        with st.expander("Partial results", expanded=True):
+            display_results_dashboard(job.partial, f"{job.job_id}-partial")
+
+
+# ========== Batch Analysis ==========
+
+BATCH_MAX_CONCURRENCY = int(os.getenv("GRASPER_BATCH_MAX_CONCURRENCY", "8"))
+# Threads running batch items, shared by all batches of the process
+BATCH_WORKERS = int(os.getenv("GRASPER_BATCH_WORKERS", "16"))
+
+
+@dataclass
+class BatchItem:
+    """One question block of a batch and its outcome."""
+
+    index: int
+    questions: str
+    status: str = "queued"  # queued | running | done | cached | failed
+    attempts: int = 0
+    latency: Optional[float] = None
+    result: Any = None
+    error: Optional[str] = None
+    cache_key: Optional[str] = None
+
+
+@dataclass
+class BatchJob:
+    """Many question blocks analysed against one shared set of files."""
+
+    batch_id: str
+    items: List[BatchItem]
+    file_names: List[str]
+    concurrency: int
+    session_id: str = "default"
+    client_id: str = "default"
+    created: float = field(default_factory=time.time)
+    finished: Optional[float] = None
+
+    @property
+    def done_count(self) -> int:
+        return sum(item.status in ("done", "cached", "failed") for item in self.items)
+
+
+@st.cache_resource
+def get_batch_registry() -> Dict[str, BatchJob]:
+    """Process-wide batch table, keyed by batch id."""
+    return {}
+
+
+@st.cache_resource
+def get_batch_executor() -> ThreadPoolExecutor:
+    """Process-wide worker pool that runs the items of every batch."""
+    return ThreadPoolExecutor(
+        max_workers=BATCH_WORKERS, thread_name_prefix="grasper-batch")
+
+
+def _shared_file_views(uploaded_files) -> List[Any]:
+    """Snapshot uploads once so concurrent requests can read them safely.
+
+    Each request gets its own BytesIO over the same immutable bytes, so the
+    batch holds a single copy of every file however many requests run.
+    """
+    snapshots = []
+    for f in uploaded_files:
+        if f.name.lower() == "questions.txt":
+            continue
+        snapshots.append((f.name, f.type, getattr(f, "file_id", None), f.getvalue()))
+    return snapshots
+
+
+def _views_for_request(snapshots) -> List[Any]:
+    views = []
+    for name, mime, file_id, data in snapshots:
+        view = BytesIO(data)
+        view.name, view.type, view.size = name, mime, len(data)
+        if file_id:
+            view.file_id = file_id
+        views.append(view)
+    return views
+
+
+def _run_batch_item(
+    item: BatchItem,
+    snapshots,
+    timeout: int,
+    retries: int,
+    compression: Optional[str],
+    use_cache: bool,
+    session_id: str = "default",
+    client_id: str = "default",
+) -> None:
+    """Run one batch item, retrying backend 5xx responses up to ``retries`` times.
+
+    That is the only retry layer: the HTTP session already retries failed
+    connections and never replays the POST, timeouts are not retried, and
+    shed requests fail at once.
+    """
+    def on_progress(status: Optional[str] = None, **_) -> None:
+        # Waiting for a backend slot shows as queued, anything after as running
+        if status:
+            item.status = "queued" if status == "queued" else "running"
+
+    files = make_multipart_files(_views_for_request(snapshots), item.questions, False)
+    item.cache_key = result_cache_key(files)
+    if use_cache:
+        cached = get_result_cache().get(item.cache_key)
+        if cached is not None:
+            item.result, item.status, item.latency = cached, "cached", 0.0
+            return
+
+    item.status = "running"
+    start = time.perf_counter()
+    while True:
+        item.attempts += 1
+        try:
+            item.result = analyze(files, timeout, compression, on_progress=on_progress,
+                                  session_id=session_id, client_id=client_id)
+            item.status = "done"
+            get_result_cache().put(item.cache_key, item.result)
+            break
+        except AdmissionRejected as e:
+            item.error, item.status = str(e), "failed"
+            break
+        except AnalysisError as e:
+            item.error = str(e)
+            if (e.status_code or 0) < 500 or item.attempts > retries:
+                item.status = "failed"
+                break
+        except Exception as e:
+            item.error, item.status = f"{type(e).__name__}: {e}", "failed"
+            break
+        time.sleep(HTTP_BACKOFF_FACTOR * 2 ** (item.attempts - 1))
+    item.latency = time.perf_counter() - start
+
+
+def _run_batch(
+    batch: BatchJob,
+    snapshots,
+    timeout: int,
+    retries: int,
+    compression: Optional[str],
+    use_cache: bool,
+) -> None:
+    """Run the first item alone, then fan the rest out concurrently.
+
+    The first request uploads the data files; with upload deduplication the
+    remaining requests then only reference them by digest. Items run on the
+    shared batch pool, at most ``batch.concurrency`` of them at a time.
+    """
+    args = (snapshots, timeout, retries, compression, use_cache,
+            batch.session_id, batch.client_id)
+    slots = threading.Semaphore(batch.concurrency)
+
+    def run_item(item: BatchItem) -> None:
+        try:
+            _run_batch_item(item, *args)
+        finally:
+            slots.release()
+
+    try:
+        if batch.items:
+            _run_batch_item(batch.items[0], *args)
+        futures = []
+        for item in batch.items[1:]:
+            slots.acquire()
+            futures.append(get_batch_executor().submit(run_item, item))
+        for future in futures:
+            future.result()
+    finally:
+        batch.finished = time.time()
+
+
+def submit_batch(
+    question_blocks: List[str],
+    uploaded_files,
+    concurrency: int,
+    retries: int,
+    timeout: int,
+    compression: Optional[str] = None,
+    use_cache: bool = True,
+    session_id: str = "default",
+    client_id: str = "default",
+) -> str:
+    """Queue a batch on the shared worker pool and return its id."""
+    registry = get_batch_registry()
+    now = time.time()
+    for stale_id in [
+        bid for bid, b in list(registry.items())
+        if b.finished and now - b.finished > JOB_TTL_SECONDS
+    ]:
+        registry.pop(stale_id, None)
+
+    batch = BatchJob(
+        batch_id=str(uuid.uuid4()),
+        items=[BatchItem(index=i, questions=q) for i, q in enumerate(question_blocks)],
+        file_names=[f.name for f in uploaded_files],
+        concurrency=max(1, min(concurrency, BATCH_MAX_CONCURRENCY)),
+        session_id=session_id,
+        client_id=client_id,
+    )
+    registry[batch.batch_id] = batch
+    get_job_executor().submit(
+        _run_batch, batch, _shared_file_views(uploaded_files), timeout, retries,
+        compression, use_cache,
+    )
+    return batch.batch_id
+
+
+def batch_summary(batch: BatchJob) -> pd.DataFrame:
+    """One row per question block, for display and export."""
+    import pandas as pd
+
+    rows = []
+    for item in batch.items:
+        answer = item.result
+        if isinstance(answer, dict):
+            answer = answer.get("answers", answer)
+            if isinstance(answer, dict) and "answer" in answer:
+                answer = answer["answer"]
+        rows.append({
+            "#": item.index + 1,
+            "questions": item.questions,
+            "status": item.status,
+            "attempts": item.attempts,
+            "latency_s": None if item.latency is None else round(item.latency, 2),
+            "answer": (
+                answer if isinstance(answer, str) or answer is None
+                else json.dumps(answer, default=json_default)
+            ),
+            "error": item.error if item.status == "failed" else None,
+        })
+    return pd.DataFrame(rows)
+
+
+def render_batch(batch: BatchJob) -> None:
+    """Progress, per-item table and combined exports for a batch."""
+    done = batch.done_count
+    st.progress(int(100 * done / max(len(batch.items), 1)))
+    failed = sum(item.status == "failed" for item in batch.items)
+    elapsed = (batch.finished or time.time()) - batch.created
+    st.caption(
+        f"Batch {batch.batch_id[:8]} · {done}/{len(batch.items)} finished · "
+        f"{failed} failed · concurrency {batch.concurrency} · {elapsed:.0f}s elapsed"
+    )
+    summary = batch_summary(batch)
+    st.dataframe(summary, use_container_width=True, hide_index=True)
+    if batch.finished:
+        col_csv, col_json = st.columns(2)
+        with col_csv:
+            st.download_button(
+                "Download batch CSV",
+                data=lambda: summary.to_csv(index=False).encode("utf-8"),
+                file_name="batch_results.csv",
+                mime="text/csv",
+                key=f"batch_csv_{batch.batch_id}",
+                on_click="ignore",
+            )
+        with col_json:
+            st.download_button(
+                "Download batch JSON",
+                data=lambda: json.dumps(
+                    [{"questions": i.questions, "status": i.status, "latency_s": i.latency,
+                      "result": i.result, "error": i.error} for i in batch.items],
+                    indent=2,
+                    default=json_default,
+                ).encode("utf-8"),
+                file_name="batch_results.json",
+                mime="application/json",
+                key=f"batch_json_{batch.batch_id}",
+                on_click="ignore",
+            )
+
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def render_batch_status() -> None:
+    """Poll the running batch; only this fragment reruns while it works."""
+    batch = get_batch_registry().get(st.session_state.get("active_batch_id", ""))
+    if batch is None:
+        st.session_state.pop("active_batch_id", None)
+        return
+    if batch.finished:
+        st.session_state.pop("active_batch_id", None)
+        st.session_state.finished_batch_id = batch.batch_id
+        st.rerun()
+    render_batch(batch)
+
+
+# ========== Metrics ==========
+
+# Sessions seen within this many seconds count as active
+SESSION_IDLE_SECONDS = int(os.getenv("GRASPER_SESSION_IDLE", "300"))
+
+ACTIVE_SESSIONS = METRICS.gauge(
+    "grasper_active_sessions", "Browser sessions that reran the app recently.")
+RERUNS = METRICS.counter(
+    "grasper_reruns_total",
+    "Runs of the whole app (scope=\"app\") and of each page section.", ("scope",))
+JOBS = METRICS.gauge("grasper_jobs", "Background analysis jobs by status.", ("status",))
+BATCH_ITEMS = METRICS.gauge(
+    "grasper_batch_items", "Question blocks of live batches by status.", ("status",))
+RESULT_CACHE_SIZE = METRICS.gauge(
+    "grasper_result_cache_size", "Result cache memory tier size.", ("unit",))
+PROCESS_RSS = METRICS.gauge(
+    "grasper_process_resident_memory_bytes", "Resident memory of this server process.")
+RSS_PER_SESSION = METRICS.gauge(
+    "grasper_resident_memory_per_session_bytes",
+    "Resident memory divided by active sessions.")
+
+
+@st.cache_resource
+def get_session_activity() -> Dict[str, float]:
+    """Process-wide map of session id to last rerun time."""
+    return {}
+
+
+def touch_session(session_id: str, scope: str = "app") -> None:
+    get_session_activity()[session_id] = time.time()
+    RERUNS.inc(scope=scope)
+
+
+def _process_rss_bytes() -> int:
+    try:
+        with open("/proc/self/status", encoding="ascii") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+
+    # ru_maxrss is the peak, in KB on Linux; good enough where /proc is missing
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _collect_app_metrics() -> None:
+    activity = get_session_activity()
+    cutoff = time.time() - SESSION_IDLE_SECONDS
+    for session_id, seen in list(activity.items()):
+        if seen < cutoff:
+            activity.pop(session_id, None)
+    active = len(activity)
+    ACTIVE_SESSIONS.set(active)
+
+    JOBS.clear()
+    for status, count in Counter(j.status for j in list(get_job_registry().values())).items():
+        JOBS.set(count, status=status)
+    BATCH_ITEMS.clear()
+    live_items = Counter(
+        item.status
+        for batch in list(get_batch_registry().values()) if batch.finished is None
+        for item in batch.items
+    )
+    for status, count in live_items.items():
+        BATCH_ITEMS.set(count, status=status)
+
+    cache = get_result_cache().summary()
+    RESULT_CACHE_SIZE.set(cache["entries"], unit="entries")
+    RESULT_CACHE_SIZE.set(cache["bytes"], unit="bytes")
+    rss = _process_rss_bytes()
+    PROCESS_RSS.set(rss)
+    RSS_PER_SESSION.set(rss / active if active else 0)
+
+
+@st.cache_resource
+def start_metrics():
+    """Register the app's scrape-time gauges and start the /metrics server once."""
+    METRICS.on_collect("frontend", _collect_app_metrics)
+    if METRICS_PORT:
+        return start_metrics_server(int(METRICS_PORT))
+    return None
+
+
+start_metrics()
+
+
 # ========== Main UI ==========
 
-# Sidebar Configuration
-with st.sidebar:
+# The page is made of keyed fragments: a widget interaction reruns only the
+# section it lives in. Sections read each other's inputs from session state,
+# and a change another section renders from reruns that section too.
+
+LOCAL_QUESTIONS_PATH = os.path.join(os.getcwd(), "questions.txt")
+EXAMPLE_QUESTIONS = (
+    "- What are the key insights from this data?\n"
+    "- Show top 10 contributors by value\n"
+    "- Plot trends over time"
+)
+
+
+def _rerun_sections(*keys: str) -> None:
+    """Widget callback: rerun these sections instead of just the caller's."""
+    st.rerun(list(keys))
+
+
+def questions_to_send(text: str) -> str:
+    """The editor's text, or the local questions.txt when the editor is empty.
+
+    The local file is only used when no questions.txt was uploaded. Raises
+    OSError if it exists but cannot be read.
+    """
+    if text.strip() or st.session_state.get("questions_from_file") is not None:
+        return text
+    if not os.path.exists(LOCAL_QUESTIONS_PATH):
+        return text
+    with open(LOCAL_QUESTIONS_PATH, "r", encoding="utf-8") as qf:
+        return qf.read() or text
+
+
+def request_analysis() -> None:
+    """Start Analysis callback: hand the request to the results section."""
+    try:
+        questions = questions_to_send(st.session_state.get("questions_area", ""))
+    except OSError:
+        questions = st.session_state.get("questions_area", "")
+    compression_choice = st.session_state.get("compression_choice", "none")
+    st.session_state.analysis_request = {
+        "questions": questions,
+        "uploaded_files": list(st.session_state.get("uploaded_files") or []),
+        "use_questions_file": st.session_state.get("use_questions_file", False),
+        "compression": None if compression_choice == "none" else compression_choice,
+        "convert_csv": st.session_state.get("convert_csv", False),
+        "send_profiles": st.session_state.get("send_profiles", False),
+    }
+    st.rerun(["results", "history"])
+
+
+def request_batch() -> None:
+    """Run batch callback: submit the blocks and show the batch in results."""
+    question_blocks = split_question_blocks(st.session_state.get("batch_text", ""))
+    for qf in st.session_state.get("batch_files") or []:
+        question_blocks.extend(
+            split_question_blocks(qf.getvalue().decode("utf-8", errors="ignore")))
+    if not question_blocks:
+        return
+    compression_choice = st.session_state.get("compression_choice", "none")
+    st.session_state.pop("finished_batch_id", None)
+    st.session_state.active_batch_id = submit_batch(
+        question_blocks,
+        st.session_state.get("uploaded_files") or [],
+        st.session_state.batch_concurrency,
+        int(st.session_state.batch_retries),
+        st.session_state.request_timeout,
+        None if compression_choice == "none" else compression_choice,
+        use_cache=not st.session_state.bypass_cache,
+        session_id=st.session_state.session_id,
+        client_id=st.session_state.client_id,
+    )
+    st.rerun(["results"])
+
+
+def load_example_questions() -> None:
+    st.session_state.questions_area = EXAMPLE_QUESTIONS
+
+
+def open_history_result(entry_id: int) -> None:
+    """Open in results callback: show a history entry as the current result."""
+    st.session_state.current_result = {
+        "result": load_history_result(entry_id, st.session_state.history_owner),
+        "result_id": f"history-{entry_id}",
+    }
+    st.rerun(["results"])
+
+
+@st.fragment(key="sidebar")
+def render_sidebar() -> None:
+    """Settings and API key setup."""
+    touch_session(st.session_state.session_id, "sidebar")
     st.markdown(
         '<div class="section-header">Grasper Analytics</div>', unsafe_allow_html=True
     )
 
     st.markdown("---")
 
-    timeout = st.slider(
-        "Request Timeout (seconds)", min_value=30, max_value=300, value=120, step=10
+    st.slider(
+        "Request Timeout (seconds)",
+        min_value=30,
+        max_value=300,
+        value=120,
+        step=10,
+        key="request_timeout",
     )
 
-    show_raw_response = st.checkbox("Show raw API response", value=False)
-    enable_debug = st.checkbox("Enable debug mode", value=False)
+    # The results section renders with these two, so they rerun it as well
+    st.checkbox(
+        "Show raw API response",
+        value=False,
+        key="show_raw_response",
+        on_change=_rerun_sections,
+        args=("sidebar", "results"),
+    )
+    st.checkbox(
+        "Run analyses as background jobs",
+        value=True,
+        help="Submit the analysis to a worker and poll for progress instead of "
+        "blocking the page until the backend answers.",
+        key="run_as_job",
+    )
+    st.checkbox(
+        "Bypass result cache",
+        value=False,
+        help="Always call the API, even for questions and files analysed before.",
+        key="bypass_cache",
+    )
+    st.checkbox(
+        "Enable debug mode",
+        value=False,
+        key="enable_debug",
+        on_change=_rerun_sections,
+        args=("sidebar", "results"),
+    )
 
     st.markdown("---")
 
@@ -448,14 +2224,6 @@ with st.sidebar:
         '<div class="section-header">API Key Setup</div>', unsafe_allow_html=True
     )
 
-    # Initialize session state for session ID if not exists
-    if "session_id" not in st.session_state:
-        try:
-            st.session_state.session_id = str(uuid.uuid4())
-        except Exception as e:
-            st.error(f"Error initializing session: {e}")
-            st.session_state.session_id = f"session_{int(time.time())}"
-
     # Initialize API key status in session state
     if "api_key_status" not in st.session_state:
         st.session_state.api_key_status = "Not Set"
@@ -482,9 +2250,11 @@ with st.sidebar:
     with col_activate:
         if st.button("🔑 Activate API Key", use_container_width=True):
             if api_key:
+                import requests
+
                 try:
                     # Send both API key and session ID to backend
-                    response = requests.post(
+                    response = get_http_session().post(
                         f"{API_BASE_URL}/set_api_key/",
                         json={
                             "session_id": st.session_state.session_id,
@@ -518,27 +2288,45 @@ with st.sidebar:
             st.success("🗑️ API key cleared from session.")
             st.rerun()
 
+    if st.session_state.enable_debug:
+        st.markdown("---")
+        pool = http_pool_stats()
+        st.caption(
+            f"HTTP pool: {pool['requests']} requests over "
+            f"{pool['connections']} connections "
+            f"({pool['reused']} reused, {pool['pools']} host pools)"
+        )
+        cache = get_result_cache().summary()
+        st.caption(
+            f"Result cache: {cache['hits']} hits, {cache['disk_hits']} disk hits, "
+            f"{cache['misses']} misses, {cache['entries']} entries "
+            f"({cache['bytes'] / 1e6:.1f} MB), {cache['evictions']} evicted"
+        )
+        admission = ADMISSION.summary()
+        st.caption(
+            f"Backend slots: {admission['in_flight']}/{admission['max_in_flight'] or '∞'} "
+            f"in use, {admission['queued']} queued from {admission['sessions']} sessions"
+        )
 
-# Main Content Area
-col1, col2 = st.columns([1, 1], gap="large")
-
-with col1:
-    st.markdown(
-        '<div class="section-header">Analysis Setup</div>', unsafe_allow_html=True
-    )
 
-    # File Upload Section
+@st.fragment(key="uploads")
+def render_uploads() -> None:
+    """File uploader, an uploaded questions.txt, and file previews."""
+    touch_session(st.session_state.session_id, "uploads")
 
+    # A new upload can bring a questions.txt, which the editor shows
     uploaded_files = st.file_uploader(
         "Upload any file type",
         type=None,
         accept_multiple_files=True,
         help="You can upload any file type.",
+        key="uploaded_files",
+        on_change=_rerun_sections,
+        args=("uploads", "questions"),
     )
 
     # Check for questions.txt
-    questions_from_file = ""
-    questions_file_found = False
+    questions_from_file = None
 
     if uploaded_files:
         for f in uploaded_files:
@@ -546,11 +2334,45 @@ with col1:
                 try:
                     f.seek(0)
                     questions_from_file = f.read().decode("utf-8")
-                    questions_file_found = True
                     st.success("Questions loaded from uploaded file!")
                     break
                 except Exception:
                     st.warning("Could not read questions.txt file.")
+    st.session_state.questions_from_file = questions_from_file
+
+    # File Preview
+    if uploaded_files:
+        st.markdown(
+            '<div class="section-header">File Preview</div>', unsafe_allow_html=True
+        )
+
+        for uploaded_file in uploaded_files:
+            # Expander bodies run even when collapsed; the toggle keeps
+            # previews nobody asked for from reading the file
+            with st.expander(
+                f"{uploaded_file.name} ({uploaded_file.size:,} bytes)", expanded=False
+            ):
+                if st.toggle("Show preview", key=f"preview_{uploaded_file.file_id}"):
+                    preview_file(uploaded_file)
+                    if uploaded_file.name.lower().endswith(PROFILE_EXTENSIONS) and st.toggle(
+                        "Profile columns", key=f"profile_{uploaded_file.file_id}"
+                    ):
+                        try:
+                            show_profile(profile_table(
+                                file_digest(uploaded_file),
+                                uploaded_file.name.lower(),
+                                uploaded_file,
+                            ))
+                        except Exception as e:
+                            st.error(f"Profiling failed: {e}")
+
+
+@st.fragment(key="questions")
+def render_questions() -> None:
+    """Questions editor, analysis options and the Start / batch buttons."""
+    touch_session(st.session_state.session_id, "questions")
+    questions_from_file = st.session_state.get("questions_from_file")
+    questions_file_found = questions_from_file is not None
 
     # Questions Input
     default_question = ""
@@ -563,14 +2385,13 @@ with col1:
         "Auto-save edits to local questions.txt", value=False)
 
     # Live-edit support for a local questions.txt (project root)
-    local_questions_path = os.path.join(os.getcwd(), "questions.txt")
-    local_exists = os.path.exists(local_questions_path)
+    local_exists = os.path.exists(LOCAL_QUESTIONS_PATH)
 
     # Define a callback for autosave
     def _autosave_questions():
         txt = st.session_state.get("questions_area", "")
         try:
-            with open(local_questions_path, "w", encoding="utf-8") as qf:
+            with open(LOCAL_QUESTIONS_PATH, "w", encoding="utf-8") as qf:
                 qf.write(txt)
             st.session_state._last_save = time.time()
         except Exception:
@@ -589,282 +2410,401 @@ with col1:
 
     questions = st.text_area("Analysis Questions", **textarea_args)
 
-    if local_exists and not questions_file_found:
-        # If there's a local file and user didn't upload one, load it by default
-        try:
-            with open(local_questions_path, "r", encoding="utf-8") as qf:
-                local_text = qf.read()
-                if not questions.strip():
-                    # populate the text area with local file content
-                    questions = local_text
-        except Exception:
-            st.warning("Could not read local questions.txt")
+    # If there's a local file and user didn't upload one, load it by default
+    try:
+        questions = questions_to_send(questions)
+    except OSError:
+        st.warning("Could not read local questions.txt")
 
     # Save edits back to local questions.txt
     col_save, col_sample = st.columns([1, 1])
     with col_save:
         if st.button("Save to questions.txt"):
             try:
-                with open(local_questions_path, "w", encoding="utf-8") as qf:
+                with open(LOCAL_QUESTIONS_PATH, "w", encoding="utf-8") as qf:
                     qf.write(questions)
-                st.success(f"Saved questions to {local_questions_path}")
+                st.success(f"Saved questions to {LOCAL_QUESTIONS_PATH}")
             except Exception as e:
                 st.error(f"Failed to save questions.txt: {e}")
 
     with col_sample:
-        if st.button("Load example questions"):
-            example_text = "- What are the key insights from this data?\n- Show top 10 contributors by value\n- Plot trends over time"
-            questions = example_text
-            st.experimental_rerun()
+        st.button("Load example questions", on_click=load_example_questions)
 
-    # File Preview
-    if uploaded_files:
-        st.markdown(
-            '<div class="section-header">File Preview</div>', unsafe_allow_html=True
-        )
-
-        for uploaded_file in uploaded_files:
-            with st.expander(
-                f"{uploaded_file.name} ({uploaded_file.size:,} bytes)", expanded=False
-            ):
-                preview_file(uploaded_file)
-
-    # Analysis Options
-    use_questions_file = st.checkbox(
+    # Analysis Options. Unkeyed, so it resets when a questions.txt comes or goes.
+    st.session_state.use_questions_file = st.checkbox(
         "Use uploaded questions.txt file",
         value=questions_file_found,
         disabled=not questions_file_found,
     )
+    st.selectbox(
+        "Compress uploads",
+        ["none"] + available_compression_codecs(),
+        help="Compress CSV/JSON/text files before upload. Parts are marked "
+        "with Content-Encoding and a .gz/.zst suffix.",
+        key="compression_choice",
+    )
+    st.checkbox(
+        "Convert CSV uploads to Parquet before sending",
+        value=False,
+        help="Compressed, typed Parquet is usually several times smaller "
+        "than CSV on the wire.",
+        key="convert_csv",
+    )
+    st.checkbox(
+        "Send column profiles with questions",
+        value=False,
+        help="Profile CSV/Excel/Parquet uploads (types, nulls, ranges, "
+        "approximate distinct counts and quantiles) and send them as "
+        "profile.json so the backend can plan without re-reading the data.",
+        key="send_profiles",
+    )
 
     # Analysis Button
     st.markdown("<br>", unsafe_allow_html=True)
-    analyze_button = st.button(
+    st.button(
         "Start Analysis",
         type="primary",
         use_container_width=True,
         disabled=not questions.strip(),
+        on_click=request_analysis,
     )
 
-with col2:
-    st.markdown(
-        '<div class="section-header">Results & Insights</div>', unsafe_allow_html=True
-    )
+    # Batch mode: many question blocks against the same uploaded files
+    with st.expander("Batch analysis", expanded=False):
+        st.caption(
+            f"Separate question blocks with a line containing only "
+            f"`{BATCH_SEPARATOR}`, or upload several question files."
+        )
+        batch_text = st.text_area("Question blocks", height=150, key="batch_text")
+        batch_files = st.file_uploader(
+            "Question files", type=["txt"], accept_multiple_files=True, key="batch_files"
+        )
+        col_conc, col_retry = st.columns(2)
+        with col_conc:
+            st.slider(
+                "Concurrency",
+                min_value=1,
+                max_value=BATCH_MAX_CONCURRENCY,
+                value=4,
+                key="batch_concurrency",
+            )
+        with col_retry:
+            st.number_input(
+                "Retries per item", min_value=0, max_value=5, value=1, key="batch_retries",
+                help="Times an item is re-sent after the backend answers with a 5xx error",
+            )
+
+        question_blocks = split_question_blocks(batch_text)
+        for qf in batch_files or []:
+            question_blocks.extend(
+                split_question_blocks(qf.getvalue().decode("utf-8", errors="ignore")))
+        st.button(
+            f"Run batch ({len(question_blocks)} analyses)",
+            disabled=not question_blocks,
+            use_container_width=True,
+            on_click=request_batch,
+        )
 
-    # Initialize session state
-    if "analysis_history" not in st.session_state:
-        st.session_state.analysis_history = []
 
-    if analyze_button:
-        if not questions.strip():
-            st.error("Please enter your analysis questions.")
-        else:
-            # Prepare request
-            files = make_multipart_files(
-                uploaded_files or [], questions, use_questions_file
+def run_analysis_request(request: Dict[str, Any]) -> None:
+    """Serve a Start Analysis request: from cache, as a job, or inline."""
+    questions = request["questions"]
+    uploaded_files = request["uploaded_files"]
+    compression = request["compression"]
+    timeout = st.session_state.request_timeout
+    if not questions.strip():
+        st.error("Please enter your analysis questions.")
+        return
+
+    # Every analysis is traced; debug mode shows the spans
+    trace = Trace("analysis")
+    with trace.span("multipart build") as attrs:
+        # Prepare request
+        files = make_multipart_files(
+            uploaded_files, questions, request["use_questions_file"]
+        )
+        if request["convert_csv"] and uploaded_files:
+            files = convert_csv_parts(files)
+        if request["send_profiles"] and uploaded_files:
+            profiles = profile_uploads(uploaded_files)
+            if profiles:
+                files["profile.json"] = (
+                    "profile.json",
+                    json.dumps(profiles).encode("utf-8"),
+                    "application/json",
+                )
+        file_names = [f.name for f in uploaded_files]
+        cache_key = result_cache_key(files)
+        attrs["parts"] = len(files)
+    remember_trace(cache_key, trace)
+    cached_result = None
+    if not st.session_state.bypass_cache:
+        with trace.span("cache lookup") as attrs:
+            cached_result = get_result_cache().get(cache_key)
+            attrs["hit"] = cached_result is not None
+
+    if cached_result is not None:
+        record_analysis(questions, cached_result, file_names)
+        st.markdown(
+            '<div class="status-success">Served from result cache.</div>',
+            unsafe_allow_html=True,
+        )
+        st.session_state.current_result = {
+            "result": cached_result,
+            "result_id": cache_key,
+        }
+        return
+    if st.session_state.run_as_job:
+        # Hand the request to the shared worker pool; the script thread
+        # returns immediately and the fragment below polls.
+        st.session_state.pop("current_result", None)
+        st.session_state.active_job_id = submit_analysis_job(
+            files, questions, file_names, timeout, cache_key, compression, trace,
+            st.session_state.session_id, st.session_state.client_id,
+        )
+        return
+
+    # Progress tracking
+    progress_container = st.container()
+    status_container = st.container()
+
+    with progress_container:
+        progress_bar = st.progress(0)
+        status_text = st.empty()
+
+    def on_progress(progress: Optional[int] = None, message: Optional[str] = None, **_) -> None:
+        if progress is not None:
+            progress_bar.progress(progress)
+        if message:
+            status_text.markdown(
+                f'<div class="status-info">{message}</div>',
+                unsafe_allow_html=True,
             )
 
-            # Progress tracking
-            progress_container = st.container()
-            status_container = st.container()
+    import requests
 
-            with progress_container:
-                progress_bar = st.progress(0)
-                status_text = st.empty()
+    try:
+        with trace.span("request"):
+            result = analyze(files, timeout, compression, on_progress=on_progress,
+                             session_id=st.session_state.session_id,
+                             client_id=st.session_state.client_id)
+
+        # Store in history
+        record_analysis(questions, result, file_names)
+        get_result_cache().put(cache_key, result)
+
+        progress_bar.progress(100)
+        status_text.markdown(
+            '<div class="status-success">Analysis completed successfully!</div>',
+            unsafe_allow_html=True,
+        )
 
-            try:
-                # Send request
-                status_text.markdown(
-                    '<div class="status-info">Sending request to API...</div>',
-                    unsafe_allow_html=True,
-                )
-                progress_bar.progress(20)
+        # Display results (rendered below, and kept on
+        # screen across reruns)
+        st.session_state.current_result = {
+            "result": result,
+            "result_id": cache_key,
+        }
 
-                response = requests.post(
-                    f"{API_BASE_URL}/api/analyze_data", files=files, timeout=timeout)
-                progress_bar.progress(60)
+        # Clear progress indicators
+        progress_bar.empty()
+        status_container.empty()
 
-                if response.status_code != 200:
-                    status_text.markdown(
-                        f'<div class="status-error">API Error {response.status_code}: {response.text}</div>',
-                        unsafe_allow_html=True,
-                    )
-                else:
-                    status_text.markdown(
-                        '<div class="status-success">Processing response...</div>',
-                        unsafe_allow_html=True,
-                    )
-                    progress_bar.progress(80)
-
-                    try:
-                        result = response.json()
-
-                        # Store in history
-                        st.session_state.analysis_history.insert(
-                            0,
-                            {
-                                "timestamp": time.time(),
-                                "questions": questions,
-                                "result": result,
-                                "files": (
-                                    [f.name for f in uploaded_files]
-                                    if uploaded_files
-                                    else []
-                                ),
-                            },
-                        )
-
-                        # Keep only last 10 results
-                        st.session_state.analysis_history = (
-                            st.session_state.analysis_history[:10]
-                        )
-
-                        progress_bar.progress(100)
-                        status_text.markdown(
-                            '<div class="status-success">Analysis completed successfully!</div>',
-                            unsafe_allow_html=True,
-                        )
-
-                        # Display results
-                        if show_raw_response:
-                            with st.expander("Raw API Response", expanded=False):
-                                st.json(result)
-
-                        # Process and display structured results
-                        answers = None
-                        if isinstance(result, dict):
-                            if "answers" in result:
-                                answers = result["answers"]
-                            elif "answer" in result:
-                                answers = {"answer": result["answer"]}
-                            else:
-                                answers = {"answer": result}
-
-                        if answers:
-                            # Show generated code if available
-                            if (
-                                isinstance(answers, dict)
-                                and "generated_code" in answers
-                            ):
-                                code = answers["generated_code"]
-                                if code:
-                                    with st.expander(
-                                        "Generated Python Code", expanded=False
-                                    ):
-                                        # Ensure code is a string before displaying/downloading
-                                        code_str = code if isinstance(
-                                            code, str) else json.dumps(code, indent=2)
-                                        st.code(code_str, language="python")
-                                        st.download_button(
-                                            "Download Code",
-                                            data=code_str.encode("utf-8"),
-                                            file_name="analysis_code.py",
-                                            mime="text/x-python",
-                                        )
-
-                            # Display main results
-                            answer_content = (
-                                answers.get("answer")
-                                if isinstance(answers, dict)
-                                else answers
-                            )
-
-                            # Try to parse structured data
-                            parsed_data = None
-                            if isinstance(answer_content, str):
-                                try:
-                                    parsed_data = json.loads(answer_content)
-                                except:
-                                    try:
-                                        if answer_content.strip().startswith("{"):
-                                            parsed_data = eval(
-                                                answer_content, {
-                                                    "__builtins__": {}}
-                                            )
-                                    except:
-                                        pass
-                            elif isinstance(answer_content, (dict, list)):
-                                parsed_data = answer_content
-
-                            if parsed_data:
-                                if isinstance(parsed_data, list):
-                                    try:
-                                        df = pd.DataFrame(parsed_data)
-                                        st.dataframe(
-                                            df, use_container_width=True)
-
-                                        csv = df.to_csv(
-                                            index=False).encode("utf-8")
-                                        st.download_button(
-                                            "Download Results as CSV",
-                                            data=csv,
-                                            file_name="analysis_results.csv",
-                                            mime="text/csv",
-                                        )
-                                    except:
-                                        st.json(parsed_data)
-                                else:
-                                    display_results_dashboard(parsed_data)
-                            else:
-                                st.markdown("### Analysis Results")
-                                st.write(answer_content)
-
-                        # Clear progress indicators after short delay
-                        time.sleep(1)
-                        progress_container.empty()
-                        status_container.empty()
-
-                    except json.JSONDecodeError:
-                        status_text.markdown(
-                            '<div class="status-error">Invalid JSON response from API</div>',
-                            unsafe_allow_html=True,
-                        )
-                        st.text(response.text)
-
-            except requests.exceptions.Timeout:
-                status_text.markdown(
-                    '<div class="status-error">Request timeout. Try increasing timeout in settings.</div>',
-                    unsafe_allow_html=True,
-                )
-            except requests.exceptions.ConnectionError:
-                status_text.markdown(
-                    '<div class="status-error">Connection failed. Check if API server is running.</div>',
-                    unsafe_allow_html=True,
-                )
-            except Exception as e:
-                status_text.markdown(
-                    f'<div class="status-error">Unexpected error: {str(e)}</div>',
-                    unsafe_allow_html=True,
-                )
-                if enable_debug:
-                    st.exception(e)
+    except AnalysisError as e:
+        status_text.markdown(
+            f'<div class="status-error">{e}</div>',
+            unsafe_allow_html=True,
+        )
+    except requests.exceptions.Timeout:
+        status_text.markdown(
+            '<div class="status-error">Request timeout. Try increasing timeout in settings.</div>',
+            unsafe_allow_html=True,
+        )
+    except requests.exceptions.ConnectionError:
+        status_text.markdown(
+            '<div class="status-error">Connection failed. Check if API server is running.</div>',
+            unsafe_allow_html=True,
+        )
+    except Exception as e:
+        status_text.markdown(
+            f'<div class="status-error">Unexpected error: {str(e)}</div>',
+            unsafe_allow_html=True,
+        )
+        if st.session_state.enable_debug:
+            st.exception(e)
+
+
+@st.fragment(key="results")
+def render_results() -> None:
+    """Running and finished analyses and batches, and the current result."""
+    touch_session(st.session_state.session_id, "results")
+    request = st.session_state.pop("analysis_request", None)
+    if request is not None:
+        run_analysis_request(request)
+
+    # Background job in flight: only the polling fragment reruns
+    if st.session_state.get("active_job_id"):
+        render_job_status()
 
-    # Analysis History
-    if st.session_state.analysis_history:
+    if st.session_state.get("active_batch_id"):
+        st.markdown(
+            '<div class="section-header">Batch Analysis</div>', unsafe_allow_html=True
+        )
+        render_batch_status()
+
+    # A finished batch is recorded in history once, then stays on screen
+    finished_batch = get_batch_registry().get(
+        st.session_state.get("finished_batch_id", ""))
+    if finished_batch is not None:
+        if not st.session_state.get(f"batch_recorded_{finished_batch.batch_id}"):
+            for item in finished_batch.items:
+                if item.status in ("done", "cached"):
+                    record_analysis(item.questions, item.result, finished_batch.file_names)
+            st.session_state[f"batch_recorded_{finished_batch.batch_id}"] = True
+        st.markdown(
+            '<div class="section-header">Batch Analysis</div>', unsafe_allow_html=True
+        )
+        render_batch(finished_batch)
+
+    # Background job finished on a previous poll: keep it in history and
+    # make it the current result
+    finished_job = st.session_state.pop("finished_job", None)
+    if finished_job is not None:
+        if finished_job.status == "done":
+            record_analysis(
+                finished_job.questions, finished_job.result, finished_job.file_names
+            )
+            st.markdown(
+                '<div class="status-success">Analysis completed successfully!</div>',
+                unsafe_allow_html=True,
+            )
+            st.session_state.current_result = {
+                "result": finished_job.result,
+                "result_id": finished_job.cache_key or finished_job.job_id,
+            }
+        else:
+            st.markdown(
+                f'<div class="status-error">{finished_job.error}</div>',
+                unsafe_allow_html=True,
+            )
+
+    # The latest result stays on screen across reruns so paging, expanders
+    # and deferred downloads keep working
+    current_result = st.session_state.get("current_result")
+    if current_result is not None and not st.session_state.get("active_job_id"):
+        render_analysis_result(
+            current_result["result"],
+            st.session_state.show_raw_response,
+            current_result["result_id"],
+            st.session_state.enable_debug,
+        )
+
+
+@st.fragment(key="history")
+def render_history() -> None:
+    """Recent analyses of this session, with search."""
+    touch_session(st.session_state.session_id, "history")
+    history_query = ""
+    if st.session_state.analysis_history or st.session_state.get("history_query"):
         st.markdown("---")
         st.markdown(
             '<div class="section-header">Recent Analyses</div>', unsafe_allow_html=True
         )
+        history_query = st.text_input(
+            "Search history",
+            key="history_query",
+            placeholder="Questions, file names or result keys...",
+        )
 
-        for entry in st.session_state.analysis_history:
-            timestamp = entry["timestamp"]
-            questions = entry["questions"]
-            result = entry["result"]
+    history_entries = st.session_state.analysis_history
+    if history_query.strip():
+        history_entries = get_history_store().search(
+            history_query, st.session_state.history_owner)
+        st.caption(f"{len(history_entries)} matching analyses")
+
+    for entry in history_entries:
+        timestamp = entry["timestamp"]
+        questions = entry["questions"]
+
+        # Results are only loaded from the store while the entry is open
+        history_box = st.expander(
+            f"Analysis on {time.ctime(timestamp)}",
+            expanded=False,
+            key=f"history_{entry['id']}",
+            on_change="rerun",
+        )
+        with history_box:
+            st.markdown("### Questions")
+            st.write(questions)
 
-            with st.expander(
-                f"Analysis on {time.ctime(timestamp)}", expanded=False
-            ):
-                st.markdown("### Questions")
-                st.write(questions)
-
-                st.markdown("### Result")
-                if isinstance(result, dict) and "answer" in result:
-                    answer = result["answer"]
-
-                    # Try to display as JSON
-                    try:
-                        parsed_answer = json.loads(answer)
-                        st.json(parsed_answer, expanded=False)
-                    except json.JSONDecodeError:
-                        st.write(answer)
-                else:
-                    st.json(result, expanded=False)
+            if not history_box.open:
+                continue
+            result = load_history_result(entry["id"], st.session_state.history_owner)
+            st.button(
+                "Open in results",
+                key=f"history_open_{entry['id']}",
+                on_click=open_history_result,
+                args=(entry["id"],),
+            )
+
+            st.markdown("### Result")
+            if isinstance(result, dict) and "answer" in result:
+                answer = result["answer"]
+
+                # Try to display as JSON
+                try:
+                    parsed_answer = json.loads(answer)
+                    st.json(parsed_answer, expanded=False)
+                except (TypeError, ValueError):
+                    st.write(answer)
+            else:
+                st.json(result, expanded=False)
+
+
+# The backend session id (which /set_api_key/ ties the API key to) is
+# issued here and never leaves the server. History survives reloads through
+# a separate random token in the URL instead; the store only sees its hash.
+if "session_id" not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
+if "client_id" not in st.session_state:
+    st.session_state.client_id = admission_client_id()
+if "history_owner" not in st.session_state:
+    token = st.query_params.get("history", "")
+    if not HISTORY_TOKEN_RE.fullmatch(token):
+        token = secrets.token_urlsafe(32)
+    st.session_state.history_token = token
+    st.session_state.history_owner = history_owner(token)
+if st.query_params.get("history") != st.session_state.history_token:
+    st.query_params["history"] = st.session_state.history_token
+touch_session(st.session_state.session_id)
+
+if "analysis_history" not in st.session_state:
+    st.session_state.analysis_history = get_history_store().list_entries(
+        st.session_state.history_owner
+    )
+
+# Sidebar Configuration
+with st.sidebar:
+    render_sidebar()
+
+# Main Content Area
+col1, col2 = st.columns([1, 1], gap="large")
+
+with col1:
+    st.markdown(
+        '<div class="section-header">Analysis Setup</div>', unsafe_allow_html=True
+    )
+    render_uploads()
+    render_questions()
+
+with col2:
+    st.markdown(
+        '<div class="section-header">Results & Insights</div>', unsafe_allow_html=True
+    )
+    render_results()
+    render_history()
+
+
+# Load the lazily imported dependencies in the background once the first page
+# has been sent, so later previews and results do not wait for them
+start_warmup()
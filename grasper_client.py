@@ -0,0 +1,2405 @@
+"""Headless client for the Grasper analysis API.
+
+Everything needed to build, send and read an analyze request lives here:
+streamed multipart uploads, upload deduplication and compression,
+admission control, result caching and result classification. It depends only on the standard library
+and requests, so scripts and load tests can drive the backend without
+Streamlit; ``frontend.py`` imports the same functions.
+
+    python grasper_client.py sales.csv -q "Total sales by region?" -o out/
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import binascii
+import codecs
+import csv
+import gzip
+import hashlib
+import importlib
+import io
+import itertools
+import json
+import mimetypes
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import cache, partial
+from math import ceil
+from io import BytesIO
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+# requests is imported on first use: it is a large share of the frontend's
+# cold start and the first page does not need it
+if TYPE_CHECKING:
+    import requests
+
+try:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+except ImportError:
+    pass
+
+
+# API Configuration
+API_BASE_URL = os.getenv("API_ROOT", "https://bharath4444-grasper-ai.hf.space/")
+
+# HTTP client tuning (shared by every caller in this process)
+HTTP_POOL_SIZE = int(os.getenv("GRASPER_HTTP_POOL_SIZE", "20"))
+HTTP_MAX_RETRIES = int(os.getenv("GRASPER_HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_FACTOR = float(os.getenv("GRASPER_HTTP_BACKOFF", "0.5"))
+# Read size for streaming uploads; bounds per-request upload buffering
+UPLOAD_CHUNK_SIZE = int(os.getenv("GRASPER_UPLOAD_CHUNK_SIZE", str(256 * 1024)))
+# How often a backend job is polled for progress
+JOB_POLL_INTERVAL = float(os.getenv("GRASPER_JOB_POLL_INTERVAL", "1.0"))
+
+# Finished timing spans are appended here as JSON lines when set
+TRACE_FILE = os.getenv("GRASPER_TRACE_FILE", "")
+
+# Ask for tables as Arrow IPC when the backend can produce them
+ANALYZE_REQUEST_HEADERS = {"X-Table-Format": "arrow, json"}
+
+
+# ========== HTTP Session ==========
+
+
+@cache
+def get_http_session() -> requests.Session:
+    """Return a process-wide, keep-alive HTTP session for backend calls.
+
+    The session is shared by every caller (and every Streamlit session and
+    rerun) so TCP/TLS connections to API_BASE_URL are pooled and reused instead of being set up
+    on every request. Connection failures are retried for every method, and
+    gateway errors only for idempotent ones: a POST that reached the backend
+    (an analyze request) is never replayed, whatever the backend answered.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.request import ACCEPT_ENCODING
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=HTTP_MAX_RETRIES,
+        connect=HTTP_MAX_RETRIES,
+        read=0,
+        status=HTTP_MAX_RETRIES,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        status_forcelist=(502, 503, 504),
+        # urllib3's default: GET/HEAD/PUT/DELETE/OPTIONS/TRACE, never POST
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_SIZE,
+        pool_maxsize=HTTP_POOL_SIZE,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    # Advertise every response codec urllib3 can decode here (gzip/deflate,
+    # plus br and zstd when brotli / zstandard are installed)
+    session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def http_pool_stats() -> Dict[str, int]:
+    """Summarize connection reuse across the shared session's pools.
+
+    urllib3 counts every request and every new connection per host pool, so
+    the difference is the number of requests served on a kept-alive socket.
+    """
+    stats = {"pools": 0, "requests": 0, "connections": 0, "reused": 0}
+    seen = set()
+    for adapter in get_http_session().adapters.values():
+        if id(adapter) in seen:
+            continue
+        seen.add(id(adapter))
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats["pools"] += 1
+            stats["requests"] += pool.num_requests
+            stats["connections"] += pool.num_connections
+    stats["reused"] = max(stats["requests"] - stats["connections"], 0)
+    return stats
+
+
+# ========== Metrics ==========
+
+# Serve /metrics on this port when set (e.g. 9464); empty disables it
+METRICS_PORT = os.getenv("GRASPER_METRICS_PORT", "")
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9)
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    """One named metric family with a fixed set of label names.
+
+    Values are kept per label combination in process memory; updates take
+    a lock, so metrics can be shared freely between Streamlit sessions,
+    job threads and HTTP handler threads.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [
+                f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+                for key, value in sorted(self._values.items())
+            ]
+
+    def expose(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * len(self.buckets), 0.0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, list(counts), total) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """The metrics of this process, rendered in Prometheus text format.
+
+    Collectors registered with ``on_collect`` run before every scrape to
+    refresh gauges that are cheaper to read on demand than to maintain
+    (active sessions, cache sizes, memory).
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: Dict[str, Callable[[], None]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def on_collect(self, name: str, collector: Callable[[], None]) -> None:
+        """Run ``collector`` before each scrape; re-registering replaces it."""
+        with self._lock:
+            self._collectors[name] = collector
+
+    def render(self) -> str:
+        with self._lock:
+            collectors = list(self._collectors.values())
+            metrics = list(self._metrics.values())
+        for collector in collectors:
+            try:
+                collector()
+            except Exception:
+                # A broken collector must not take the whole scrape down
+                COLLECTOR_ERRORS.inc()
+        return "\n".join(metric.expose() for metric in metrics) + "\n"
+
+
+METRICS = MetricsRegistry()
+COLLECTOR_ERRORS = METRICS.counter(
+    "grasper_metrics_collector_errors_total", "Scrape-time collectors that raised.")
+API_REQUESTS = METRICS.counter(
+    "grasper_api_requests_total",
+    "Analyze requests to the backend by outcome "
+    "(ok, http_error, timeout, connection_error, invalid_response, shed, error).",
+    ("outcome", "status"),
+)
+API_LATENCY = METRICS.histogram(
+    "grasper_api_request_duration_seconds",
+    "End-to-end analyze request time, upload to parsed result.",
+    ("outcome",),
+)
+PHASE_DURATION = METRICS.histogram(
+    "grasper_phase_duration_seconds",
+    "Duration of traced phases (upload, server wait, download, render, ...).",
+    ("phase",),
+)
+UPLOAD_BYTES = METRICS.histogram(
+    "grasper_upload_bytes", "Request body bytes sent per analyze request.", buckets=SIZE_BUCKETS)
+RESPONSE_BYTES = METRICS.histogram(
+    "grasper_response_bytes", "Decoded response bytes per analyze request.", buckets=SIZE_BUCKETS)
+CACHE_EVENTS = METRICS.counter(
+    "grasper_result_cache_events_total",
+    "Result cache lookups and evictions (hit, disk_hit, miss, eviction).",
+    ("event",),
+)
+
+
+_metrics_servers: Dict[int, Any] = {}
+_metrics_servers_lock = threading.Lock()
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0"):
+    """Serve ``METRICS.render()`` at ``/metrics`` from a daemon thread.
+
+    ``/ready`` answers 200 once ``warm_up()`` has finished and 503 before,
+    for readiness probes. Starting the same port twice in one process returns
+    the running server. Returns None when the port is taken (e.g. by another
+    worker of the same replica), which is logged but not fatal.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args) -> None:
+            pass
+
+        def _reply(self, status: int, text: str, content_type: str) -> None:
+            data = text.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self) -> None:
+            route = self.path.split("?", 1)[0].rstrip("/")
+            if route == "/ready":
+                ready = is_ready()
+                self._reply(200 if ready else 503, "ready\n" if ready else "warming up\n",
+                            "text/plain; charset=utf-8")
+            elif route in ("/metrics", ""):
+                self._reply(200, METRICS.render(), "text/plain; version=0.0.4; charset=utf-8")
+            else:
+                self.send_error(404)
+
+    with _metrics_servers_lock:
+        if port in _metrics_servers:
+            return _metrics_servers[port]
+        try:
+            server = ThreadingHTTPServer((host, port), MetricsHandler)
+        except OSError as e:
+            print(f"Metrics server not started on :{port}: {e}", file=sys.stderr)
+            return None
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="grasper-metrics", daemon=True).start()
+        _metrics_servers[port] = server
+        return server
+
+
+# ========== Warm-up ==========
+
+# Modules the frontend imports on first use; warm_up() loads them off the
+# request path so the first preview / table / chart does not pay for them
+WARMUP_MODULES = tuple(
+    name.strip()
+    for name in os.getenv(
+        "GRASPER_WARMUP_MODULES", "requests,numpy,pandas,PIL.Image,pyarrow").split(",")
+    if name.strip()
+)
+# Set to 1 to also open a pooled connection to API_BASE_URL during warm-up
+WARMUP_CONNECT = os.getenv("GRASPER_WARMUP_CONNECT", "0") == "1"
+
+_ready = threading.Event()
+
+WARMUP_DURATION = METRICS.gauge(
+    "grasper_warmup_seconds", "Time spent in warm-up, by step", ("step",))
+READY = METRICS.gauge("grasper_ready", "1 once warm-up has finished")
+READY.set(0)
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def warm_up(modules: Tuple[str, ...] = WARMUP_MODULES, connect: bool = WARMUP_CONNECT) -> float:
+    """Import ``modules`` and build the HTTP session, then mark the process ready.
+
+    Modules that are not installed are skipped. Returns the total time taken.
+    """
+    start = time.perf_counter()
+    for name in modules:
+        step = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            continue
+        WARMUP_DURATION.set(time.perf_counter() - step, step=name)
+    step = time.perf_counter()
+    session = get_http_session()
+    if connect:
+        try:
+            session.head(API_BASE_URL, timeout=5)
+        except Exception as e:
+            print(f"Warm-up connection to {API_BASE_URL} failed: {e}", file=sys.stderr)
+    WARMUP_DURATION.set(time.perf_counter() - step, step="http_session")
+    total = time.perf_counter() - start
+    WARMUP_DURATION.set(total, step="total")
+    READY.set(1)
+    _ready.set()
+    return total
+
+
+@cache
+def start_warmup() -> threading.Thread:
+    """Run ``warm_up()`` once per process on a daemon thread."""
+    thread = threading.Thread(target=warm_up, name="grasper-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+# ========== Tracing ==========
+
+_current_span: ContextVar = ContextVar("grasper_span", default=None)
+_trace_file_lock = threading.Lock()
+
+
+class Trace:
+    """Timed spans of one analysis, or of one render of its result.
+
+    Spans nest through a context variable, so helpers deep in the call stack
+    record into whichever trace is active via ``span()`` without being handed
+    it. Each finished span is also appended to TRACE_FILE, when set, as one
+    OpenTelemetry-style JSON object per line.
+    """
+
+    def __init__(self, name: str, trace_id: Optional[str] = None):
+        self.name = name
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """Time the block; the yielded dict collects extra attributes."""
+        parent_id = self._current_span_id()
+        span_id = uuid.uuid4().hex[:16]
+        token = _current_span.set((self, span_id))
+        start_wall, start = time.time(), time.perf_counter()
+        try:
+            yield attrs
+        finally:
+            _current_span.reset(token)
+            self.record(
+                name, start_wall, time.perf_counter() - start,
+                span_id=span_id, parent_id=parent_id, **attrs,
+            )
+
+    def _current_span_id(self) -> Optional[str]:
+        current = _current_span.get()
+        return current[1] if current is not None and current[0] is self else None
+
+    def record(
+        self,
+        name: str,
+        start: float,
+        duration: float,
+        span_id: Optional[str] = None,
+        parent_id: Optional[str] = None,
+        **attrs,
+    ) -> None:
+        """Add a span timed by the caller; ``start`` is in epoch seconds."""
+        entry = {
+            "name": name,
+            "start": start,
+            "duration": max(duration, 0.0),
+            "span_id": span_id or uuid.uuid4().hex[:16],
+            "parent_id": parent_id or self._current_span_id(),
+            "attrs": attrs,
+        }
+        with self._lock:
+            self.spans.append(entry)
+        PHASE_DURATION.observe(entry["duration"], phase=name)
+        if TRACE_FILE:
+            self._export(entry)
+
+    def _export(self, entry: Dict[str, Any]) -> None:
+        line = json.dumps({
+            "trace_id": self.trace_id,
+            "span_id": entry["span_id"],
+            "parent_span_id": entry["parent_id"],
+            "name": entry["name"],
+            "start_time_unix_nano": int(entry["start"] * 1e9),
+            "end_time_unix_nano": int((entry["start"] + entry["duration"]) * 1e9),
+            "attributes": {"trace.name": self.name, **entry["attrs"]},
+        }, default=str)
+        try:
+            with _trace_file_lock, open(TRACE_FILE, "a", encoding="utf-8") as fh:
+                fh.write(line + "\n")
+        except OSError:
+            pass
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time the block into the active trace; a no-op when there is none."""
+    current = _current_span.get()
+    if current is None:
+        yield attrs
+        return
+    with current[0].span(name, **attrs) as span_attrs:
+        yield span_attrs
+
+
+def record_span(name: str, start: float, duration: float, **attrs) -> None:
+    """Record a span measured by hand into the active trace, if any."""
+    current = _current_span.get()
+    if current is not None:
+        current[0].record(name, start, duration, **attrs)
+
+
+# ========== Streaming Decode ==========
+
+# String values longer than this (in encoded characters) are kept on disk
+SPILL_MIN_CHARS = int(os.getenv("GRASPER_SPILL_BYTES", str(1024 * 1024)))
+# Temp directory for spilled values; empty uses the system default
+SPILL_DIR = os.getenv("GRASPER_SPILL_DIR", "")
+# String fields that carry a JSON document of their own, decoded as they stream
+NESTED_JSON_KEYS = ("answer",)
+DECODE_CHUNK_CHARS = 256 * 1024
+
+_STRUCTURE_RE = re.compile(r"[{}\[\],]")
+_SPILL_MARK = "\x00grasper-spill:"
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class SpilledText:
+    """A long JSON string value kept in a temporary file instead of memory.
+
+    The decoded text is stored UTF-8 encoded; the file is removed when the
+    last reference goes away. ``parsed`` holds the decoded document when the
+    string was itself JSON (see NESTED_JSON_KEYS). ``str()`` reads it all
+    back; ``b64decode`` streams base64 payloads without doing so.
+    """
+
+    def __init__(self, path: str, length: int, offset: int = 0, owner: "SpilledText" = None):
+        self.path = path
+        self.length = length
+        self.offset = offset
+        self.parsed: Any = None
+        # Views share the owner's file and keep it alive
+        self._owner = owner
+        if owner is None:
+            weakref.finalize(self, _remove_quietly, path)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __str__(self) -> str:
+        return self.read()
+
+    def __repr__(self) -> str:
+        return f"<SpilledText {self.length / 1e6:.1f}M chars>"
+
+    def iter_text(self, chunk_chars: int = DECODE_CHUNK_CHARS):
+        decoder = codecs.getincrementaldecoder("utf-8")("surrogatepass")
+        with open(self.path, "rb") as fh:
+            fh.seek(self.offset)
+            while True:
+                data = fh.read(chunk_chars)
+                text = decoder.decode(data, final=not data)
+                if text:
+                    yield text
+                if not data:
+                    return
+
+    def read(self) -> str:
+        return "".join(self.iter_text())
+
+    def head(self, chars: int) -> str:
+        with open(self.path, "rb") as fh:
+            fh.seek(self.offset)
+            return fh.read(chars * 4).decode("utf-8", errors="ignore")[:chars]
+
+    def startswith(self, prefix: str) -> bool:
+        return self.head(len(prefix)) == prefix
+
+    def payload(self) -> "SpilledText":
+        """The part after a data URI's comma (everything, for bare base64)."""
+        head = self.head(1024)
+        if not head.startswith("data:") or "," not in head:
+            return self
+        skip = len(head[: head.index(",") + 1].encode("utf-8"))
+        return SpilledText(self.path, self.length - skip, self.offset + skip, self._owner or self)
+
+    def b64decode(self) -> bytes:
+        """Decode the base64 payload chunk by chunk."""
+        out, rest = [], ""
+        for text in self.payload().iter_text():
+            text = rest + "".join(text.split())
+            cut = len(text) // 4 * 4
+            out.append(base64.b64decode(text[:cut]))
+            rest = text[cut:]
+        out.append(base64.b64decode(rest))
+        return b"".join(out)
+
+    def iter_json(self):
+        """The value as a JSON string literal, in chunks."""
+        yield '"'
+        for text in self.iter_text():
+            yield json.dumps(text)[1:-1]
+        yield '"'
+
+
+def b64decode_value(value: Any) -> bytes:
+    """Decode a base64 payload held as str or as SpilledText."""
+    if isinstance(value, SpilledText):
+        return value.b64decode()
+    return base64.b64decode(value)
+
+
+def iter_json(value: Any):
+    """Encode ``value`` like json.dumps, streaming spilled strings from disk."""
+    if isinstance(value, SpilledText):
+        yield from value.iter_json()
+        return
+    try:
+        yield json.dumps(value)
+        return
+    except TypeError:
+        if not isinstance(value, (dict, list, tuple)):
+            raise
+    # Only containers holding spilled values get here
+    if isinstance(value, dict):
+        yield "{"
+        for i, (k, v) in enumerate(value.items()):
+            yield (", " if i else "") + json.dumps(str(k)) + ": "
+            yield from iter_json(v)
+        yield "}"
+    else:
+        yield "["
+        for i, v in enumerate(value):
+            if i:
+                yield ", "
+            yield from iter_json(v)
+        yield "]"
+
+
+def json_default(value: Any) -> Any:
+    """``default=`` for json.dump(s) of results that may hold SpilledText."""
+    if isinstance(value, SpilledText):
+        return value.read()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _unescape(raw: str) -> str:
+    return json.loads('"' + raw + '"')
+
+
+def _is_high_surrogate(escape: str) -> bool:
+    return escape[:2] == "\\u" and "d800" <= escape[2:6].lower() <= "dbff"
+
+
+def _complete_escapes_end(text: str, start: int) -> int:
+    """End of the longest prefix of string content ``text[start:]`` that
+    does not stop inside an escape or between a surrogate pair's halves."""
+    end = len(text)
+    i = text.rfind("\\", max(start, end - 12))
+    if i < 0:
+        return end
+    j = i
+    while j > start and text[j - 1] == "\\":
+        j -= 1
+    if (i - j) % 2 == 1:
+        # The last backslash is itself escaped
+        return end
+    if i + 1 < end and text[i + 1] != "u":
+        return end
+    if i + 6 < end or (i + 6 == end and not _is_high_surrogate(text[i:])):
+        return end
+    cut = i
+    # Keep a high surrogate together with the low half that is still to come
+    if cut - 6 >= start and _is_high_surrogate(text[cut - 6:cut]):
+        k = cut - 6
+        while k > start and text[k - 1] == "\\":
+            k -= 1
+        if (cut - 6 - k) % 2 == 0:
+            cut -= 6
+    return cut
+
+
+class JSONStreamDecoder:
+    """Incremental JSON decoder that keeps long strings out of memory.
+
+    Text is fed in arbitrary chunks. String values longer than
+    ``spill_chars`` are written to temporary files and come back as
+    SpilledText; everything else is parsed with the C ``json`` module, one
+    top-level member at a time when the document is an object, and handed
+    to ``on_field(key, value)`` as soon as it is complete. Strings under a
+    NESTED_JSON_KEYS key that hold JSON themselves are decoded on the fly by
+    a child decoder whose top-level fields go to ``on_nested_field``.
+    """
+
+    def __init__(
+        self,
+        spill_chars: int = SPILL_MIN_CHARS,
+        on_field: Optional[Callable[[str, Any], None]] = None,
+        on_nested_field: Optional[Callable[[str, Any], None]] = None,
+    ):
+        self.spill_chars = spill_chars
+        self.on_field = on_field
+        self.on_nested_field = on_nested_field
+        self._carry = ""
+        self._parts: List[str] = []
+        self._spills: List[SpilledText] = []
+        self._member_spills = 0
+        self._result: Dict[str, Any] = {}
+        self._top_object: Optional[bool] = None
+        self._depth = 0
+        # Current string value, when inside one
+        self._in_string = False
+        self._string_parts: Optional[List[str]] = None
+        self._string_chars = 0
+        self._spill_fh = None
+        self._spill_path = ""
+        self._spill_length = 0
+        self._child: Optional["JSONStreamDecoder"] = None
+        self._child_pending = False
+        # Key tracking for NESTED_JSON_KEYS
+        self._last_string: Optional[str] = None
+        self._value_key: Optional[str] = None
+
+    # -- feeding --
+
+    def feed(self, text: str) -> None:
+        text = self._carry + text
+        self._carry = ""
+        if self._top_object is None:
+            stripped = text.lstrip()
+            if not stripped:
+                self._parts.append(text)
+                return
+            self._top_object = stripped[0] == "{"
+        pos, end = 0, len(text)
+        while pos < end:
+            if self._in_string:
+                pos = self._scan_string(text, pos)
+            else:
+                quote = text.find('"', pos)
+                if quote < 0:
+                    self._outside(text[pos:])
+                    return
+                self._outside(text[pos:quote])
+                self._open_string()
+                pos = quote + 1
+
+    def _scan_string(self, text: str, pos: int) -> int:
+        start = pos
+        while True:
+            quote = text.find('"', pos)
+            if quote < 0:
+                cut = _complete_escapes_end(text, start)
+                self._string_data(text[start:cut])
+                self._carry = text[cut:]
+                return len(text)
+            # The quote is escaped when an odd run of backslashes precedes it
+            b = quote
+            while b > start and text[b - 1] == "\\":
+                b -= 1
+            if (quote - b) % 2 == 0:
+                self._string_data(text[start:quote])
+                self._close_string()
+                return quote + 1
+            pos = quote + 1
+
+    def _open_string(self) -> None:
+        self._in_string = True
+        self._string_parts = []
+        self._string_chars = 0
+        self._child = None
+        self._child_pending = self._value_key in NESTED_JSON_KEYS
+        self._value_key = None
+
+    def _string_data(self, raw: str) -> None:
+        if not raw:
+            return
+        decoded = None
+        if self._child_pending or self._child is not None:
+            decoded = _unescape(raw)
+            self._feed_child(decoded)
+        if self._spill_fh is not None:
+            decoded = _unescape(raw) if decoded is None else decoded
+            self._spill_fh.write(decoded.encode("utf-8", "surrogatepass"))
+            self._spill_length += len(decoded)
+            return
+        self._string_parts.append(raw)
+        self._string_chars += len(raw)
+        if self._string_chars > self.spill_chars:
+            fd, self._spill_path = tempfile.mkstemp(
+                prefix="grasper-spill-", dir=SPILL_DIR or None)
+            self._spill_fh = os.fdopen(fd, "wb")
+            decoded = _unescape("".join(self._string_parts))
+            self._spill_fh.write(decoded.encode("utf-8", "surrogatepass"))
+            self._spill_length = len(decoded)
+            self._string_parts = None
+
+    def _feed_child(self, text: str) -> None:
+        if self._child_pending:
+            stripped = text.lstrip()
+            if not stripped:
+                return
+            self._child_pending = False
+            if stripped[0] not in "{[":
+                return
+            self._child = JSONStreamDecoder(self.spill_chars, on_field=self.on_nested_field)
+        try:
+            self._child.feed(text)
+        except ValueError:
+            # Not JSON after all (e.g. a Python repr); parse_answers copes
+            self._child = None
+
+    def _close_string(self) -> None:
+        self._in_string = False
+        self._child_pending = False
+        parsed = None
+        if self._child is not None:
+            try:
+                parsed = self._child.close()
+            except ValueError:
+                parsed = None
+            self._child = None
+        if self._spill_fh is None:
+            raw = "".join(self._string_parts)
+            self._parts.append('"' + raw + '"')
+            self._last_string = raw if len(raw) < 256 else None
+            return
+        self._spill_fh.close()
+        self._spill_fh = None
+        spilled = SpilledText(self._spill_path, self._spill_length)
+        spilled.parsed = parsed
+        self._parts.append(json.dumps(f"{_SPILL_MARK}{len(self._spills)}"))
+        self._spills.append(spilled)
+        self._last_string = None
+
+    def _outside(self, seg: str) -> None:
+        if not seg:
+            return
+        # A short string followed by ':' was a key; its value is the next token
+        stripped = seg.strip()
+        if stripped:
+            self._value_key = (
+                _unescape(self._last_string)
+                if stripped == ":" and self._last_string is not None else None
+            )
+            self._last_string = None
+
+        if not self._top_object:
+            self._parts.append(seg)
+            return
+        opens = seg.count("{") + seg.count("[")
+        closes = seg.count("}") + seg.count("]")
+        if self._depth - closes >= 2:
+            # Nothing here can end a top-level member
+            self._depth += opens - closes
+            self._parts.append(seg)
+            return
+        pos = 0
+        for m in _STRUCTURE_RE.finditer(seg):
+            ch, i = m.group(), m.start()
+            if ch in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    pos = i + 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._parts.append(seg[pos:i])
+                    self._emit_member()
+                    pos = i + 1
+                elif self._depth < 0:
+                    raise ValueError("unbalanced JSON document")
+            elif self._depth == 1:
+                self._parts.append(seg[pos:i])
+                self._emit_member()
+                pos = i + 1
+        self._parts.append(seg[pos:])
+
+    def _emit_member(self) -> None:
+        text = "".join(self._parts).strip()
+        self._parts = []
+        if not text:
+            return
+        member = json.loads("{" + text + "}")
+        if len(self._spills) > self._member_spills:
+            member = self._resolve(member)
+            self._member_spills = len(self._spills)
+        for key, value in member.items():
+            self._result[key] = value
+            if self.on_field is not None:
+                self.on_field(key, value)
+
+    def _resolve(self, value: Any) -> Any:
+        if isinstance(value, str):
+            if value.startswith(_SPILL_MARK):
+                return self._spills[int(value[len(_SPILL_MARK):])]
+            return value
+        if isinstance(value, dict):
+            # Keys must stay str, so a (pathological) spilled key is read back
+            return {str(self._resolve(k)): self._resolve(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._resolve(v) for v in value]
+        return value
+
+    def close(self) -> Any:
+        """Finish the document and return it; raises ValueError if it is invalid."""
+        if self._in_string or self._carry:
+            raise ValueError("JSON document is truncated")
+        if self._top_object:
+            if self._depth != 0 or "".join(self._parts).strip():
+                raise ValueError("JSON document is truncated or has trailing data")
+            return self._result
+        value = json.loads("".join(self._parts))
+        return self._resolve(value) if self._spills else value
+
+
+def decode_text_chunks(chunks, **kwargs) -> Any:
+    """Decode text chunks with a JSONStreamDecoder; raises ValueError."""
+    decoder = JSONStreamDecoder(**kwargs)
+    for chunk in chunks:
+        decoder.feed(chunk)
+    return decoder.close()
+
+
+def decode_json_chunks(chunks, **kwargs) -> Any:
+    """Decode UTF-8 byte chunks with a JSONStreamDecoder; raises ValueError."""
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    texts = (text_decoder.decode(chunk) for chunk in chunks)
+    return decode_text_chunks(
+        itertools.chain(texts, [text_decoder.decode(b"", final=True)]), **kwargs)
+
+
+# ========== Result Parsing ==========
+
+MEDIA_PREFIXES = ("image/", "audio/", "video/")
+
+# Leading bytes of the media types charts and attachments arrive as
+MEDIA_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+    (b"<svg", "image/svg+xml"),
+    (b"ID3", "audio/mpeg"),
+    (b"\xff\xfb", "audio/mpeg"),
+    (b"OggS", "audio/ogg"),
+    (b"fLaC", "audio/flac"),
+    (b"\x1aE\xdf\xa3", "video/webm"),
+)
+RIFF_FORMATS = {b"WEBP": "image/webp", b"WAVE": "audio/wav", b"AVI ": "video/x-msvideo"}
+
+
+def get_mime_type(data_uri: str) -> str:
+    """Extract MIME type from data URI."""
+    if data_uri.startswith("data:"):
+        try:
+            mime_part = data_uri.split(";")[0].replace("data:", "")
+            return mime_part
+        except Exception:
+            return "application/octet-stream"
+    return "application/octet-stream"
+
+
+def _match_signature(head: bytes) -> Optional[str]:
+    """MIME type for the first bytes of a file, or None if unrecognised."""
+    for magic, mime in MEDIA_SIGNATURES:
+        if head.startswith(magic):
+            return mime
+    if head.startswith(b"RIFF") and head[8:12] in RIFF_FORMATS:
+        return RIFF_FORMATS[head[8:12]]
+    if head[4:8] == b"ftyp":
+        return "audio/mp4" if head[8:11] == b"M4A" else "video/mp4"
+    stripped = head.lstrip()
+    if stripped.startswith(b"<?xml") and b"<svg" in head:
+        return "image/svg+xml"
+    return None
+
+
+def sniff_media(value: str) -> Optional[Tuple[str, str]]:
+    """Classify a raw base64 string or data URI without decoding all of it.
+
+    Only a 64-character prefix is decoded to check magic bytes. Returns the
+    MIME type and the bare base64 payload, or None if this is not media.
+    """
+    if isinstance(value, SpilledText):
+        found = sniff_media(value.head(1024))
+        return (found[0], value.payload()) if found else None
+
+    header_mime = None
+    payload = value
+    if value.startswith("data:"):
+        header, _, payload = value.partition(",")
+        if ";base64" not in header:
+            return None
+        header_mime = get_mime_type(header)
+
+    prefix = payload[:64]
+    try:
+        head = base64.b64decode(prefix[: len(prefix) // 4 * 4], validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+    if header_mime and header_mime.startswith(MEDIA_PREFIXES):
+        return header_mime, payload
+    mime = _match_signature(head)
+    return (mime, payload) if mime else None
+
+
+# Field names the backend uses for chart images
+CHART_KEYWORDS = ("_chart", "_graph", "_plot", "_image", "_visualization")
+
+
+def parse_answers(result: Any) -> Tuple[Any, Any, Any]:
+    """Pull the answers out of a response from /api/analyze_data.
+
+    Returns ``(answers, answer_content, parsed)``: the answers object (falsy
+    when there is nothing to show), its main answer, and that answer as a
+    dict or list when it is structured data (None otherwise).
+    """
+    answers = None
+    if isinstance(result, dict):
+        if "answers" in result:
+            answers = result["answers"]
+        elif "answer" in result:
+            answers = {"answer": result["answer"]}
+        else:
+            answers = {"answer": result}
+    if not answers:
+        return answers, None, None
+
+    answer_content = (
+        answers.get("answer") if isinstance(answers, dict) else answers
+    )
+
+    # Try to parse structured data
+    parsed_data = None
+    if isinstance(answer_content, SpilledText):
+        parsed_data = answer_content.parsed
+        if parsed_data is None:
+            try:
+                parsed_data = decode_text_chunks(answer_content.iter_text())
+            except ValueError:
+                # Not JSON; the eval fallback below needs the whole text anyway
+                answer_content = answer_content.read()
+    if isinstance(answer_content, str):
+        try:
+            parsed_data = json.loads(answer_content)
+        except:
+            try:
+                if answer_content.strip().startswith("{"):
+                    parsed_data = eval(answer_content, {"__builtins__": {}})
+            except:
+                pass
+    elif isinstance(answer_content, (dict, list)):
+        parsed_data = answer_content
+    return answers, answer_content, parsed_data
+
+
+def classify_result(parsed: Dict[str, Any]) -> Dict[str, Any]:
+    """Sort the fields of an analysis response into display sections.
+
+    Returns ``metrics`` and ``text`` dicts, ``tables`` holding the raw list,
+    dict or Arrow payload of each table, and ``media`` / ``images`` lists of
+    ``(name, mime, base64 payload)``; payloads spilled to disk stay
+    SpilledText (see ``b64decode_value``). Nothing is decoded here, so callers can
+    choose their own table and image libraries.
+    """
+    sections = {"metrics": {}, "tables": {}, "media": [], "images": [], "text": {}}
+    for k, v in parsed.items():
+        # Check for base64 encoded content (magic bytes of a short prefix)
+        if isinstance(v, (str, SpilledText)) and len(v) > 50:
+            media = sniff_media(v)
+            if v.startswith("data:"):
+                if media:
+                    sections["media"].append((k, *media))
+                continue
+            elif media:
+                sections["images"].append((k, *media))
+                continue
+
+        if isinstance(v, SpilledText) and any(keyword in k.lower() for keyword in CHART_KEYWORDS):
+            sections["images"].append((k, "image/png", v.payload()))
+        elif isinstance(v, str) and any(keyword in k.lower() for keyword in CHART_KEYWORDS):
+            sections["images"].append((k, "image/png", v.split(",")[-1]))
+        elif isinstance(v, (int, float)) or (isinstance(v, str) and len(v) < 500):
+            sections["metrics"][k] = v
+        elif isinstance(v, (list, dict)):
+            sections["tables"][k] = v
+        else:
+            sections["text"][k] = v
+    return sections
+
+
+# ========== Multipart Upload ==========
+
+
+def make_multipart_files(uploaded_files, questions_text: str, use_questions_file: bool):
+    """Build files dict for requests.
+
+    Uploaded files are referenced, not read: each part holds the file object
+    itself so ``MultipartStream`` can copy it into the request in chunks.
+    """
+    files = {}
+
+    if use_questions_file:
+        for f in uploaded_files:
+            if f.name.lower() == "questions.txt":
+                files["questions.txt"] = ("questions.txt", f, "text/plain")
+                break
+    else:
+        files["questions.txt"] = (
+            "questions.txt",
+            questions_text.encode("utf-8"),
+            "text/plain",
+        )
+
+    for f in uploaded_files:
+        if f.name.lower() == "questions.txt":
+            continue
+        mime = f.type or "application/octet-stream"
+        files[f.name] = (f.name, f, mime)
+    return files
+
+
+def _part_size(content: Any) -> int:
+    """Size in bytes of a multipart part body (bytes or seekable file)."""
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        return len(content)
+    size = getattr(content, "size", None)
+    if isinstance(size, int):
+        return size
+    pos = content.tell()
+    content.seek(0, os.SEEK_END)
+    end = content.tell()
+    content.seek(pos)
+    return end
+
+
+def _quote_param(value: str) -> str:
+    """Escape a Content-Disposition parameter the way browsers do."""
+    return (
+        value.replace("\\", "\\\\")
+        .replace('"', "%22")
+        .replace("\r", "%0D")
+        .replace("\n", "%0A")
+    )
+
+
+class MultipartStream:
+    """Read-only file-like multipart/form-data body built on demand.
+
+    Parts are produced lazily from the ``make_multipart_files`` dict, so at
+    most one read-size worth of the body is held in memory no matter how big
+    the uploads are. A part may carry a fourth element with extra part
+    headers, as in requests' ``files=`` tuples. ``len()`` is known up front, which lets requests send a
+    Content-Length instead of chunked encoding, and ``seek(0)`` rewinds the
+    body so urllib3 can replay it on a retried connection.
+    """
+
+    def __init__(
+        self,
+        files: Dict[str, Tuple],
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        chunk_size: int = UPLOAD_CHUNK_SIZE,
+    ):
+        self.boundary = uuid.uuid4().hex
+        self.chunk_size = chunk_size
+        self.progress_callback = progress_callback
+        self._parts = []
+        for field_name, part in files.items():
+            filename, content, mime = part[:3]
+            extra_headers = part[3] if len(part) > 3 else {}
+            header = (
+                f"--{self.boundary}\r\n"
+                f'Content-Disposition: form-data; name="{_quote_param(field_name)}"; '
+                f'filename="{_quote_param(filename)}"\r\n'
+                f"Content-Type: {mime}\r\n"
+                + "".join(f"{k}: {v}\r\n" for k, v in extra_headers.items())
+                + "\r\n"
+            ).encode("utf-8")
+            self._parts.append((header, content, _part_size(content)))
+        self._closing = f"--{self.boundary}--\r\n".encode("utf-8")
+        self.total = (
+            sum(len(h) + size + 2 for h, _, size in self._parts) + len(self._closing)
+        )
+        self.seek(0)
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self) -> int:
+        return self.total
+
+    def _generate(self):
+        for header, content, _ in self._parts:
+            yield header
+            if isinstance(content, (bytes, bytearray, memoryview)):
+                view = memoryview(content)
+                for i in range(0, len(view), self.chunk_size):
+                    yield bytes(view[i: i + self.chunk_size])
+            else:
+                content.seek(0)
+                while True:
+                    chunk = content.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+            yield b"\r\n"
+        yield self._closing
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            out, self._buffer = self._buffer, b""
+        else:
+            out, self._buffer = self._buffer[:size], self._buffer[size:]
+        self.sent += len(out)
+        if out and self.progress_callback is not None:
+            self.progress_callback(self.sent, self.total)
+        return out
+
+    def tell(self) -> int:
+        return self.sent
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if offset != 0 or whence != os.SEEK_SET:
+            raise io.UnsupportedOperation("MultipartStream can only rewind to 0")
+        self._chunks = self._generate()
+        self._buffer = b""
+        self.sent = 0
+        return 0
+
+
+def post_multipart(
+    url: str,
+    files: Dict[str, Tuple],
+    timeout: int,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+    headers: Optional[Dict[str, str]] = None,
+    **kwargs,
+) -> requests.Response:
+    """POST ``files`` as a streamed multipart body on the shared session."""
+    body = MultipartStream(files, progress_callback=progress_callback)
+    return get_http_session().post(
+        url,
+        data=body,
+        headers={**(headers or {}), "Content-Type": body.content_type},
+        timeout=timeout,
+        **kwargs,
+    )
+
+
+# ========== Upload Deduplication ==========
+
+UPLOAD_DEDUPE = os.getenv("GRASPER_UPLOAD_DEDUPE", "1") != "0"
+# How long to remember that the backend has no blob endpoint before asking again
+BLOB_API_RECHECK_SECONDS = 600
+# Uploads whose digest is remembered; the least recently used are forgotten
+DIGEST_MEMO_MAX_ENTRIES = int(os.getenv("GRASPER_DIGEST_MEMO_ENTRIES", "1024"))
+
+_digest_memo_lock = threading.Lock()
+
+
+@cache
+def get_digest_memo() -> OrderedDict[Tuple[str, int], str]:
+    """Process-wide SHA-256 LRU for uploaded files, keyed by (file_id, size)."""
+    return OrderedDict()
+
+
+@cache
+def get_blob_api_state() -> Dict[str, Any]:
+    """Whether the backend supports digest lookups, shared by all sessions."""
+    return {"supported": None, "checked": 0.0}
+
+
+def file_digest(f: Any, chunk_size: int = UPLOAD_CHUNK_SIZE) -> str:
+    """Chunked SHA-256 of bytes or a seekable file, memoized per upload.
+
+    In-memory files (BytesIO, Streamlit uploads) are hashed through their
+    buffer without moving the file position, so hashing cannot race another
+    thread reading the same object. Workers should still be handed a
+    snapshot taken at submit time.
+    """
+    if isinstance(f, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(f).hexdigest()
+
+    file_id = getattr(f, "file_id", None)
+    memo = get_digest_memo()
+    key = (file_id, _part_size(f))
+    if file_id:
+        with _digest_memo_lock:
+            if key in memo:
+                memo.move_to_end(key)
+                return memo[key]
+
+    h = hashlib.sha256()
+    if hasattr(f, "getbuffer"):
+        with f.getbuffer() as view:
+            for start in range(0, len(view), chunk_size):
+                h.update(view[start:start + chunk_size])
+    else:
+        f.seek(0)
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+        f.seek(0)
+    digest = h.hexdigest()
+    if file_id:
+        with _digest_memo_lock:
+            memo[key] = digest
+            memo.move_to_end(key)
+            while len(memo) > DIGEST_MEMO_MAX_ENTRIES:
+                memo.popitem(last=False)
+    return digest
+
+
+def find_missing_blobs(digests: List[str]) -> Optional[List[str]]:
+    """Ask the backend which digests it does not hold yet.
+
+    Returns None when the backend has no ``/api/blobs/missing`` endpoint (or
+    it fails), in which case callers should upload everything as before.
+    """
+    import requests
+
+    state = get_blob_api_state()
+    if state["supported"] is False and (
+        time.time() - state["checked"] < BLOB_API_RECHECK_SECONDS
+    ):
+        return None
+    try:
+        response = get_http_session().post(
+            f"{API_BASE_URL}/api/blobs/missing",
+            json={"algorithm": "sha256", "digests": digests},
+            timeout=10,
+        )
+    except requests.exceptions.RequestException:
+        return None
+    state["checked"] = time.time()
+    if response.status_code != 200:
+        state["supported"] = False
+        return None
+    state["supported"] = True
+    try:
+        return list(response.json().get("missing", digests))
+    except (ValueError, AttributeError):
+        return None
+
+
+def dedupe_multipart_files(
+    files: Dict[str, Tuple[str, Any, str]]
+) -> Tuple[Dict[str, Tuple[str, Any, str]], int]:
+    """Drop parts the backend already has, referencing them by digest.
+
+    Every data file gets an entry in a ``file_refs.json`` part (name ->
+    sha256, size, content type, whether its bytes are in this request), so
+    the backend can store new blobs under their digest and resolve the rest
+    from its blob store. ``questions.txt`` is always sent inline. Returns the
+    new files dict and the number of upload bytes saved.
+    """
+    data_parts = {k: v for k, v in files.items() if k != "questions.txt"}
+    if not UPLOAD_DEDUPE or not data_parts:
+        return files, 0
+
+    digests = {k: file_digest(content) for k, (_, content, _) in data_parts.items()}
+    missing = find_missing_blobs(sorted(set(digests.values())))
+    if missing is None:
+        return files, 0
+
+    missing = set(missing)
+    out = {k: v for k, v in files.items() if k not in data_parts}
+    refs = {}
+    saved = 0
+    for key, (filename, content, mime) in data_parts.items():
+        size = _part_size(content)
+        uploaded = digests[key] in missing
+        refs[filename] = {
+            "sha256": digests[key],
+            "size": size,
+            "content_type": mime,
+            "uploaded": uploaded,
+        }
+        if uploaded:
+            out[key] = (filename, content, mime)
+        else:
+            saved += size
+    out["file_refs.json"] = (
+        "file_refs.json",
+        json.dumps(refs).encode("utf-8"),
+        "application/json",
+    )
+    return out, saved
+
+
+# ========== Upload Compression ==========
+
+# Parts smaller than this are not worth compressing
+COMPRESS_MIN_BYTES = 4 * 1024
+COMPRESSIBLE_EXTENSIONS = (
+    ".csv", ".tsv", ".txt", ".json", ".jsonl", ".ndjson", ".xml", ".html", ".md", ".sql",
+)
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+
+def available_compression_codecs() -> List[str]:
+    """Upload codecs usable in this environment, best first."""
+    codecs = ["gzip"]
+    try:
+        import zstandard  # noqa: F401
+
+        codecs.insert(0, "zstd")
+    except ImportError:
+        pass
+    return codecs
+
+
+COMPRESSED_CACHE_ENTRIES = int(os.getenv("GRASPER_COMPRESSED_CACHE_ENTRIES", "32"))
+COMPRESSED_CACHE_TTL = int(os.getenv("GRASPER_COMPRESSED_CACHE_TTL", "3600"))
+
+
+class TempFileCache:
+    """LRU of derived temp files (key -> path) with a TTL since last use.
+
+    Evicted and expired entries have their file deleted; a request already
+    streaming one keeps its open handle. Thread-safe.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[Any, Tuple[str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict(self, now: float) -> None:
+        for key in [k for k, (_, used) in self._entries.items() if now - used > self.ttl]:
+            _remove_quietly(self._entries.pop(key)[0])
+        while len(self._entries) > self.max_entries:
+            _remove_quietly(self._entries.popitem(last=False)[1][0])
+
+    def get(self, key: Any) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            entry = self._entries.pop(key, None)
+            if entry is None or not os.path.exists(entry[0]):
+                return None
+            self._entries[key] = (entry[0], now)
+            return entry[0]
+
+    def put(self, key: Any, path: str) -> None:
+        now = time.time()
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old and old[0] != path:
+                _remove_quietly(old[0])
+            self._entries[key] = (path, now)
+            self._evict(now)
+
+    def clear(self) -> None:
+        with self._lock:
+            for path, _ in self._entries.values():
+                _remove_quietly(path)
+            self._entries.clear()
+
+
+@cache
+def get_compressed_parts() -> TempFileCache:
+    """Process-wide cache of (digest, codec) -> compressed temp file."""
+    return TempFileCache(COMPRESSED_CACHE_ENTRIES, COMPRESSED_CACHE_TTL)
+
+
+def _compress_to_file(content: Any, codec: str, path: str) -> None:
+    """Stream ``content`` through ``codec`` into ``path`` chunk by chunk."""
+    if isinstance(content, (bytes, bytearray)):
+        content = BytesIO(content)
+    content.seek(0)
+    with open(path, "wb") as raw:
+        if codec == "zstd":
+            import zstandard
+
+            with zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=False) as out:
+                shutil.copyfileobj(content, out, UPLOAD_CHUNK_SIZE)
+        else:
+            with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6, mtime=0) as out:
+                shutil.copyfileobj(content, out, UPLOAD_CHUNK_SIZE)
+    content.seek(0)
+
+
+def compress_multipart_files(
+    files: Dict[str, Tuple[str, Any, str]], codec: str
+) -> Dict[str, Tuple]:
+    """Compress text-like data parts with ``codec`` ("gzip" or "zstd").
+
+    Compressed parts keep their content type, gain a ``Content-Encoding``
+    part header and a ``.gz``/``.zst`` filename suffix, so a backend that
+    ignores the header can still recognise the file as compressed. Their
+    ``file_refs.json`` entries, when present, are renamed to match and gain
+    ``content_encoding``; digest and size still describe the raw file.
+    Parts are compressed to temp files (cached by digest) and sent as
+    LocalFiles, which keeps memory flat and the request length known up front.
+    """
+    if codec not in COMPRESSION_SUFFIXES:
+        return files
+    cache = get_compressed_parts()
+    out = {}
+    renamed = {}
+    for key, (filename, content, mime) in files.items():
+        if (
+            key in ("questions.txt", "file_refs.json")
+            or not filename.lower().endswith(COMPRESSIBLE_EXTENSIONS)
+            or _part_size(content) < COMPRESS_MIN_BYTES
+        ):
+            out[key] = (filename, content, mime)
+            continue
+        digest = file_digest(content)
+        path = cache.get((digest, codec))
+        if path is None:
+            fd, path = tempfile.mkstemp(suffix=COMPRESSION_SUFFIXES[codec], prefix="grasper-")
+            os.close(fd)
+            try:
+                _compress_to_file(content, codec, path)
+            except BaseException:
+                _remove_quietly(path)
+                raise
+            cache.put((digest, codec), path)
+        name = renamed[filename] = filename + COMPRESSION_SUFFIXES[codec]
+        compressed = LocalFile(path)
+        compressed.file_id = f"{codec}:{digest}"
+        out[key] = (name, compressed, mime, {"Content-Encoding": codec})
+
+    if renamed and "file_refs.json" in out:
+        filename, refs, mime = out["file_refs.json"]
+        refs = json.loads(refs)
+        for old, new in renamed.items():
+            if old in refs:
+                refs[new] = {**refs.pop(old), "content_encoding": codec}
+        out["file_refs.json"] = (filename, json.dumps(refs).encode("utf-8"), mime)
+    return out
+
+
+# ========== Result Cache ==========
+
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("GRASPER_RESULT_CACHE_ENTRIES", "64"))
+RESULT_CACHE_MAX_BYTES = int(
+    os.getenv("GRASPER_RESULT_CACHE_BYTES", str(256 * 1024 * 1024)))
+RESULT_CACHE_TTL = int(os.getenv("GRASPER_RESULT_CACHE_TTL", "3600"))
+# Optional second tier; unset keeps the cache in memory only
+RESULT_CACHE_DIR = os.getenv("GRASPER_RESULT_CACHE_DIR", "")
+
+
+class ResultCache:
+    """Thread-safe LRU cache of analysis results with TTL and byte budget.
+
+    The memory tier evicts least-recently-used entries once either the entry
+    count or the total (JSON-encoded) size exceeds its limit. When a
+    directory is configured, results are also written there gzip-compressed
+    and promoted back into memory on a later miss.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = RESULT_CACHE_MAX_ENTRIES,
+        max_bytes: int = RESULT_CACHE_MAX_BYTES,
+        ttl: int = RESULT_CACHE_TTL,
+        disk_dir: str = RESULT_CACHE_DIR,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json.gz")
+
+    def _store(self, key: str, result: Any, size: int, expires: float) -> None:
+        # Caller holds the lock
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (expires, size, result)
+        self._bytes += size
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            _, (_, old_size, _) = self._entries.popitem(last=False)
+            self._bytes -= old_size
+            self.stats["evictions"] += 1
+            CACHE_EVENTS.inc(event="eviction")
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    CACHE_EVENTS.inc(event="hit")
+                    return entry[2]
+                self._bytes -= self._entries.pop(key)[1]
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                expires = os.path.getmtime(path) + self.ttl
+                if expires > now:
+                    with gzip.open(path, "rb") as fh:
+                        result = decode_json_chunks(iter(partial(fh.read, 256 * 1024), b""))
+                        size = fh.tell()
+                    with self._lock:
+                        self._store(key, result, size, expires)
+                        self.stats["disk_hits"] += 1
+                    CACHE_EVENTS.inc(event="disk_hit")
+                    return result
+                os.remove(path)
+            except (OSError, ValueError):
+                pass
+
+        with self._lock:
+            self.stats["misses"] += 1
+        CACHE_EVENTS.inc(event="miss")
+        return None
+
+    def put(self, key: str, result: Any) -> None:
+        # Encoded in chunks, so spilled strings are copied rather than joined
+        fh, tmp_path = None, ""
+        if self.disk_dir:
+            tmp_path = f"{self._disk_path(key)}.{uuid.uuid4().hex}.tmp"
+            try:
+                fh = gzip.open(tmp_path, "wb", compresslevel=5)
+            except OSError:
+                fh = None
+        size = 0
+        for chunk in iter_json(result):
+            data = chunk.encode("utf-8")
+            size += len(data)
+            if fh is not None:
+                try:
+                    fh.write(data)
+                except OSError:
+                    fh.close()
+                    fh = None
+                    _remove_quietly(tmp_path)
+        with self._lock:
+            self._store(key, result, size, time.time() + self.ttl)
+        if fh is not None:
+            try:
+                fh.close()
+                os.replace(tmp_path, self._disk_path(key))
+            except OSError:
+                _remove_quietly(tmp_path)
+
+    def summary(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries), "bytes": self._bytes}
+
+
+def normalize_questions(text: str) -> str:
+    """Collapse whitespace so formatting-only edits still hit the cache."""
+    lines = (" ".join(line.split()) for line in text.strip().splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def result_cache_key(files: Dict[str, Tuple[str, Any, str]]) -> str:
+    """Key a request by its normalized questions and its files' SHA-256s."""
+    _, questions_part, _ = files.get("questions.txt", ("", b"", ""))
+    if isinstance(questions_part, (bytes, bytearray)):
+        questions_raw = bytes(questions_part)
+    else:
+        questions_part.seek(0)
+        questions_raw = questions_part.read()
+        questions_part.seek(0)
+
+    h = hashlib.sha256()
+    h.update(normalize_questions(
+        questions_raw.decode("utf-8", errors="ignore")).encode("utf-8"))
+    for key in sorted(k for k in files if k != "questions.txt"):
+        filename, content, _ = files[key]
+        h.update(b"\0" + filename.encode("utf-8") + b"\0")
+        h.update(file_digest(content).encode("ascii"))
+    return h.hexdigest()
+
+
+# ========== Running Analyses ==========
+
+# A line consisting only of this separates question blocks in a batch file
+BATCH_SEPARATOR = "---"
+
+
+class AnalysisError(Exception):
+    """The backend rejected an analysis or returned an unusable response."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def split_question_blocks(text: str) -> List[str]:
+    """Split batch text into question blocks on ``---`` lines."""
+    blocks, current = [], []
+    for line in text.splitlines():
+        if line.strip() == BATCH_SEPARATOR:
+            blocks.append("\n".join(current))
+            current = []
+        else:
+            current.append(line)
+    blocks.append("\n".join(current))
+    return [b.strip() for b in blocks if b.strip()]
+
+
+class LocalFile:
+    """A file on disk that quacks like a Streamlit upload.
+
+    Carries the ``name``, ``type``, ``size`` and ``file_id`` attributes the
+    request builders read, and opens lazily so building a request never
+    reads the file ahead of the upload itself.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        stat = os.stat(path)
+        self.name = os.path.basename(path)
+        self.type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.size = stat.st_size
+        # Changes whenever the file does, so memoized digests stay valid
+        self.file_id = f"{os.path.abspath(path)}:{stat.st_mtime_ns}"
+        self._fh = None
+
+    def _file(self):
+        if self._fh is None:
+            self._fh = open(self.path, "rb")
+        return self._fh
+
+    def read(self, size: int = -1) -> bytes:
+        return self._file().read(size)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self._file().seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._file().tell()
+
+    def getvalue(self) -> bytes:
+        with open(self.path, "rb") as fh:
+            return fh.read()
+
+    def close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+
+ProgressCallback = Callable[..., None]
+
+
+def _poll_remote_job(
+    remote_job_id: str, timeout: int, report: ProgressCallback, poll_interval: float
+) -> Any:
+    """Follow a backend job until it finishes, reporting its progress.
+
+    Expects ``GET /api/jobs/<id>`` to return ``{"status", "progress",
+    "partial", "result", "error"}``; missing fields are tolerated.
+    """
+    import requests
+
+    session = get_http_session()
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        response = session.get(f"{API_BASE_URL}/api/jobs/{remote_job_id}", timeout=30)
+        if response.status_code != 200:
+            raise AnalysisError(
+                f"API Error {response.status_code}: {response.text}", response.status_code)
+        body = response.json()
+        state = str(body.get("status", "running")).lower()
+        update = {}
+        if body.get("progress") is not None:
+            update["progress"] = max(30, min(int(body["progress"]), 99))
+        if isinstance(body.get("partial"), dict):
+            update["partial"] = dict(body["partial"])
+        if body.get("message"):
+            update["message"] = str(body["message"])
+        if update:
+            report(**update)
+        if state in ("done", "completed", "succeeded", "success"):
+            return body.get("result")
+        if state in ("failed", "error", "cancelled"):
+            raise AnalysisError(str(body.get("error") or "Backend job failed"))
+        time.sleep(poll_interval)
+    raise requests.exceptions.Timeout()
+
+
+def analyze(
+    files: Dict[str, Any],
+    timeout: int,
+    compression: Optional[str] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    poll_interval: float = JOB_POLL_INTERVAL,
+    session_id: str = "default",
+    client_id: Optional[str] = None,
+) -> Any:
+    """Run one analysis end to end and return the parsed JSON result.
+
+    ``files`` is a ``make_multipart_files`` dict. The request carries
+    ``Prefer: respond-async``: a backend that supports jobs answers 202 with
+    a job id which is then polled, any other backend answers synchronously
+    and the body is downloaded in chunks. ``on_progress`` is called with
+    keyword updates (``status``, ``progress`` 0-100, ``message``, and
+    ``partial`` / ``remote_job_id`` when the backend provides them).
+
+    The request first waits for a slot from ADMISSION, in ``session_id``'s
+    queue, reporting ``status="queued"`` with its position meanwhile.
+    ``client_id`` names the token bucket it is rate limited under (default:
+    the session). It must be an identity the server observes, such as the
+    client address, never a value the client can pick, or each new value
+    buys a fresh bucket.
+
+    Raises AnalysisError for API errors and unusable responses (its subclass
+    AdmissionRejected when the request is shed), and requests' exceptions
+    for transport failures.
+    """
+    import requests
+
+    start = time.perf_counter()
+    outcome, status = "error", ""
+    try:
+        with ADMISSION.admit(session_id, on_progress, client_id):
+            result = _analyze(files, timeout, compression, on_progress, poll_interval)
+        outcome = "ok"
+        return result
+    except AdmissionRejected:
+        outcome = "shed"
+        raise
+    except AnalysisError as e:
+        outcome = "http_error" if e.status_code else "invalid_response"
+        status = str(e.status_code or "")
+        raise
+    except requests.exceptions.Timeout:
+        outcome = "timeout"
+        raise
+    except requests.exceptions.ConnectionError:
+        outcome = "connection_error"
+        raise
+    finally:
+        API_REQUESTS.inc(outcome=outcome, status=status)
+        API_LATENCY.observe(time.perf_counter() - start, outcome=outcome)
+
+
+def _analyze(
+    files: Dict[str, Any],
+    timeout: int,
+    compression: Optional[str],
+    on_progress: Optional[ProgressCallback],
+    poll_interval: float,
+) -> Any:
+    report = on_progress or (lambda **update: None)
+    parts = files
+    try:
+        report(status="uploading", progress=2, message="Checking for already uploaded files...")
+        with span("dedupe") as attrs:
+            parts, saved = dedupe_multipart_files(parts)
+            attrs["saved_bytes"] = saved
+        if compression:
+            report(message=f"Compressing uploads ({compression})...")
+            with span("compress", codec=compression):
+                parts = compress_multipart_files(parts, compression)
+        return _send_analysis(parts, saved, timeout, report, poll_interval)
+    finally:
+        # Files on disk opened for the upload are not needed once it is sent
+        for part in (*files.values(), *parts.values()):
+            if isinstance(part[1], LocalFile):
+                part[1].close()
+
+
+def _send_analysis(
+    files: Dict[str, Any],
+    saved: int,
+    timeout: int,
+    report: ProgressCallback,
+    poll_interval: float,
+) -> Any:
+    message = "Sending request to API..."
+    if saved:
+        message = f"Sending request to API ({saved / 1e6:.1f} MB already on server)..."
+    report(progress=5, message=message)
+
+    # Upload ends when the last body byte is handed to the socket; the
+    # server wait (time to first byte) runs from there to the headers
+    upload_end = []
+
+    def on_upload(sent: int, total: int) -> None:
+        if sent >= total and not upload_end:
+            upload_end.append((time.time(), time.perf_counter(), total))
+        report(
+            progress=5 + int(25 * sent / total),
+            message=f"Uploading {sent / 1e6:.1f} / {total / 1e6:.1f} MB...",
+        )
+
+    start_wall, start = time.time(), time.perf_counter()
+    response = post_multipart(
+        f"{API_BASE_URL}/api/analyze_data",
+        files,
+        timeout,
+        progress_callback=on_upload,
+        headers={**ANALYZE_REQUEST_HEADERS, "Prefer": "respond-async"},
+        stream=True,
+    )
+    headers_at = time.perf_counter()
+    sent_wall, sent_at, sent_bytes = upload_end[0] if upload_end else (time.time(), headers_at, 0)
+    record_span("upload", start_wall, sent_at - start, bytes=sent_bytes)
+    UPLOAD_BYTES.observe(sent_bytes)
+    record_span("server wait", sent_wall, headers_at - sent_at, status=response.status_code)
+    report(status="waiting", progress=30, message="Waiting for analysis...")
+
+    if response.status_code == 202:
+        body = response.json()
+        remote_job_id = str(body.get("job_id") or body.get("id"))
+        report(remote_job_id=remote_job_id, message=f"Backend job {remote_job_id} running...")
+        with span("remote job", job_id=remote_job_id):
+            return _poll_remote_job(remote_job_id, timeout, report, poll_interval)
+    if response.status_code != 200:
+        raise AnalysisError(
+            f"API Error {response.status_code}: {response.text}", response.status_code)
+
+    report(status="downloading", message="Downloading results...")
+    total = int(response.headers.get("Content-Length") or 0)
+    fields: Dict[str, Any] = {}
+
+    def on_field(key: str, value: Any) -> None:
+        # Fields of the answer document, shown while the rest downloads
+        fields[key] = value
+        report(partial=dict(fields), message=f"Received {len(fields)} result fields...")
+
+    # Decoded as it arrives: long strings go to temp files, and the answer
+    # document is parsed one field at a time instead of as a whole
+    decoder = JSONStreamDecoder(on_nested_field=on_field)
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    received_bytes = 0
+    try:
+        with span("download") as attrs:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                received_bytes += len(chunk)
+                decoder.feed(text_decoder.decode(chunk))
+                # Content-Length counts encoded bytes, so track the wire position
+                received = response.raw.tell()
+                if total:
+                    report(progress=30 + int(65 * min(received / total, 1.0)))
+            decoder.feed(text_decoder.decode(b"", final=True))
+            attrs.update(bytes=received_bytes, wire_bytes=response.raw.tell(),
+                         encoding=response.headers.get("Content-Encoding", "identity"))
+        RESPONSE_BYTES.observe(received_bytes)
+        with span("json parse", bytes=received_bytes):
+            return decoder.close()
+    except ValueError:
+        raise AnalysisError("Invalid JSON response from API")
+
+
+# ========== Admission Control ==========
+
+# At most this many analyze requests reach the backend at once, across all
+# sessions of the process; 0 disables the limit
+MAX_IN_FLIGHT = int(os.getenv("GRASPER_MAX_IN_FLIGHT", "8"))
+# Requests waiting for a slot, in total and per session, before new ones are shed
+MAX_QUEUED = int(os.getenv("GRASPER_MAX_QUEUED", "64"))
+SESSION_MAX_QUEUED = int(os.getenv("GRASPER_SESSION_MAX_QUEUED", "16"))
+# Token bucket per client (all sessions from one address share it):
+# sustained requests per second and burst size; a rate of 0 disables it
+CLIENT_RATE = float(os.getenv("GRASPER_CLIENT_RATE", "1.0"))
+CLIENT_BURST = int(os.getenv("GRASPER_CLIENT_BURST", "10"))
+# Longest a request waits in the queue before it is shed, seconds
+QUEUE_TIMEOUT = float(os.getenv("GRASPER_QUEUE_TIMEOUT", "60"))
+
+ADMISSION_IN_FLIGHT = METRICS.gauge(
+    "grasper_admission_in_flight", "Analyze requests currently admitted to the backend")
+ADMISSION_QUEUED = METRICS.gauge(
+    "grasper_admission_queued", "Analyze requests waiting for a backend slot")
+ADMISSION_WAIT = METRICS.histogram(
+    "grasper_admission_wait_seconds", "Time analyze requests spent queued before admission")
+ADMISSION_SHED = METRICS.counter(
+    "grasper_admission_shed_total",
+    "Analyze requests rejected before reaching the backend "
+    "(queue_full, session_queue_full, queue_timeout).",
+    ("reason",),
+)
+
+
+class AdmissionRejected(AnalysisError):
+    """The request was shed before reaching the backend; try again later."""
+
+    def __init__(self, message: str, reason: str):
+        super().__init__(message, 503)
+        self.reason = reason
+
+
+class _Ticket:
+    __slots__ = ("session_id", "client_id", "granted")
+
+    def __init__(self, session_id: str, client_id: str):
+        self.session_id = session_id
+        self.client_id = client_id
+        self.granted = False
+
+
+class AdmissionController:
+    """Process-wide gate in front of the backend.
+
+    Requests queue per session and sessions are served round-robin, so one
+    session's batch cannot starve another's single analysis. Token buckets
+    are per client instead, so opening more sessions does not raise a
+    client's rate; a session is skipped while its client's bucket is empty.
+    Requests beyond the queue limits, or still queued after
+    ``queue_timeout``, raise AdmissionRejected.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        max_queued: int = MAX_QUEUED,
+        session_max_queued: int = SESSION_MAX_QUEUED,
+        rate: float = CLIENT_RATE,
+        burst: int = CLIENT_BURST,
+        queue_timeout: float = QUEUE_TIMEOUT,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.session_max_queued = session_max_queued
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queued = 0
+        # Service order: a session moves to the back each time it is served
+        self._queues: "OrderedDict[str, List[_Ticket]]" = OrderedDict()
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._cond = threading.Condition()
+
+    # All underscore methods below expect self._cond to be held
+
+    def _tokens(self, client_id: str, now: float) -> float:
+        tokens, last = self._buckets.get(client_id, (self.burst, now))
+        return min(self.burst, tokens + (now - last) * self.rate)
+
+    def _refill_in(self, client_id: str, now: float) -> float:
+        """Seconds until the client may send again (0 when it may now)."""
+        if self.rate <= 0:
+            return 0.0
+        return max(0.0, (1 - self._tokens(client_id, now)) / self.rate)
+
+    def _has_slot(self) -> bool:
+        return self.max_in_flight <= 0 or self.in_flight < self.max_in_flight
+
+    def _dispatch(self) -> None:
+        """Grant free slots to queue heads, round-robin over sessions."""
+        now = time.monotonic()
+        granted = False
+        while self._has_slot() and self._queues:
+            session_id = next(
+                (s for s, queue in self._queues.items()
+                 if self._refill_in(queue[0].client_id, now) == 0),
+                None,
+            )
+            if session_id is None:
+                break
+            queue = self._queues.pop(session_id)
+            ticket = queue.pop(0)
+            if self.rate > 0:
+                self._buckets[ticket.client_id] = (self._tokens(ticket.client_id, now) - 1, now)
+            ticket.granted = True
+            if queue:
+                self._queues[session_id] = queue
+            self.in_flight += 1
+            self.queued -= 1
+            granted = True
+        # Full buckets of idle clients carry no state worth keeping
+        waiting = {t.client_id for queue in self._queues.values() for t in queue}
+        for client_id in [
+            c for c in self._buckets
+            if c not in waiting and self._tokens(c, now) >= self.burst
+        ]:
+            del self._buckets[client_id]
+        ADMISSION_IN_FLIGHT.set(self.in_flight)
+        ADMISSION_QUEUED.set(self.queued)
+        if granted:
+            self._cond.notify_all()
+
+    def _position(self, ticket: _Ticket) -> int:
+        """1-based place in line under round-robin service."""
+        index = self._queues[ticket.session_id].index(ticket)
+        ahead, before = index, True
+        for session_id, queue in self._queues.items():
+            if session_id == ticket.session_id:
+                before = False
+            else:
+                ahead += min(len(queue), index + 1 if before else index)
+        return ahead + 1
+
+    def _shed(self, reason: str, message: str) -> AdmissionRejected:
+        ADMISSION_SHED.inc(reason=reason)
+        return AdmissionRejected(message, reason)
+
+    def _enqueue(self, session_id: str, client_id: str) -> _Ticket:
+        with self._cond:
+            if self.queued >= self.max_queued:
+                raise self._shed(
+                    "queue_full",
+                    f"Server busy: the backend queue is full ({self.queued} waiting). "
+                    "Please try again in a minute.")
+            queue = self._queues.setdefault(session_id, [])
+            if len(queue) >= self.session_max_queued:
+                raise self._shed(
+                    "session_queue_full",
+                    f"Too many analyses queued for this session ({len(queue)}). "
+                    "Wait for one to finish before starting another.")
+            ticket = _Ticket(session_id, client_id)
+            queue.append(ticket)
+            self.queued += 1
+            self._dispatch()
+            return ticket
+
+    def _withdraw(self, ticket: _Ticket) -> None:
+        with self._cond:
+            if ticket.granted:
+                self.in_flight -= 1
+            else:
+                queue = self._queues.get(ticket.session_id, [])
+                if ticket in queue:
+                    queue.remove(ticket)
+                    self.queued -= 1
+                if not queue:
+                    self._queues.pop(ticket.session_id, None)
+            self._dispatch()
+
+    def _wait(self, ticket: _Ticket, report: ProgressCallback) -> None:
+        deadline = time.monotonic() + self.queue_timeout
+        shown = None
+        while True:
+            with self._cond:
+                # Also picks up slots a refilled token bucket has released
+                self._dispatch()
+                if ticket.granted:
+                    return
+                now = time.monotonic()
+                if now >= deadline:
+                    raise self._shed(
+                        "queue_timeout",
+                        f"Server busy: no backend slot came free within "
+                        f"{self.queue_timeout:g}s. Please try again later.")
+                refill = self._refill_in(ticket.client_id, now)
+                state = (self._position(ticket), self.queued, self.in_flight, ceil(refill))
+            if state != shown:
+                shown = state
+                position, queued, in_flight, wait = state
+                message = f"Queued for the backend: position {position} of {queued}"
+                if self.max_in_flight > 0:
+                    message += f" ({in_flight}/{self.max_in_flight} running)"
+                if wait:
+                    message += f", rate limited for {wait}s"
+                report(status="queued", message=message + "...")
+            with self._cond:
+                if not ticket.granted:
+                    self._cond.wait(min(deadline - now, refill or 1.0, 1.0))
+
+    @contextmanager
+    def admit(
+        self,
+        session_id: str,
+        report: Optional[ProgressCallback] = None,
+        client_id: Optional[str] = None,
+    ):
+        """Hold a backend slot for the body of the ``with`` block.
+
+        The request queues under ``session_id`` and is rate limited under
+        ``client_id`` (default: the session). Blocks until a slot is granted,
+        calling ``report(status="queued", message=...)`` whenever the queue
+        position changes. Raises AdmissionRejected when the request is shed.
+        """
+        start = time.perf_counter()
+        ticket = self._enqueue(session_id, client_id or session_id)
+        try:
+            self._wait(ticket, report or (lambda **update: None))
+        except BaseException:
+            self._withdraw(ticket)
+            raise
+        ADMISSION_WAIT.observe(time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            self._withdraw(ticket)
+
+    def summary(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "queued": self.queued,
+                "sessions": len(self._queues),
+            }
+
+
+ADMISSION = AdmissionController()
+
+
+# ========== Command Line ==========
+
+
+def _write_table(path: str, table: Any) -> str:
+    """Write a raw result table to ``path`` + extension; return the file name."""
+    if isinstance(table, dict) and table.get("format") == "arrow":
+        path += ".arrow"
+        with open(path, "wb") as fh:
+            fh.write(b64decode_value(table.get("data", "")))
+        return path
+    if isinstance(table, dict) and all(isinstance(v, list) for v in table.values()):
+        # Column-oriented: {"col": [values...]}
+        table = [dict(zip(table, row)) for row in zip(*table.values())]
+    if isinstance(table, list) and table and all(isinstance(r, dict) for r in table):
+        path += ".csv"
+        columns = list(dict.fromkeys(k for row in table for k in row))
+        with open(path, "w", newline="", encoding="utf-8") as fh:
+            writer = csv.DictWriter(fh, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(table)
+        return path
+    path += ".json"
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(table, fh, indent=2, default=json_default)
+    return path
+
+
+def write_result(result: Any, out_dir: str) -> List[str]:
+    """Save a result as ``result.json`` plus one file per table and chart."""
+    os.makedirs(out_dir, exist_ok=True)
+    written = [os.path.join(out_dir, "result.json")]
+    with open(written[0], "w", encoding="utf-8") as fh:
+        json.dump(result, fh, indent=2, default=json_default)
+
+    answers, answer_content, parsed = parse_answers(result)
+    code = answers.get("generated_code") if isinstance(answers, dict) else None
+    if code:
+        written.append(os.path.join(out_dir, "analysis_code.py"))
+        with open(written[-1], "w", encoding="utf-8") as fh:
+            fh.write(code if isinstance(code, str) else json.dumps(code, indent=2))
+    if isinstance(parsed, list) or (isinstance(parsed, dict) and parsed.get("format") == "arrow"):
+        written.append(_write_table(os.path.join(out_dir, "analysis_results"), parsed))
+        return written
+    if not isinstance(parsed, dict):
+        if answer_content is not None:
+            written.append(os.path.join(out_dir, "answer.txt"))
+            with open(written[-1], "w", encoding="utf-8") as fh:
+                fh.write(str(answer_content))
+        return written
+
+    sections = classify_result(parsed)
+    for name, table in sections["tables"].items():
+        written.append(_write_table(os.path.join(out_dir, name), table))
+    for name, mime, payload in sections["media"] + sections["images"]:
+        ext = mimetypes.guess_extension(mime) or ".bin"
+        path = os.path.join(out_dir, name + ext)
+        try:
+            data = b64decode_value(payload)
+        except (binascii.Error, ValueError):
+            continue
+        with open(path, "wb") as fh:
+            fh.write(data)
+        written.append(path)
+    return written
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    global API_BASE_URL, TRACE_FILE
+    import requests
+
+    parser = argparse.ArgumentParser(
+        description="Submit files and questions to the Grasper API and save the results.")
+    parser.add_argument("files", nargs="*", help="data files to analyze")
+    questions = parser.add_mutually_exclusive_group(required=True)
+    questions.add_argument("-q", "--questions", help="questions text")
+    questions.add_argument(
+        "-f", "--questions-file",
+        help="questions file; several blocks separated by '---' lines run one after another")
+    parser.add_argument("-o", "--out", default="grasper-results", help="output directory")
+    parser.add_argument("--api-root", default=API_BASE_URL, help="backend base URL")
+    parser.add_argument("--timeout", type=int, default=300, help="request timeout in seconds")
+    parser.add_argument(
+        "--compress", choices=("gzip", "zstd"), help="compress text-like uploads")
+    parser.add_argument(
+        "--cache-dir", help="reuse results for identical files and questions from this directory")
+    parser.add_argument("--trace", help="append per-phase timing spans to this JSONL file")
+    args = parser.parse_args(argv)
+
+    API_BASE_URL = args.api_root.rstrip("/")
+    TRACE_FILE = args.trace or TRACE_FILE
+    if args.questions is not None:
+        blocks = [args.questions]
+    else:
+        with open(args.questions_file, encoding="utf-8") as fh:
+            blocks = split_question_blocks(fh.read())
+    uploads = [LocalFile(path) for path in args.files]
+    result_cache = ResultCache(disk_dir=args.cache_dir) if args.cache_dir else None
+
+    state = {"progress": 0, "message": ""}
+
+    def report(**update) -> None:
+        state.update({k: v for k, v in update.items() if k in state})
+        if sys.stderr.isatty():
+            print(f"\r[{state['progress']:3d}%] {state['message'][:70]:<70}",
+                  end="", file=sys.stderr)
+        elif "message" in update:
+            print(f"[{state['progress']:3d}%] {state['message']}", file=sys.stderr)
+
+    failures = 0
+    for i, block in enumerate(blocks):
+        out_dir = args.out if len(blocks) == 1 else os.path.join(args.out, f"{i + 1:03d}")
+        files = make_multipart_files(uploads, block, False)
+        key = result_cache_key(files) if result_cache else None
+        result = result_cache.get(key) if result_cache else None
+        start = time.perf_counter()
+        trace = Trace("cli")
+        try:
+            if result is None:
+                with trace.span("request"):
+                    result = analyze(files, args.timeout, args.compress, on_progress=report)
+                if result_cache:
+                    result_cache.put(key, result)
+        except (AnalysisError, requests.exceptions.RequestException) as e:
+            print(f"\nAnalysis {i + 1} failed: {e}", file=sys.stderr)
+            failures += 1
+            continue
+        written = write_result(result, out_dir)
+        print(
+            f"\nAnalysis {i + 1}/{len(blocks)} done in {time.perf_counter() - start:.1f}s: "
+            f"{len(written)} files in {out_dir}",
+            file=sys.stderr,
+        )
+        phases = [s for s in trace.spans if s["parent_id"] is not None]
+        if phases:
+            print("  " + ", ".join(f"{s['name']} {s['duration']:.2f}s" for s in phases),
+                  file=sys.stderr)
+    for upload in uploads:
+        upload.close()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
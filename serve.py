@@ -0,0 +1,30 @@
+"""Start the Streamlit app with warm-up running from process start.
+
+Same as ``streamlit run frontend.py`` (extra arguments are passed through),
+except that the lazily imported dependencies start loading while the server
+boots rather than after the first session connects, and the ``/metrics``
+server (with its ``/ready`` probe) is up before the first request:
+
+    python serve.py --server.port 8501
+"""
+
+import os
+import sys
+
+from grasper_client import METRICS_PORT, start_metrics_server, start_warmup
+
+
+def main() -> None:
+    start_warmup()
+    if METRICS_PORT:
+        start_metrics_server(int(METRICS_PORT))
+
+    from streamlit.web import cli
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "frontend.py")
+    sys.argv = ["streamlit", "run", script, *sys.argv[1:]]
+    sys.exit(cli.main())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""The api/frontend.py gateway against a local stub backend."""
+
+import importlib.util
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import pytest
+
+import grasper_client as client
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _load_gateway():
+    # api/frontend.py shares its module name with the Streamlit app
+    spec = importlib.util.spec_from_file_location(
+        "grasper_gateway", os.path.join(REPO_ROOT, "api", "frontend.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _serve(handler_class) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class _Upload(BytesIO):
+    def __init__(self, name: str, data: bytes):
+        super().__init__(data)
+        self.name, self.type, self.size = name, "text/csv", len(data)
+
+
+@pytest.fixture
+def gateway(tmp_path, monkeypatch):
+    """Gateway in front of a stub that answers with one large-string result."""
+    result = {"answers": {"answer": "x" * (client.SPILL_MIN_CHARS + 1024)}}
+    body = json.dumps(result).encode("utf-8")
+    calls = []
+
+    class Upstream(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            calls.append(self.path)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    upstream = _serve(Upstream)
+    module = _load_gateway()
+    monkeypatch.setattr(module, "UPSTREAM_URL", f"http://127.0.0.1:{upstream.server_port}")
+    monkeypatch.setattr(module, "_cache", client.ResultCache(disk_dir=str(tmp_path)))
+    front = _serve(module.handler)
+    yield module, f"http://127.0.0.1:{front.server_port}", result, calls
+    front.shutdown()
+    upstream.shutdown()
+
+
+def _analyze(url: str):
+    files = client.make_multipart_files(
+        [_Upload("sales.csv", b"city,amount\nOslo,3\n")], "Total amount?", False)
+    body = client.MultipartStream(files)
+    return client.get_http_session().post(
+        url + "/api/analyze_data", data=body,
+        headers={"Content-Type": body.content_type}, timeout=30)
+
+
+def test_cached_large_string_result_from_disk(gateway, tmp_path):
+    module, url, result, calls = gateway
+
+    first = _analyze(url)
+    assert first.headers["X-Cache"] == "MISS"
+    assert first.json() == result
+
+    # A fresh cache over the same directory only has the disk tier, whose
+    # reads spill the long answer to a temp file
+    module._cache = client.ResultCache(disk_dir=str(tmp_path))
+    second = _analyze(url)
+    assert second.status_code == 200
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.json() == result
+    assert len(calls) == 1
@@ -0,0 +1,50 @@
+"""CSV to Parquet conversion of uploads."""
+
+import logging
+import uuid
+from io import BytesIO
+
+import pyarrow.parquet as pq
+import pytest
+
+
+class _Upload(BytesIO):
+    def __init__(self, name: str, data: bytes):
+        super().__init__(data)
+        self.name, self.type, self.size = name, "text/csv", len(data)
+        self.file_id = str(uuid.uuid4())
+
+
+@pytest.fixture(scope="module")
+def frontend():
+    # Importing the app runs it in Streamlit bare mode, which warns on every st.* call
+    logging.disable(logging.WARNING)
+    import frontend
+
+    yield frontend
+    logging.disable(logging.NOTSET)
+
+
+def test_csv_whose_column_changes_type_after_first_block(frontend):
+    rows = b"".join(b"%d,%d\n" % (i, i % 7) for i in range(200_000))
+    upload = _Upload("codes.csv", b"code,qty\n" + rows + b"12A,5\n")
+
+    converted = frontend.csv_to_parquet(upload)
+    table = pq.read_table(converted.path)
+    converted.close()
+
+    assert table.num_rows == 200_001
+    assert table.column("code")[-1].as_py() == "12A"
+    assert upload.tell() == 0
+
+
+def test_unconvertible_csv_is_sent_as_csv(frontend):
+    upload = _Upload("ragged.csv", b"a,b\n1,2\n3,4,5\n")
+    files = {
+        "questions.txt": ("questions.txt", b"Sum of a?", "text/plain"),
+        "ragged.csv": ("ragged.csv", upload, "text/csv"),
+    }
+
+    out = frontend.convert_csv_parts(files)
+
+    assert out == files